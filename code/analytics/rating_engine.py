@@ -0,0 +1,228 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from ..base_code.base_classes import get_project_root
+from ..base_code.graph_sinks import SET_RIKISHI_RATINGS
+from ..base_code.profiling import StageProfiler
+from ..node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+
+# Fusen (walkover) results say nothing about strength, so they are not rated
+RATED_RESULTS = ["win", "loss"]
+
+
+class EloRatingEngine:
+    """Chronological Elo ratings over bouts, held in NumPy arrays.
+
+    Rikishi ids are mapped to dense positions in ``ratings`` once per batch,
+    so the update loop never touches a dict. Bouts are replayed in order of
+    (bashoId, Fight_Number); a rikishi fights at most once per fight number,
+    so every bout of a round is updated at once with fancy indexing.
+    """
+
+    def __init__(self, k_factor=32.0, initial_rating=1500.0):
+        self.k_factor = k_factor
+        self.initial_rating = initial_rating
+        self.rikishi_ids = pd.Index([], dtype="int64")
+        self.ratings = np.empty(0, dtype="float64")
+        # Rating of every rikishi who fought in a basho, as of its last day
+        self.history = pd.DataFrame(
+            {
+                "rikishiId": pd.Series(dtype="int64"),
+                "bashoId": pd.Series(dtype="int64"),
+                "elo": pd.Series(dtype="float64"),
+            }
+        )
+        # Ratings before the latest basho seen, so it can be replayed if it
+        # was still running when it was downloaded
+        self.checkpoint_ratings = self.ratings.copy()
+        self.checkpoint_basho_id = None
+
+    def dense_ids(self, rikishi_ids):
+        rikishi_ids = np.asarray(rikishi_ids, dtype="int64")
+        new_ids = pd.Index(pd.unique(rikishi_ids)).difference(self.rikishi_ids)
+        if len(new_ids):
+            self.rikishi_ids = self.rikishi_ids.append(new_ids)
+            self.ratings = np.concatenate(
+                [self.ratings, np.full(len(new_ids), self.initial_rating)]
+            )
+        return self.rikishi_ids.get_indexer(rikishi_ids)
+
+    def update(self, bouts):
+        """Replay ``bouts`` (matched rows from ``extract_bouts``) in order."""
+        bouts = bouts[bouts["result_rikishi1"].isin(RATED_RESULTS)]
+        if bouts.empty:
+            return 0
+        basho_ids = bouts["bashoId"].astype("int64").to_numpy()
+        fight_numbers = bouts["Fight_Number"].astype("int64").to_numpy()
+        order = np.lexsort((fight_numbers, basho_ids))
+        basho_ids = basho_ids[order]
+        fight_numbers = fight_numbers[order]
+        first = self.dense_ids(bouts["RikishiID_rikishi1"].to_numpy()[order])
+        second = self.dense_ids(bouts["RikishiID_rikishi2"].to_numpy()[order])
+        scores = (bouts["result_rikishi1"].to_numpy()[order] == "win").astype("float64")
+
+        round_starts = np.flatnonzero(
+            np.r_[
+                True, (basho_ids[1:] != basho_ids[:-1]) | (np.diff(fight_numbers) != 0)
+            ]
+        )
+        round_ends = np.r_[round_starts[1:], len(order)]
+        history = []
+        for start, end in zip(round_starts, round_ends):
+            if start == 0 or basho_ids[start] != basho_ids[start - 1]:
+                self.checkpoint_ratings = self.ratings.copy()
+                self.checkpoint_basho_id = basho_ids[start]
+            a = first[start:end]
+            b = second[start:end]
+            expected = 1.0 / (
+                1.0 + 10.0 ** ((self.ratings[b] - self.ratings[a]) / 400.0)
+            )
+            delta = self.k_factor * (scores[start:end] - expected)
+            self.ratings[a] += delta
+            self.ratings[b] -= delta
+            if end == len(order) or basho_ids[end] != basho_ids[start]:
+                basho_start = np.searchsorted(basho_ids, basho_ids[start])
+                fought = np.unique(
+                    np.concatenate([first[basho_start:end], second[basho_start:end]])
+                )
+                history.append(
+                    pd.DataFrame(
+                        {
+                            "rikishiId": self.rikishi_ids[fought].to_numpy(),
+                            "bashoId": basho_ids[start],
+                            "elo": self.ratings[fought],
+                        }
+                    )
+                )
+        self.history = pd.concat([self.history, *history], ignore_index=True)
+        return len(order)
+
+    def rewind_to_checkpoint(self):
+        """Drop the latest basho so it can be replayed with its full record."""
+        if self.checkpoint_basho_id is None:
+            return None
+        self.ratings[: len(self.checkpoint_ratings)] = self.checkpoint_ratings
+        self.ratings[len(self.checkpoint_ratings) :] = self.initial_rating
+        self.history = self.history[self.history["bashoId"] < self.checkpoint_basho_id]
+        return str(self.checkpoint_basho_id)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            rikishi_ids=self.rikishi_ids.to_numpy(),
+            ratings=self.ratings,
+            checkpoint_ratings=self.checkpoint_ratings,
+            checkpoint_basho_id=np.array(
+                -1 if self.checkpoint_basho_id is None else self.checkpoint_basho_id
+            ),
+            history_rikishi_ids=self.history["rikishiId"].to_numpy(),
+            history_basho_ids=self.history["bashoId"].to_numpy(),
+            history_elo=self.history["elo"].to_numpy(),
+            parameters=np.array([self.k_factor, self.initial_rating]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            engine = cls(*state["parameters"])
+            engine.rikishi_ids = pd.Index(state["rikishi_ids"], dtype="int64")
+            engine.ratings = state["ratings"]
+            engine.checkpoint_ratings = state["checkpoint_ratings"]
+            checkpoint_basho_id = int(state["checkpoint_basho_id"])
+            if checkpoint_basho_id >= 0:
+                engine.checkpoint_basho_id = checkpoint_basho_id
+            engine.history = pd.DataFrame(
+                {
+                    "rikishiId": state["history_rikishi_ids"],
+                    "bashoId": state["history_basho_ids"],
+                    "elo": state["history_elo"],
+                }
+            )
+        return engine
+
+    def rating_rows(self, rikishi_ids=None):
+        """One row per rikishi with the current rating and its per-basho history."""
+        history = self.history
+        if rikishi_ids is not None:
+            history = history[history["rikishiId"].isin(rikishi_ids)]
+        if history.empty:
+            return []
+        history = history.sort_values(["rikishiId", "bashoId"])
+        rows = history.groupby("rikishiId", as_index=False).agg(
+            eloHistory=("elo", list), eloBashoIds=("bashoId", list)
+        )
+        rating_rows = []
+        for row in rows.to_dict("records"):
+            elo_history = [round(float(elo), 1) for elo in row["eloHistory"]]
+            rating_rows.append(
+                {
+                    "rikishiId": int(row["rikishiId"]),
+                    # Ratings only move in bashos a rikishi fought in
+                    "elo": elo_history[-1],
+                    "eloHistory": elo_history,
+                    "eloBashoIds": [str(basho_id) for basho_id in row["eloBashoIds"]],
+                }
+            )
+        return rating_rows
+
+
+# Subclasses the bout builder to reuse its bout extraction
+class AuraDBLoaderRikishiRatings(AuraDBLoaderBoutNodes):
+    def __init__(self):
+        super().__init__()
+        self.state_path = str(get_project_root() / "state" / "elo_ratings.npz")
+
+    def create_rating_properties(self, rows, batch_size=1000):
+        query = """UNWIND $rows AS row
+                    MATCH (r:Rikishi {rikishiID: row.rikishiId})
+                    SET r.elo = row.elo, r.eloHistory = row.eloHistory,
+                        r.eloBashoIds = row.eloBashoIds"""
+        return self.write_batches(
+            query, rows, batch_size=batch_size, operation=SET_RIKISHI_RATINGS
+        )
+
+    def run_rating_engine(self, folder_path, full_rebuild=False):
+        engine = EloRatingEngine()
+        since_basho_id = None
+        if not full_rebuild and os.path.exists(self.state_path):
+            engine = EloRatingEngine.load(self.state_path)
+            since_basho_id = engine.rewind_to_checkpoint()
+        bouts = self.extract_matched_bouts(folder_path, since_basho_id)
+        if bouts.empty:
+            self.log.info("No bouts to rate")
+            return 0
+        with self.metrics.timer("rating_update_seconds"):
+            rated = engine.update(bouts)
+        self.metrics.inc("bouts_rated", rated)
+        # Only rikishi who fought in the replayed bashos have a new history
+        changed_ids = pd.unique(
+            pd.concat([bouts["RikishiID_rikishi1"], bouts["RikishiID_rikishi2"]])
+        )
+        rows = engine.rating_rows(changed_ids.astype("int64"))
+        self.log.info("Writing ratings for %s rikishi", len(rows))
+        self.create_rating_properties(rows)
+        self.flush()
+        if self.keeps_incremental_state():
+            engine.save(self.state_path)
+        return len(rows)
+
+
+if __name__ == "__main__":
+    loader = AuraDBLoaderRikishiRatings()
+    try:
+        # Get the most recent directory
+        recent_dir = loader.get_most_recent_directory(loader.data_path)
+        if recent_dir:
+            basho_folder_path = os.path.join(loader.data_path, recent_dir, "basho")
+            with StageProfiler("rating_engine", snapshot=recent_dir):
+                loader.run_rating_engine(
+                    basho_folder_path, full_rebuild="--full" in sys.argv
+                )
+        else:
+            print("No recent directory found")
+    finally:
+        loader.close()
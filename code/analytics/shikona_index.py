@@ -0,0 +1,189 @@
+import argparse
+import heapq
+import json
+import os
+import unicodedata
+from collections import Counter
+
+import textdistance
+
+from ..base_code import codec
+from ..base_code.base_classes import get_data_root
+from ..base_code.snapshot_store import SHARD_DIRNAME, open_documents
+
+INDEX_FILENAME = "shikona_index.json"
+INDEX_VERSION = 2
+NGRAM = 3
+# external=False skips textdistance probing for optional C libraries on every call
+SCORER = textdistance.JaroWinkler(external=False)
+
+
+def normalise_shikona(name):
+    # "Ōnosato" and "Onosato " should meet on the same key
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.lower().split())
+
+
+def ngrams(name, n=NGRAM):
+    padded = f"{' ' * (n - 1)}{name} "
+    return {padded[i : i + n] for i in range(len(padded) - n + 1)}
+
+
+def source_fingerprint(snapshot_dir):
+    """File count and newest mtime of the documents the index is built from.
+
+    A re-download or a pack rewrites these, so a saved index that doesn't
+    match them is rebuilt.
+    """
+    files, newest = 0, 0
+    for kind in ("rikishi", "basho", SHARD_DIRNAME):
+        for root, _, filenames in os.walk(os.path.join(snapshot_dir, kind)):
+            for filename in filenames:
+                files += 1
+                newest = max(newest, os.stat(os.path.join(root, filename)).st_mtime_ns)
+    return {"files": files, "mtime_ns": newest}
+
+
+class ShikonaIndex:
+    """Fuzzy shikona -> rikishi id lookups over a trigram inverted index.
+
+    Each lookup shortlists the names sharing the most trigrams with the
+    query (Jaccard on trigram sets) and only scores that shortlist with
+    textdistance, instead of comparing against every known name.
+    """
+
+    def __init__(self, names=None, rikishi_ids=None, source=None):
+        self.names = names or []
+        self.rikishi_ids = rikishi_ids or []
+        # source_fingerprint of the snapshot the index was built from
+        self.source = source
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.postings = {}
+        self.ngram_counts = []
+        for position, name in enumerate(self.names):
+            grams = ngrams(name)
+            self.ngram_counts.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_dir):
+        """Collect every (shikona, id) pair from the rikishi and basho files."""
+        source = source_fingerprint(snapshot_dir)
+        pairs = {}
+
+        def add(name, rikishi_id):
+            if name and rikishi_id is not None:
+                pairs.setdefault(normalise_shikona(name), set()).add(int(rikishi_id))
+
+        for _, body in open_documents(os.path.join(snapshot_dir, "rikishi")):
+            rikishi = codec.decode_rikishi(body)
+            add(rikishi.get("shikonaEn"), rikishi.get("id"))
+        for _, body in open_documents(os.path.join(snapshot_dir, "basho")):
+            banzuke = codec.decode_banzuke(body)
+            for _, entries in banzuke.sides():
+                for entry in entries:
+                    add(entry.shikonaEn, entry.rikishiID)
+                    for bout in entry.record or ():
+                        add(bout.opponentShikonaEn, bout.opponentID)
+        names = sorted(pairs)
+        return cls(names, [sorted(pairs[name]) for name in names], source)
+
+    @classmethod
+    def for_snapshot(cls, snapshot_dir, rebuild=False):
+        """Load the index saved next to the snapshot, building it if needed.
+
+        A saved index built from different files than the snapshot now holds
+        (re-downloaded, packed) is rebuilt.
+        """
+        path = os.path.join(snapshot_dir, INDEX_FILENAME)
+        if not rebuild and os.path.exists(path):
+            index = cls.load(path, source=source_fingerprint(snapshot_dir))
+            if index is not None:
+                return index
+        index = cls.from_snapshot(snapshot_dir)
+        index.save(path)
+        return index
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "source": self.source,
+                    "names": self.names,
+                    "rikishi_ids": self.rikishi_ids,
+                },
+                file,
+            )
+
+    @classmethod
+    def load(cls, path, source=None):
+        """The saved index, or None if it is stale; ``source`` is checked if given."""
+        with open(path) as file:
+            data = json.load(file)
+        if data.get("version") != INDEX_VERSION:
+            return None
+        if source is not None and data.get("source") != source:
+            return None
+        return cls(data["names"], data["rikishi_ids"], data.get("source"))
+
+    def candidates(self, query, limit):
+        grams = ngrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        total = len(grams)
+        counts = self.ngram_counts
+        return heapq.nlargest(
+            limit,
+            shared,
+            key=lambda position: (
+                shared[position] / (total + counts[position] - shared[position])
+            ),
+        )
+
+    def search(self, name, limit=5, shortlist=20):
+        """Best matches as (shikona, score, rikishi ids), highest score first."""
+        query = normalise_shikona(name)
+        if not query:
+            return []
+        exact = self.positions.get(query)
+        if exact is not None and limit == 1:
+            return [(query, 1.0, self.rikishi_ids[exact])]
+        scored = [
+            (
+                self.names[position],
+                SCORER.normalized_similarity(query, self.names[position]),
+                self.rikishi_ids[position],
+            )
+            for position in self.candidates(query, shortlist)
+        ]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:limit]
+
+    def resolve(self, name, min_score=0.85):
+        """Rikishi ids for the best match scoring at least ``min_score``."""
+        matches = self.search(name, limit=1)
+        if matches and matches[0][1] >= min_score:
+            return matches[0][2]
+        return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fuzzy shikona lookups")
+    parser.add_argument("names", nargs="+")
+    parser.add_argument("--snapshot", help="YYYYMM directory under data/")
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+    data_path = str(get_data_root())
+    snapshot = args.snapshot or max(
+        d for d in os.listdir(data_path) if d.isdigit() and len(d) == 6
+    )
+    index = ShikonaIndex.for_snapshot(
+        os.path.join(data_path, snapshot), rebuild=args.rebuild
+    )
+    for name in args.names:
+        for shikona, score, rikishi_ids in index.search(name):
+            print(f"{name}\t{shikona}\t{score:.3f}\t{rikishi_ids}")
@@ -1,18 +1,64 @@
-import json
-import logging
+import asyncio
+import functools
 import os
 import re
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_futures
 from datetime import datetime
 from pathlib import Path
 
 import requests  # type: ignore
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase, GraphDatabase
 from requests.adapters import HTTPAdapter  # type: ignore
 
+from . import codec
+from .graph_sinks import (
+    BUMP_LOAD_VERSION,
+    AsyncNeo4jGraphSink,
+    InMemoryGraphSink,
+    Neo4jGraphSink,
+)
+from .http_cache import DEFAULT_TTL, NEGATIVE_TTL, CachedResponse, ResponseCache
+from .log_config import Progress, configure_logging, stage_logger
+from .metrics import StageMetrics
+from .snapshot_store import (
+    ShardReader,
+    ShardWriter,
+    document_key,
+    is_packed,
+    snapshot_format,
+)
+from .validation import IngestValidator, sample_rate
+from .write_spool import SpoolGraphSink, SpoolWriter, default_spool_dir
+
+# A single counter node every loader bumps after writing, so readers can
+# tell when their cached answers are stale
+BUMP_LOAD_VERSION_QUERY = (
+    "MERGE (v:LoadVersion {name: 'graph'}) "
+    "SET v.version = coalesce(v.version, 0) + 1, v.updatedAt = datetime() "
+    "RETURN v.version"
+)
+LOAD_VERSION_QUERY = "MATCH (v:LoadVersion {name: 'graph'}) RETURN v.version AS version"
+
+
+# Set by deployments (or the sumo-graph --root / --data-dir options) so the
+# root is not rediscovered by walking the filesystem
+PROJECT_ROOT_ENV_VAR = "SUMO_GRAPH_ROOT"
+DATA_DIR_ENV_VAR = "SUMO_DATA_DIR"
+
 
 def get_project_root() -> Path:
+    """$SUMO_GRAPH_ROOT, else the directory holding .git (looked up once)."""
+    configured = os.environ.get(PROJECT_ROOT_ENV_VAR)
+    if configured:
+        return Path(configured)
+    return _find_project_root()
+
+
+@functools.cache
+def _find_project_root() -> Path:
     """Find the project root by looking for the .git directory."""
     current_path = Path(__file__).resolve()
     for parent in [current_path] + list(current_path.parents):
@@ -22,11 +68,96 @@ def get_project_root() -> Path:
     return current_path.parent.parent.parent
 
 
+def get_data_root() -> Path:
+    """$SUMO_DATA_DIR, else data/ under the project root."""
+    configured = os.environ.get(DATA_DIR_ENV_VAR)
+    if configured:
+        return Path(configured)
+    return get_project_root() / "data"
+
+
+# Banzuke divisions, top first. Makuuchi files sit directly in basho/, the
+# layout every snapshot already has; the others go in basho/<Division>/
+DIVISIONS = ("Makuuchi", "Juryo", "Makushita", "Sandanme", "Jonidan", "Jonokuchi")
+DIVISIONS_ENV_VAR = "SUMO_DIVISIONS"
+
+
+def selected_divisions(divisions=None):
+    """``divisions``, else $SUMO_DIVISIONS (comma separated or "all"), else Makuuchi.
+
+    Returned in DIVISIONS order.
+    """
+    if divisions is None:
+        configured = os.environ.get(DIVISIONS_ENV_VAR, "").strip()
+        if configured == "all":
+            return DIVISIONS
+        divisions = [d.strip() for d in configured.split(",") if d.strip()]
+    divisions = set(divisions or ("Makuuchi",))
+    unknown = divisions - set(DIVISIONS)
+    if unknown:
+        raise ValueError(f"Unknown divisions: {', '.join(sorted(unknown))}")
+    return tuple(d for d in DIVISIONS if d in divisions)
+
+
+def division_dir(basho_dir, division):
+    if division == "Makuuchi":
+        return basho_dir
+    return os.path.join(basho_dir, division)
+
+
+def basho_files(basho_dir, divisions=None, unique=False):
+    """(bashoId, path) for every basho file of the chosen divisions.
+
+    Sorted by bashoId, then division. With ``unique``, only the top
+    division's file of each basho, for stages that work per basho.
+    """
+    files = []
+    for division in selected_divisions(divisions):
+        folder = division_dir(basho_dir, division)
+        if division != "Makuuchi" and not os.path.isdir(folder):
+            continue
+        for filename in os.listdir(folder):
+            if filename.endswith(".json"):
+                files.append(
+                    (filename.split(".json")[0], os.path.join(folder, filename))
+                )
+    files.sort(key=lambda file: file[0])
+    if unique:
+        seen = set()
+        files = [f for f in files if not (f[0] in seen or seen.add(f[0]))]
+    return files
+
+
+def basho_keys(keys, divisions=None, unique=False):
+    """basho_files for a packed snapshot: (bashoId, key) from its document keys.
+
+    Keys are the per-file names, ``202509`` for Makuuchi and
+    ``Juryo/202509`` for the others.
+    """
+    divisions = selected_divisions(divisions)
+    entries = []
+    for key in keys:
+        division, _, basho = key.rpartition("/")
+        division = division or "Makuuchi"
+        if division in divisions:
+            entries.append((basho, divisions.index(division), key))
+    entries.sort()
+    files = [(basho, key) for basho, _, key in entries]
+    if unique:
+        seen = set()
+        files = [f for f in files if not (f[0] in seen or seen.add(f[0]))]
+    return files
+
+
 class SumoApiQuery:
+    # Schema (see validation) every saved document must match; None skips it
+    schema = None
+
     def __init__(self, iters=None, pool_size=20):
         project_root = get_project_root()
         self.log_file_name = str(project_root / "sumo_api_query_basho.log")
         self.iters = iters
+        self.pool_size = pool_size
         self.base_url = "https://www.sumo-api.com/api/basho/{}/banzuke/Makuuchi"
         self.session = requests.Session()
         adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
@@ -34,49 +165,195 @@ class SumoApiQuery:
         self.session.mount("http://", adapter)
         # Create a directory named with the current timestamp
         self.now = datetime.now().strftime("%Y%m")
-        self.output_dir = str(project_root / "data" / self.now / "basho")
-        self.base_directory = str(project_root / "data")
+        data_root = get_data_root()
+        self.output_dir = str(data_root / self.now / "basho")
+        self.base_directory = str(data_root)
+        self.metrics = StageMetrics(type(self).__name__)
+        self.log = stage_logger(type(self).__name__)
+        self.metrics_dir = os.environ.get(
+            "SUMO_METRICS_DIR", str(project_root / "metrics")
+        )
+        # Opt-in (SUMO_HTTP_CACHE), so a plain run always sees fresh data
+        self.response_cache = ResponseCache.from_environment(
+            str(project_root / "state" / "http_cache.sqlite")
+        )
+        # SUMO_SNAPSHOT_FORMAT=shards packs documents instead of one file each
+        self.shard_writer = None
+        # SUMO_VALIDATE_SAMPLE=0 turns ingest validation off
+        self.validation_sample_rate = sample_rate()
+        self.validator = None
 
     def query_endpoint(self, iter_val):
-        url = self.base_url.format(iter_val)
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
-        logging.info(f"Making API call for: {iter_val}")
+        return self.fetch(
+            iter_val,
+            self.base_url.format(iter_val),
+            os.path.join(self.output_dir, f"{iter_val}.json"),
+        )
+
+    def fetch(self, iter_val, url, output_path):
+        """GET ``url`` and save the body to ``output_path`` if it is valid JSON."""
+        fields = self.log_fields(iter_val)
+        self.log.debug("Making API call", extra=fields)
         try:
-            response = self.session.get(url)
-            # Check if the response is empty
+            response = self.get(url)
+            # Error statuses raise first, so an empty 429/5xx body is an
+            # outage and only an empty 2xx means there is nothing there
+            response.raise_for_status()
             if not response.content.strip():
-                logging.error("Empty response received")
+                self.log.error("Empty response received", extra=fields)
+                self.cache_response(iter_val, url, response, None)
                 return "Empty response received"
-            response.raise_for_status()
-            response_data = response.json()
+            with self.metrics.timer("json_parse_seconds"):
+                response_data = codec.loads(response.content)
             # Check for specific error in response
             if response_data.get("error") == "INVALID_RIKISHI_ID":
-                logging.error("Invalid rikishi id")
+                self.cache_response(iter_val, url, response, response_data)
+                self.log.error("Invalid rikishi id", extra=fields)
                 return "Invalid rikishi id"  # Stop execution for this iteration
-            # Save the file in the new directory
-            with open(os.path.join(self.output_dir, f"{iter_val}.json"), "w") as file:
-                json.dump(response_data, file)
-            logging.info(f"API call successful for: {iter_val}")
+            # Malformed payloads go to quarantine, not the snapshot or the cache
+            if not self.validate_document(output_path, response_data, response.content):
+                return "Invalid payload"
+            self.cache_response(iter_val, url, response, response_data)
+            # The body already decoded cleanly, so save it as-is rather than
+            # re-encoding it
+            self.save_document(output_path, response.content)
+            self.metrics.inc("documents_saved")
+            self.handle_response(iter_val, response_data)
+            self.log.debug("API call successful", extra=fields)
         except requests.RequestException as e:
-            logging.error(f"Error fetching data for {iter_val}: {e}")
+            self.metrics.inc("request_errors")
+            self.log.error("Error fetching data: %s", e, extra=fields)
         except Exception as e:
-            logging.error(f"Error fetching data for {iter_val}: {e}")
+            self.metrics.inc("request_errors")
+            self.log.error("Error fetching data: %s", e, extra=fields)
+
+    def log_fields(self, iter_val):
+        """Structured log fields naming what ``iter_val`` is (see log_config)."""
+        return {"item": str(iter_val)}
+
+    def handle_response(self, iter_val, response_data):
+        """Called with each saved document; subclasses index it on the way in."""
+
+    def ingest_validator(self):
+        if self.schema is None or not self.validation_sample_rate:
+            return None
+        if self.validator is None:
+            snapshot_dir, kind = os.path.split(os.path.normpath(self.output_dir))
+            self.validator = IngestValidator(
+                self.schema,
+                os.path.join(snapshot_dir, "quarantine", kind),
+                self.metrics,
+                self.validation_sample_rate,
+            )
+        return self.validator
+
+    def validate_document(self, output_path, response_data, body):
+        validator = self.ingest_validator()
+        if validator is None:
+            return True
+        key = document_key(self.output_dir, output_path)
+        return validator.check(key, response_data, body)
+
+    def save_document(self, output_path, body):
+        if snapshot_format() == "shards":
+            self.document_writer().add(document_key(self.output_dir, output_path), body)
+            return
+        # Save the file in the new directory
+        with open(output_path, "wb") as file:
+            file.write(body)
+
+    def document_writer(self):
+        # Created before the download threads start (see run_queries)
+        if self.shard_writer is None:
+            self.shard_writer = ShardWriter(self.output_dir)
+        return self.shard_writer
+
+    def close_document_writer(self):
+        if self.shard_writer is None:
+            return None
+        path = self.shard_writer.close()
+        self.shard_writer = None
+        return path
+
+    def get(self, url):
+        """GET ``url``, or its cached body if the response cache holds one."""
+        if self.response_cache is not None:
+            cached = self.response_cache.get(url)
+            if cached is not None:
+                self.metrics.inc("cache_hits")
+                return cached
+            self.metrics.inc("cache_misses")
+        with self.metrics.timer("request_latency_seconds"):
+            response = self.session.get(url)
+        self.metrics.inc("requests")
+        self.metrics.inc("bytes_downloaded", len(response.content))
+        return response
+
+    def cache_response(self, iter_val, url, response, response_data):
+        if self.response_cache is None or isinstance(response, CachedResponse):
+            return
+        # An empty body with an error status is an outage, not an answer
+        if not response.ok:
+            return
+        ttl = self.cache_ttl(iter_val, response_data)
+        if ttl:
+            self.response_cache.put(url, response.content, ttl)
+
+    def cache_ttl(self, iter_val, response_data):
+        """Seconds to cache a response; ``response_data`` is None when empty.
+
+        Subclasses know which of their responses can still change.
+        """
+        if not response_data or "error" in response_data:
+            return NEGATIVE_TTL
+        return DEFAULT_TTL
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            filename=self.log_file_name,
-            filemode="w",
-        )
+        # JSON lines, written by a background thread (see log_config)
+        configure_logging(self.log_file_name)
 
     def run_queries(self):
         self.setup_logging()
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
-        with ThreadPoolExecutor() as executor:
-            executor.map(self.query_endpoint, self.iters)
+        if snapshot_format() == "shards":
+            self.document_writer()
+        validator = self.ingest_validator()
+        # One worker per pooled connection, so no request waits for a socket
+        iters = list(self.iters or ())
+        with (
+            ThreadPoolExecutor(max_workers=self.pool_size) as executor,
+            Progress(self.log, "download", total=len(iters)) as progress,
+        ):
+            futures = [executor.submit(self.query_endpoint, item) for item in iters]
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    self.metrics.inc("request_errors")
+                    self.log.error("Query failed: %s", error)
+                progress.update()
+        self.close_document_writer()
+        if validator is not None:
+            summary = validator.summary()
+            self.log.info(
+                "Validated %s documents (%s microseconds each), quarantined %s",
+                summary["validated"],
+                summary["mean_microseconds"],
+                summary["quarantined"],
+            )
+        if self.response_cache is not None:
+            self.response_cache.prune()
+        self.write_metrics_report()
+
+    def write_metrics_report(self):
+        if self.metrics.is_empty():
+            return None
+        try:
+            return self.metrics.write_report(self.metrics_dir)
+        except OSError as e:
+            self.log.error("Could not write metrics report: %s", e)
 
 
 class AuraDBLoader:
@@ -86,12 +363,141 @@ class AuraDBLoader:
         self.user = os.environ.get("username")
         self.password = os.environ.get("password")
         project_root = get_project_root()
-        self.data_path = str(project_root / "data")
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        self.data_path = str(get_data_root())
+        self.metrics = StageMetrics(type(self).__name__)
+        self.log = stage_logger(type(self).__name__)
+        # Progress events go to stderr unless a log file is already set up
+        configure_logging()
+        self.metrics_dir = os.environ.get(
+            "SUMO_METRICS_DIR", str(project_root / "metrics")
+        )
+        # Banzuke divisions the builders read (SUMO_DIVISIONS, default Makuuchi)
+        self.divisions = selected_divisions()
+        # SUMO_GRAPH_SINK=memory swaps Aura for an in-memory graph (dry runs,
+        # tests); spool queues the writes on disk for the drainer (write_spool)
+        sink_setting = os.environ.get("SUMO_GRAPH_SINK", "neo4j")
+        if sink_setting == "memory":
+            self.driver = None
+            self.sink = InMemoryGraphSink()
+        elif sink_setting == "spool":
+            self.driver = None
+            self.sink = SpoolGraphSink(SpoolWriter(default_spool_dir()), self.metrics)
+        else:
+            self.driver = GraphDatabase.driver(
+                self.uri, auth=(self.user, self.password)
+            )
+            self.sink = Neo4jGraphSink(self.driver, self.metrics)
 
     def close(self):
-        if self.driver:
-            self.driver.close()
+        try:
+            self.finish_load()
+        finally:
+            self.sink.close()
+            if self.driver:
+                self.driver.close()
+            self.write_metrics_report()
+
+    def finish_load(self):
+        # Any write makes cached reads stale (see read_api)
+        if self.metrics.counters.get("queries"):
+            self.bump_load_version()
+
+    def bump_load_version(self):
+        record = self.run_query(BUMP_LOAD_VERSION_QUERY, operation=BUMP_LOAD_VERSION)
+        return record[0] if record else None
+
+    def flush(self):
+        """Wait for writes still in flight; raises if any of them failed."""
+        # Writes here are synchronous, so they have been applied or raised
+
+    def keeps_incremental_state(self):
+        """Whether incremental stages may record what they have written.
+
+        Only writes that go straight to Neo4j count: a dry run's graph is
+        thrown away and spooled writes haven't reached the database yet, so
+        recording either would make the next real load skip them.
+        """
+        return isinstance(self.sink, Neo4jGraphSink)
+
+    def write_metrics_report(self):
+        if self.metrics.is_empty():
+            return None
+        try:
+            return self.metrics.write_report(self.metrics_dir)
+        except OSError as e:
+            self.log.error("Could not write metrics report: %s", e)
+
+    def basho_files(self, folder_path, unique=False):
+        return basho_files(folder_path, self.divisions, unique)
+
+    def load_json_file(self, file_path):
+        with (
+            open(file_path, "rb") as file,
+            self.metrics.timer("json_parse_seconds"),
+        ):
+            return codec.loads(file.read())
+
+    def load_banzuke(self, file_path):
+        with (
+            open(file_path, "rb") as file,
+            self.metrics.timer("json_parse_seconds"),
+        ):
+            return codec.decode_banzuke(file.read())
+
+    def load_rikishi(self, file_path):
+        with (
+            open(file_path, "rb") as file,
+            self.metrics.timer("json_parse_seconds"),
+        ):
+            return codec.decode_rikishi(file.read())
+
+    def banzuke_documents(self, folder_path, unique=False):
+        """(bashoId, source, Banzuke) for each basho_files entry, in order.
+
+        Read from the snapshot's shards once it has been packed (see
+        snapshot_store), else from the files.
+        """
+        if not is_packed(folder_path):
+            for basho, file_path in self.basho_files(folder_path, unique):
+                yield basho, file_path, self.load_banzuke(file_path)
+            return
+        reader = ShardReader(folder_path)
+        for basho, key in basho_keys(reader.keys(), self.divisions, unique):
+            body = reader.get(key)
+            with self.metrics.timer("json_parse_seconds"):
+                banzuke = codec.decode_banzuke(body)
+            yield basho, key, banzuke
+
+    def rikishi_documents(self, folder_path):
+        """(file name, Rikishi) for every rikishi document, from shards if packed."""
+        if not is_packed(folder_path):
+            for filename in os.listdir(folder_path):
+                if filename.endswith(".json"):
+                    file_path = os.path.join(folder_path, filename)
+                    yield filename, self.load_rikishi(file_path)
+            return
+        for key, body in ShardReader(folder_path):
+            with self.metrics.timer("json_parse_seconds"):
+                rikishi = codec.decode_rikishi(body)
+            yield f"{key}.json", rikishi
+
+    def run_query(self, query, operation=None, **params):
+        # Single entry point for builder writes; ``operation`` names the write
+        # for sinks that don't execute Cypher (see graph_sinks)
+        with self.metrics.timer("batch_write_seconds"):
+            record = self.sink.run(query, params, operation=operation)
+        self.metrics.inc("queries")
+        return record
+
+    def write_batches(self, query, rows, batch_size=1000, operation=None):
+        # ``query`` should UNWIND $rows; one transaction per batch
+        batches = 0
+        for start in range(0, len(rows), batch_size):
+            self.run_query(
+                query, operation=operation, rows=rows[start : start + batch_size]
+            )
+            batches += 1
+        return batches
 
     def get_most_recent_directory(self, base_path):
         # Get all directories in the base path
@@ -109,3 +515,103 @@ class AuraDBLoader:
             return date_dirs[0]
         else:
             return None
+
+
+class AsyncAuraDBLoader(AuraDBLoader):
+    """Send builder writes through the neo4j async driver.
+
+    Mix in front of any builder class (see ``make_async_loader``). Writes are
+    scheduled on an event loop running in a background thread, so the calling
+    thread keeps parsing files while up to ``max_in_flight`` transactions are
+    in flight. ``run_query`` returns None in this mode.
+
+    Only the neo4j sink has an async path; with SUMO_GRAPH_SINK=memory or
+    spool the writes go to that sink as usual and no driver is created.
+    """
+
+    def __init__(self, max_in_flight=8):
+        super().__init__()
+        self.max_in_flight = max_in_flight
+        self.failed_writes = []
+        self.async_sink = None
+        if not isinstance(self.sink, Neo4jGraphSink):
+            return
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        # The async driver has to be created on the loop that will use it
+        self.async_sink = asyncio.run_coroutine_threadsafe(
+            self._create_async_sink(), self._loop
+        ).result()
+
+    async def _create_async_sink(self):
+        driver = AsyncGraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        return AsyncNeo4jGraphSink(driver, self.metrics)
+
+    async def _run_async(self, query, params, operation):
+        with self.metrics.timer("batch_write_seconds"):
+            await self.async_sink.run(query, params, operation=operation)
+        self.metrics.inc("queries")
+
+    def _on_write_done(self, future):
+        error = future.exception()
+        with self._pending_lock:
+            if error is not None:
+                self.log.error("Async write failed: %s", error)
+                self.failed_writes.append(error)
+            self._pending.discard(future)
+        self._in_flight.release()
+
+    def run_query(self, query, operation=None, **params):
+        if self.async_sink is None:
+            return super().run_query(query, operation=operation, **params)
+        # Blocks only once max_in_flight writes are outstanding
+        self._in_flight.acquire()
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_async(query, params, operation), self._loop
+        )
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_write_done)
+        return None
+
+    def flush(self):
+        if self.async_sink is None:
+            return
+        with self._pending_lock:
+            pending = list(self._pending)
+        wait_futures(pending)
+        # Done callbacks can lag behind wait(), so check the futures directly too
+        for future in pending:
+            error = future.exception()
+            with self._pending_lock:
+                if error is not None and error not in self.failed_writes:
+                    self.failed_writes.append(error)
+        if self.failed_writes:
+            raise RuntimeError(
+                f"{len(self.failed_writes)} async writes failed"
+            ) from self.failed_writes[0]
+
+    def finish_load(self):
+        if self.async_sink is None:
+            return super().finish_load()
+        try:
+            self.flush()
+            # The load version bump is itself an async write
+            super().finish_load()
+            self.flush()
+        finally:
+            asyncio.run_coroutine_threadsafe(
+                self.async_sink.close(), self._loop
+            ).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+
+
+def make_async_loader(loader_cls):
+    """Return ``loader_cls`` with its writes routed through AsyncAuraDBLoader."""
+    return type(f"Async{loader_cls.__name__}", (AsyncAuraDBLoader, loader_cls), {})
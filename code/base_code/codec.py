@@ -0,0 +1,356 @@
+import json
+import math
+import sys
+
+from .graph_sinks import BOUT_KEY_PARAMS
+
+# orjson decodes straight from bytes several times faster than the stdlib;
+# it is optional, json is the fallback
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# Both raise a subclass of json.JSONDecodeError on bad input
+if orjson is not None:
+    loads = orjson.loads
+    dumps = orjson.dumps
+else:  # pragma: no cover - depends on the environment
+
+    def loads(raw):
+        return json.loads(raw)
+
+    def dumps(obj, default=None):
+        return json.dumps(obj, separators=(",", ":"), default=default).encode()
+
+
+def _intern(value):
+    # Results, kimarite and sides repeat across every bout; one copy each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def read_json(path):
+    with open(path, "rb") as file:
+        return loads(file.read())
+
+
+def write_json(path, obj):
+    with open(path, "wb") as file:
+        file.write(dumps(obj))
+
+
+class _Absent:
+    """Type of ABSENT: falsy, so ``if rikishi.intai`` reads it like None."""
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "ABSENT"
+
+
+# A field the API left out, as opposed to one it sent as null
+ABSENT = _Absent()
+
+
+class Record:
+    """Base of the API records: the fields are the ``__slots__``, in API order.
+
+    Slotted instances carry no per-instance dict, so a decoded banzuke takes
+    a fraction of the memory of the nested dicts json.load returns.
+    """
+
+    __slots__ = ()
+
+    # What a field holds when the API left it out; to_dict skips it
+    MISSING = None
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def get(self, name):
+        """The field's value, None when the API left it out."""
+        value = getattr(self, name)
+        return None if value is self.MISSING else value
+
+    def to_dict(self):
+        # Fields the API left out stay out, as they were in the JSON
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, tuple):
+                value = [
+                    item.to_dict() if isinstance(item, Record) else item
+                    for item in value
+                ]
+            if value is not self.MISSING:
+                data[name] = value
+        return data
+
+
+# Record fields in API order, which to_dict writes them back in
+BOUT_RECORD_FIELDS = (
+    "result",
+    "opponentShikonaEn",
+    "opponentShikonaJp",
+    "opponentID",
+    "kimarite",
+)
+
+
+class BoutRecord(Record):
+    """One entry of a rikishi's ``record`` on the banzuke."""
+
+    __slots__ = BOUT_RECORD_FIELDS
+
+    def __init__(
+        self,
+        result=None,
+        opponentShikonaEn=None,
+        opponentShikonaJp=None,
+        opponentID=None,
+        kimarite=None,
+    ):
+        self.result = result
+        self.opponentShikonaEn = opponentShikonaEn
+        self.opponentShikonaJp = opponentShikonaJp
+        self.opponentID = opponentID
+        self.kimarite = kimarite
+
+    @classmethod
+    def from_dict(cls, data):
+        get = data.get
+        return cls(
+            _intern(get("result")),
+            get("opponentShikonaEn"),
+            get("opponentShikonaJp"),
+            get("opponentID"),
+            _intern(get("kimarite")),
+        )
+
+
+BANZUKE_ENTRY_FIELDS = (
+    "side",
+    "rikishiID",
+    "shikonaEn",
+    "shikonaJp",
+    "rankValue",
+    "rank",
+    "record",
+    "wins",
+    "losses",
+    "absences",
+)
+
+
+class BanzukeEntry(Record):
+    __slots__ = BANZUKE_ENTRY_FIELDS
+
+    def __init__(
+        self,
+        side=None,
+        rikishiID=None,
+        shikonaEn=None,
+        shikonaJp=None,
+        rankValue=None,
+        rank=None,
+        record=None,
+        wins=None,
+        losses=None,
+        absences=None,
+    ):
+        self.side = side
+        self.rikishiID = rikishiID
+        self.shikonaEn = shikonaEn
+        self.shikonaJp = shikonaJp
+        self.rankValue = rankValue
+        self.rank = rank
+        # A tuple of BoutRecord, or None when the API sent no record
+        self.record = record
+        self.wins = wins
+        self.losses = losses
+        self.absences = absences
+
+    @classmethod
+    def from_dict(cls, data):
+        get = data.get
+        record = get("record")
+        return cls(
+            _intern(get("side")),
+            get("rikishiID"),
+            get("shikonaEn"),
+            get("shikonaJp"),
+            get("rankValue"),
+            get("rank"),
+            (
+                None
+                if record is None
+                else tuple(BoutRecord.from_dict(bout) for bout in record if bout)
+            ),
+            get("wins"),
+            get("losses"),
+            get("absences"),
+        )
+
+
+class Banzuke(Record):
+    """One basho file: /api/basho/{bashoId}/banzuke/{division}."""
+
+    __slots__ = ("bashoId", "division", "east", "west")
+
+    def __init__(self, bashoId=None, division=None, east=(), west=()):
+        self.bashoId = bashoId
+        self.division = division
+        self.east = east
+        self.west = west
+
+    @classmethod
+    def from_dict(cls, data):
+        get = data.get
+        return cls(
+            get("bashoId"),
+            get("division"),
+            tuple(
+                BanzukeEntry.from_dict(entry) for entry in get("east") or () if entry
+            ),
+            tuple(
+                BanzukeEntry.from_dict(entry) for entry in get("west") or () if entry
+            ),
+        )
+
+    def sides(self):
+        """(side name, entries) for east then west, as the bout pairing uses them."""
+        return (("East", self.east), ("West", self.west))
+
+    def rikishi_ids(self):
+        return {
+            entry.rikishiID
+            for entry in self.east + self.west
+            if entry.rikishiID is not None
+        }
+
+
+RIKISHI_FIELDS = (
+    "id",
+    "sumodbId",
+    "nskId",
+    "shikonaEn",
+    "shikonaJp",
+    "currentRank",
+    "heya",
+    "birthDate",
+    "shusshin",
+    "height",
+    "weight",
+    "debut",
+    "intai",
+)
+
+
+class Rikishi(Record):
+    """One rikishi file: /api/rikishi/{id}.
+
+    Every field becomes a Rikishi node property, so fields outside the
+    schema are kept in ``extra`` rather than dropped. A field sent as null
+    stays None and is written, which removes the stale property under
+    ``SET r += $attributes``; one the API left out is ABSENT and skipped.
+    """
+
+    __slots__ = (*RIKISHI_FIELDS, "extra")
+
+    MISSING = ABSENT
+
+    def __init__(
+        self,
+        id=ABSENT,
+        sumodbId=ABSENT,
+        nskId=ABSENT,
+        shikonaEn=ABSENT,
+        shikonaJp=ABSENT,
+        currentRank=ABSENT,
+        heya=ABSENT,
+        birthDate=ABSENT,
+        shusshin=ABSENT,
+        height=ABSENT,
+        weight=ABSENT,
+        debut=ABSENT,
+        intai=ABSENT,
+        extra=None,
+    ):
+        self.id = id
+        self.sumodbId = sumodbId
+        self.nskId = nskId
+        self.shikonaEn = shikonaEn
+        self.shikonaJp = shikonaJp
+        self.currentRank = currentRank
+        self.heya = heya
+        self.birthDate = birthDate
+        self.shusshin = shusshin
+        self.height = height
+        self.weight = weight
+        self.debut = debut
+        self.intai = intai
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {
+            name: value for name, value in data.items() if name not in RIKISHI_FIELDS
+        }
+        return cls(*(data.get(name, ABSENT) for name in RIKISHI_FIELDS), extra or None)
+
+    def to_dict(self):
+        data = super().to_dict()
+        data.update(data.pop("extra") or {})
+        return data
+
+
+class Bout(Record):
+    """A paired bout, keyed exactly like the Bout node MERGE (BOUT_KEY_PARAMS)."""
+
+    __slots__ = BOUT_KEY_PARAMS
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        # Missing values become "" (or 0 for the fight number) as Neo4j can't
+        # store NaN
+        values = []
+        for name in cls.__slots__:
+            default = 0 if name == "Fight_Number" else ""
+            value = row.get(name, default)
+            missing = value is None or (isinstance(value, float) and math.isnan(value))
+            values.append(default if missing else value)
+        return cls(*values)
+
+    def params(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def decode_banzuke(raw):
+    return Banzuke.from_dict(loads(raw))
+
+
+def decode_rikishi(raw):
+    return Rikishi.from_dict(loads(raw))
+
+
+def read_banzuke(path):
+    with open(path, "rb") as file:
+        return decode_banzuke(file.read())
+
+
+def read_rikishi(path):
+    with open(path, "rb") as file:
+        return decode_rikishi(file.read())
@@ -0,0 +1,290 @@
+from array import array
+from collections import Counter
+
+# Operation names builders attach to their writes. Neo4jGraphSink ignores
+# them and runs the Cypher; InMemoryGraphSink uses them to pick a handler.
+MERGE_BASHO = "merge_basho"
+MERGE_RIKISHI = "merge_rikishi"
+MERGE_BOUT = "merge_bout"
+MERGE_BOUTS = "merge_bouts"
+MERGE_BASHO_BOUT = "merge_basho_bout"
+MERGE_RIKISHI_BOUT = "merge_rikishi_bout"
+MERGE_RIKISHI_FACED = "merge_rikishi_faced"
+SET_RIKISHI_RATINGS = "set_rikishi_ratings"
+MERGE_RIKISHI_RANKED_IN = "merge_rikishi_ranked_in"
+SET_RIKISHI_RANK_HISTORY = "set_rikishi_rank_history"
+CREATE_INDEX = "create_index"
+MERGE_NEXT_BASHO = "merge_next_basho"
+BUMP_LOAD_VERSION = "bump_load_version"
+
+BOUT_KEY_PARAMS = (
+    "result_rikishi1",
+    "RikishiID_rikishi1",
+    "Side_rikishi1",
+    "kimarite",
+    "Fight_Number",
+    "result_rikishi2",
+    "RikishiID_rikishi2",
+    "Side_rikishi2",
+    "bashoId",
+)
+
+
+class GraphSink:
+    """Where builder writes end up. ``run`` returns the first record or None."""
+
+    def run(self, query, params, operation=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Neo4jGraphSink(GraphSink):
+    def __init__(self, driver, metrics=None):
+        self.driver = driver
+        self.metrics = metrics
+
+    def run(self, query, params, operation=None):
+        with self.driver.session() as session:
+            result = session.run(query, **params)
+            record = result.single()
+            if self.metrics is not None:
+                self.metrics.record_summary(result.consume())
+        return record
+
+
+class AsyncNeo4jGraphSink:
+    """Neo4jGraphSink for the async driver; ``run`` is a coroutine."""
+
+    def __init__(self, driver, metrics=None):
+        self.driver = driver
+        self.metrics = metrics
+
+    @staticmethod
+    async def _write_tx(tx, query, params):
+        result = await tx.run(query, **params)
+        return await result.consume()
+
+    async def run(self, query, params, operation=None):
+        async with self.driver.session() as session:
+            summary = await session.execute_write(self._write_tx, query, params)
+        if self.metrics is not None:
+            self.metrics.record_summary(summary)
+
+    async def close(self):
+        await self.driver.close()
+
+
+def _normalise_id(value):
+    # Ids arrive as int, numpy int or str depending on the source; Neo4j
+    # compares them by value, so the in-memory indexes do the same
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class Relationships:
+    """Edges of one type as parallel int arrays plus a set for MERGE checks.
+
+    Edge properties, when a relationship type has any, are kept in a dict
+    keyed by (source, target).
+    """
+
+    def __init__(self):
+        self.sources = array("l")
+        self.targets = array("l")
+        self._pairs = set()
+        self.properties = {}
+
+    def merge(self, source, target, properties=None):
+        if properties:
+            self.properties.setdefault((source, target), {}).update(properties)
+        if (source, target) in self._pairs:
+            return False
+        self._pairs.add((source, target))
+        self.sources.append(source)
+        self.targets.append(target)
+        return True
+
+    def __len__(self):
+        return len(self.sources)
+
+
+class InMemoryGraphSink(GraphSink):
+    """Graph held in Python lists, hash indexes and adjacency arrays.
+
+    Applies the same MERGE semantics as the Cypher the builders send, so a
+    full dry run gives the node and relationship counts of a real load.
+    Operations it has no handler for are counted in ``unhandled_operations``.
+    """
+
+    def __init__(self):
+        self.basho_nodes = []
+        self.rikishi_nodes = []
+        self.bout_nodes = []
+        # Hash indexes from merge keys to positions in the node lists
+        self.basho_index = {}
+        self.rikishi_index = {}
+        self.bout_index = {}
+        self.bouts_by_basho = {}
+        self.bouts_by_rikishi = {}
+        self.relationships = {
+            "BOUT_EVENT": Relationships(),
+            "RIKISHI_IN_BOUT_EVENT": Relationships(),
+            "FACED": Relationships(),
+            "RANKED_IN": Relationships(),
+            "NEXT_BASHO": Relationships(),
+        }
+        self.indexes_created = 0
+        self.load_version = 0
+        self.unhandled_operations = Counter()
+        self.handlers = {
+            MERGE_BASHO: self.merge_basho,
+            MERGE_RIKISHI: self.merge_rikishi,
+            MERGE_BOUT: self.merge_bout,
+            MERGE_BOUTS: self.merge_bouts,
+            MERGE_BASHO_BOUT: self.merge_basho_bout,
+            MERGE_RIKISHI_BOUT: self.merge_rikishi_bout,
+            MERGE_RIKISHI_FACED: self.merge_rikishi_faced,
+            SET_RIKISHI_RATINGS: self.set_rikishi_properties,
+            MERGE_RIKISHI_RANKED_IN: self.merge_rikishi_ranked_in,
+            SET_RIKISHI_RANK_HISTORY: self.set_rikishi_properties,
+            CREATE_INDEX: self.create_index,
+            MERGE_NEXT_BASHO: self.merge_next_basho,
+            BUMP_LOAD_VERSION: self.bump_load_version,
+        }
+
+    def run(self, query, params, operation=None):
+        handler = self.handlers.get(operation)
+        if handler is None:
+            self.unhandled_operations[operation or query.split(None, 1)[0]] += 1
+            return None
+        return handler(**params)
+
+    def create_index(self):
+        # Lookups here always go through the hash indexes already
+        self.indexes_created += 1
+
+    def merge_basho(self, basho_id, **properties):
+        position = self.basho_index.get(basho_id)
+        if position is None:
+            position = len(self.basho_nodes)
+            self.basho_index[basho_id] = position
+            self.basho_nodes.append({"bashoId": basho_id})
+        self.basho_nodes[position].update(properties)
+        return (self.basho_nodes[position],)
+
+    def merge_next_basho(self, rows):
+        edges = self.relationships["NEXT_BASHO"]
+        for row in rows:
+            previous = self.basho_index.get(row["previous"])
+            following = self.basho_index.get(row["next"])
+            if previous is not None and following is not None:
+                edges.merge(previous, following)
+
+    def merge_rikishi(self, rikishiID, attributes):
+        key = _normalise_id(rikishiID)
+        position = self.rikishi_index.get(key)
+        if position is None:
+            position = len(self.rikishi_nodes)
+            self.rikishi_index[key] = position
+            self.rikishi_nodes.append({"rikishiID": rikishiID})
+        node = self.rikishi_nodes[position]
+        for name, value in attributes.items():
+            # As in SET r += $attributes, a null removes the property
+            if value is None:
+                node.pop(name, None)
+            else:
+                node[name] = value
+        return (node,)
+
+    def merge_bout(self, **params):
+        key = tuple(params[name] for name in BOUT_KEY_PARAMS)
+        position = self.bout_index.get(key)
+        if position is None:
+            position = len(self.bout_nodes)
+            self.bout_index[key] = position
+            self.bout_nodes.append(key)
+            self.bouts_by_basho.setdefault(params["bashoId"], []).append(position)
+            for rikishi_param in ("RikishiID_rikishi1", "RikishiID_rikishi2"):
+                rikishi_id = _normalise_id(params[rikishi_param])
+                if rikishi_id != "":
+                    self.bouts_by_rikishi.setdefault(rikishi_id, []).append(position)
+        return (dict(zip(BOUT_KEY_PARAMS, self.bout_nodes[position])),)
+
+    def merge_bouts(self, rows):
+        for row in rows:
+            self.merge_bout(**row)
+
+    def merge_basho_bout(self, bashoId):
+        basho_position = self.basho_index.get(bashoId)
+        if basho_position is None:
+            return
+        edges = self.relationships["BOUT_EVENT"]
+        for bout_position in self.bouts_by_basho.get(bashoId, []):
+            edges.merge(basho_position, bout_position)
+
+    def merge_rikishi_bout(self, rikishiId):
+        key = _normalise_id(rikishiId)
+        rikishi_position = self.rikishi_index.get(key)
+        if rikishi_position is None:
+            return
+        edges = self.relationships["RIKISHI_IN_BOUT_EVENT"]
+        # A bout where both sides are this rikishi still yields a single edge
+        for bout_position in self.bouts_by_rikishi.get(key, []):
+            edges.merge(rikishi_position, bout_position)
+
+    def merge_rikishi_faced(self, rows):
+        edges = self.relationships["FACED"]
+        for row in rows:
+            source = self.rikishi_index.get(_normalise_id(row["rikishiId"]))
+            target = self.rikishi_index.get(_normalise_id(row["opponentId"]))
+            # MATCH semantics: no edge unless both rikishi exist
+            if source is None or target is None:
+                continue
+            properties = {
+                key: value
+                for key, value in row.items()
+                if key not in ("rikishiId", "opponentId")
+            }
+            edges.merge(source, target, properties)
+
+    def merge_rikishi_ranked_in(self, rows):
+        edges = self.relationships["RANKED_IN"]
+        for row in rows:
+            source = self.rikishi_index.get(_normalise_id(row["rikishiId"]))
+            target = self.basho_index.get(row["bashoId"])
+            if source is None or target is None:
+                continue
+            properties = {
+                key: value for key, value in row.items() if key != "rikishiId"
+            }
+            edges.merge(source, target, properties)
+
+    def set_rikishi_properties(self, rows):
+        for row in rows:
+            position = self.rikishi_index.get(_normalise_id(row["rikishiId"]))
+            if position is None:
+                continue
+            self.rikishi_nodes[position].update(
+                {key: value for key, value in row.items() if key != "rikishiId"}
+            )
+
+    def bump_load_version(self):
+        self.load_version += 1
+        return (self.load_version,)
+
+    def counts(self):
+        return {
+            "nodes": {
+                "Basho": len(self.basho_nodes),
+                "Rikishi": len(self.rikishi_nodes),
+                "Bout": len(self.bout_nodes),
+            },
+            "relationships": {
+                name: len(edges) for name, edges in self.relationships.items()
+            },
+            "unhandled_operations": dict(self.unhandled_operations),
+        }
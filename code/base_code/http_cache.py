@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_ENV_VAR = "SUMO_HTTP_CACHE"
+DEFAULT_MAX_ENTRIES = 50000
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+# Responses that can still change: the running basho, active rikishi
+LIVE_TTL = 10 * MINUTE
+DEFAULT_TTL = DAY
+# Empty bodies and error payloads, unless the endpoint knows better
+NEGATIVE_TTL = HOUR
+# Completed bashos and retired rikishi don't change any more
+COMPLETED_TTL = 365 * DAY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class CachedResponse:
+    """A cached body standing in for a ``requests.Response``."""
+
+    __slots__ = ("content", "url")
+
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+
+    def raise_for_status(self):
+        # Only successful (or empty) responses are ever stored
+        pass
+
+
+class ResponseCache:
+    """API response bodies in a local SQLite file, keyed by URL.
+
+    Every entry has its own expiry, chosen by the downloader from what the
+    response says (a completed basho, a retired rikishi, an invalid id).
+    Entries are evicted least recently used first once there are more than
+    ``max_entries``.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.clock = clock
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Shared by the download threads; the lock serialises them
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.size = self.connection.execute(
+            "SELECT COUNT(*) FROM responses"
+        ).fetchone()[0]
+
+    @classmethod
+    def from_environment(cls, default_path):
+        """The cache ``SUMO_HTTP_CACHE`` asks for: unset or 0 for none, 1 for
+        ``default_path``, anything else is the file to use."""
+        value = os.environ.get(CACHE_ENV_VAR, "")
+        if value in ("", "0"):
+            return None
+        return cls(default_path if value == "1" else value)
+
+    def get(self, url):
+        now = self.clock()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT body, expires_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            body, expires_at = row
+            if expires_at <= now:
+                self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.connection.commit()
+                self.size -= 1
+                return None
+            self.connection.execute(
+                "UPDATE responses SET last_used = ? WHERE url = ?", (now, url)
+            )
+            self.connection.commit()
+        return CachedResponse(url, body)
+
+    def put(self, url, body, ttl):
+        now = self.clock()
+        with self._lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (url, body, now + ttl, now),
+            )
+            if not exists:
+                self.size += 1
+            if self.size > self.max_entries:
+                self._evict(self.size - self.max_entries)
+            self.connection.commit()
+
+    def _evict(self, count):
+        self.connection.execute(
+            "DELETE FROM responses WHERE url IN "
+            "(SELECT url FROM responses ORDER BY last_used LIMIT ?)",
+            (count,),
+        )
+        self.size -= count
+
+    def prune(self):
+        """Drop expired entries; they would only be replaced on the next miss."""
+        with self._lock:
+            deleted = self.connection.execute(
+                "DELETE FROM responses WHERE expires_at <= ?", (self.clock(),)
+            ).rowcount
+            self.size -= deleted
+            self.connection.commit()
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,228 @@
+"""Structured logging that stays off the download threads and builder loops.
+
+``configure_logging`` installs one QueueHandler on the root logger; a
+QueueListener thread does the formatting-to-JSON and the file writes, so a
+thread that logs only pays for putting a record on a queue. Each line is a
+JSON object with the time, level, logger and message plus whatever fields
+the call passed in ``extra`` (stage, basho, division, rikishi, ...).
+
+Stages log through ``stage_logger(name)``, logger ``sumo.<name>``, whose
+records carry the stage name. Levels come from $SUMO_LOG_LEVEL: a default
+level, optionally followed by per-stage overrides, e.g.
+``WARNING,SumoApiQueryBasho=DEBUG``.
+
+``Progress`` replaces a line per item with a progress event every few
+seconds and one at the end.
+"""
+
+import atexit
+import copy
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from . import codec
+
+LOG_LEVEL_ENV_VAR = "SUMO_LOG_LEVEL"
+DEFAULT_LEVEL = "INFO"
+PROGRESS_SECONDS = 5.0
+LOGGER_PREFIX = "sumo"
+LEVEL_NAMES = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET")
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+STANDARD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+_listener = None
+_target = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    # ISO 8601 in UTC, to the millisecond
+    converter = time.gmtime
+    default_time_format = "%Y-%m-%dT%H:%M:%S"
+    default_msec_format = "%s.%03d+00:00"
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in STANDARD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted by JsonQueueHandler before the record was queued
+            entry["exception"] = record.exc_text
+        return codec.dumps(entry, default=str).decode()
+
+
+class JsonQueueHandler(QueueHandler):
+    """Queue records with the traceback kept apart from the message.
+
+    QueueHandler.prepare appends the traceback to ``msg`` and drops
+    ``exc_info``; this formats it into ``exc_text`` instead, so the JSON
+    line has it as its own "exception" field.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Tracebacks hold frames that the writer thread has no use for
+        record.exc_info = None
+        return record
+
+
+def parse_levels(value):
+    """``"WARNING,Stage=DEBUG"`` -> ("WARNING", {"Stage": "DEBUG"})."""
+    default, stages = DEFAULT_LEVEL, {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        stage, _, level = part.rpartition("=")
+        level = level.strip().upper()
+        if level not in LEVEL_NAMES:
+            raise ValueError(f"Unknown log level in {LOG_LEVEL_ENV_VAR}: {part}")
+        if stage:
+            stages[stage.strip()] = level
+        else:
+            default = level
+    return default, stages
+
+
+def configure_logging(log_file=None):
+    """Send every record through a queue to a JSON writer thread.
+
+    Writes to ``log_file`` (appending), or to stderr without one. Called
+    again with no file it keeps whatever is configured, so a builder doesn't
+    undo a downloader's log file; with a different file it switches to it.
+    """
+    global _listener, _target
+    with _lock:
+        if _listener is not None and (log_file is None or log_file == _target):
+            return
+        stop_logging(_locked=True)
+        if log_file:
+            handler = logging.FileHandler(log_file, encoding="utf-8")
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        records = queue.SimpleQueue()
+        root = logging.getLogger()
+        default, stages = parse_levels(os.environ.get(LOG_LEVEL_ENV_VAR))
+        root.setLevel(default)
+        for stage, level in stages.items():
+            logging.getLogger(f"{LOGGER_PREFIX}.{stage}").setLevel(level)
+        root.addHandler(JsonQueueHandler(records))
+        _listener = QueueListener(records, handler)
+        _listener.start()
+        _target = log_file
+
+
+def stop_logging(_locked=False):
+    """Flush queued records and stop the writer thread."""
+    global _listener, _target
+    if not _locked:
+        with _lock:
+            return stop_logging(_locked=True)
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler) and handler.queue is _listener.queue:
+            root.removeHandler(handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _target = None
+
+
+atexit.register(stop_logging)
+
+
+class StageLogger(logging.LoggerAdapter):
+    """Adds the stage to every record, keeping the call's own ``extra``."""
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+def stage_logger(stage):
+    return StageLogger(logging.getLogger(f"{LOGGER_PREFIX}.{stage}"), {"stage": stage})
+
+
+class Progress:
+    """Count items, logging a progress event at most every ``interval`` seconds.
+
+    ``update`` is for items done, ``skip`` for items passed over (logged
+    individually at DEBUG). ``close`` logs the final counts and rate.
+    """
+
+    def __init__(
+        self, logger, action, total=None, interval=PROGRESS_SECONDS, clock=None
+    ):
+        self.logger = logger
+        self.action = action
+        self.total = total
+        self.interval = interval
+        self.clock = clock or time.monotonic
+        self.done = 0
+        self.skipped = 0
+        self.started = self.last = self.clock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, count=1, **fields):
+        self.done += count
+        now = self.clock()
+        if now - self.last >= self.interval:
+            self.last = now
+            self._log(now, fields)
+
+    def skip(self, reason, **fields):
+        self.skipped += 1
+        self.logger.debug(
+            "%s: skipped (%s)",
+            self.action,
+            reason,
+            extra={"event": "skipped", "action": self.action, **fields},
+        )
+
+    def _log(self, now, fields, final=False):
+        elapsed = now - self.started
+        self.logger.info(
+            "%s: %d%s done%s",
+            self.action,
+            self.done,
+            "" if self.total is None else f"/{self.total}",
+            f", {self.skipped} skipped" if self.skipped else "",
+            extra={
+                "event": "finished" if final else "progress",
+                "action": self.action,
+                "done": self.done,
+                "total": self.total,
+                "skipped": self.skipped,
+                "per_second": round(self.done / elapsed, 1) if elapsed else None,
+                **fields,
+            },
+        )
+
+    def close(self):
+        self._log(self.clock(), {}, final=True)
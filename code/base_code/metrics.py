@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds in seconds, shared by every latency/duration histogram
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# ResultSummary.counters attributes worth tracking for graph writes
+SUMMARY_COUNTERS = (
+    "nodes_created",
+    "relationships_created",
+    "properties_set",
+)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        running = 0
+        cumulative = []
+        for bucket_count in self.bucket_counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(
+                zip([str(b) for b in self.buckets], self.cumulative_counts())
+            ),
+        }
+
+
+class StageMetrics:
+    """In-process counters and histograms for one pipeline stage.
+
+    Recording is a dict update under a lock, cheap enough for the hot loops.
+    ``write_report`` dumps a JSON and a Prometheus text file per run.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started_at = datetime.now()
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_summary(self, summary):
+        # summary is a neo4j ResultSummary; counters live on summary.counters
+        counters = getattr(summary, "counters", None)
+        for name in SUMMARY_COUNTERS:
+            value = getattr(counters, name, None)
+            if isinstance(value, int):
+                self.inc(name, value)
+
+    def is_empty(self):
+        return not self.counters and not self.histograms
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now().isoformat(),
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self):
+        labels = f'stage="{self.stage}"'
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"sumo_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{{{labels}}} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"sumo_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for upper, count in zip(
+                    histogram.buckets, histogram.cumulative_counts()
+                ):
+                    lines.append(f'{metric}_bucket{{{labels},le="{upper}"}} {count}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        base_name = f"{self.stage}_{self.started_at.strftime('%Y%m%dT%H%M%S')}"
+        json_path = os.path.join(directory, f"{base_name}.json")
+        with open(json_path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        with open(os.path.join(directory, f"{base_name}.prom"), "w") as file:
+            file.write(self.to_prometheus())
+        return json_path
@@ -0,0 +1,160 @@
+import cProfile
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime
+
+from .base_classes import get_project_root
+from .log_config import stage_logger
+
+PROFILE_ENV_VAR = "SUMO_PROFILE"
+PROFILE_FLAG = "--profile"
+
+log = stage_logger("StageProfiler")
+
+
+def profiling_enabled(argv=None):
+    """Profiling is opt-in: SUMO_PROFILE=1 or a --profile argument."""
+    argv = sys.argv if argv is None else argv
+    env_value = os.environ.get(PROFILE_ENV_VAR, "").strip().lower()
+    return env_value in ("1", "true", "yes", "on") or PROFILE_FLAG in argv
+
+
+def get_git_revision():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(get_project_root()),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return revision or "unknown"
+
+
+def _function_label(func):
+    file_name, line_number, function_name = func
+    if file_name == "~":
+        return function_name
+    return f"{os.path.basename(file_name)}:{line_number}({function_name})"
+
+
+def collapsed_stacks(stats, min_microseconds=1):
+    """Fold cProfile caller/callee data into flamegraph.pl style stacks.
+
+    cProfile only keeps one level of caller information, so time is pushed
+    down from the root functions and split across call paths in proportion
+    to each edge's cumulative time.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, caller_stats in callers.items():
+            # caller_stats is (cc, nc, tt, ct) for the caller -> func edge
+            callees.setdefault(caller, []).append((func, caller_stats[3]))
+    roots = [func for func, entry in stats.stats.items() if not entry[4]]
+    folded = {}
+
+    def visit(func, inclusive_time, path):
+        total_cumulative = stats.stats[func][3]
+        share = inclusive_time / total_cumulative if total_cumulative else 0
+        self_time = stats.stats[func][2] * share
+        if self_time * 1e6 >= min_microseconds:
+            key = ";".join(path)
+            folded[key] = folded.get(key, 0) + self_time
+        for callee, edge_time in callees.get(func, []):
+            label = _function_label(callee)
+            child_time = edge_time * share
+            if label in path or child_time * 1e6 < min_microseconds:
+                continue
+            visit(callee, child_time, path + [label])
+
+    for root in roots:
+        visit(root, stats.stats[root][3], [_function_label(root)])
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in folded.items()]
+
+
+class StageProfiler:
+    """Context manager that profiles one pipeline stage when profiling is on.
+
+    Writes ``<stage>_<revision>_<timestamp>`` .pstats, .collapsed and
+    .memory.json files under ``profiles/<snapshot>/`` (or SUMO_PROFILE_DIR).
+    """
+
+    def __init__(
+        self, stage, snapshot=None, output_dir=None, top_allocations=20, enabled=None
+    ):
+        self.stage = stage
+        self.snapshot = snapshot or datetime.now().strftime("%Y%m")
+        self.output_dir = output_dir or os.environ.get(
+            "SUMO_PROFILE_DIR", str(get_project_root() / "profiles")
+        )
+        self.top_allocations = top_allocations
+        self.enabled = profiling_enabled() if enabled is None else enabled
+        self.profiler = None
+        self.output_paths = {}
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.enabled:
+            return False
+        self.profiler.disable()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        memory_snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self.write_outputs(peak_bytes, memory_snapshot)
+        return False
+
+    def write_outputs(self, peak_bytes, memory_snapshot):
+        revision = get_git_revision()
+        directory = os.path.join(self.output_dir, self.snapshot)
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        base_path = os.path.join(directory, f"{self.stage}_{revision}_{timestamp}")
+
+        stats = pstats.Stats(self.profiler)
+        stats.dump_stats(f"{base_path}.pstats")
+        with open(f"{base_path}.collapsed", "w") as file:
+            file.write("\n".join(collapsed_stacks(stats)) + "\n")
+
+        top_sites = memory_snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        ).statistics("lineno")[: self.top_allocations]
+        memory_report = {
+            "stage": self.stage,
+            "snapshot": self.snapshot,
+            "git_revision": revision,
+            "peak_bytes": peak_bytes,
+            "top_allocations": [
+                {
+                    "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in top_sites
+            ],
+        }
+        with open(f"{base_path}.memory.json", "w") as file:
+            json.dump(memory_report, file, indent=2)
+
+        self.output_paths = {
+            "pstats": f"{base_path}.pstats",
+            "collapsed": f"{base_path}.collapsed",
+            "memory": f"{base_path}.memory.json",
+        }
+        log.info("Wrote %s profile to %s.*", self.stage, base_path)
@@ -0,0 +1,340 @@
+"""Packed snapshot storage: a snapshot's documents in gzip NDJSON shards.
+
+A packed snapshot keeps ``<snapshot>/shards/<kind>-NNNN.ndjson.gz`` files
+and a ``<kind>.index.json`` next to them, for kind ``basho`` and ``rikishi``.
+Each shard is a run of gzip members ("blocks") of up to BLOCK_DOCUMENTS
+lines, one JSON document per line; the index maps every document key
+(the file name it would have in the per-file layout, without ``.json``, e.g.
+``202509``, ``Juryo/202509`` or ``8850``) to its block and line. A block
+is decompressed on its own, so any document can be read without
+inflating the whole shard.
+
+``open_documents`` gives the same read interface over either layout, and
+``python -m code.base_code.snapshot_store pack|unpack`` converts between
+them.
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+
+from . import codec
+from .log_config import configure_logging, stage_logger
+
+SHARD_DIRNAME = "shards"
+INDEX_VERSION = 1
+BLOCK_DOCUMENTS = 64
+SHARD_BYTES = 8 * 1024 * 1024
+SNAPSHOT_FORMAT_ENV_VAR = "SUMO_SNAPSHOT_FORMAT"
+SNAPSHOT_FORMATS = ("files", "shards")
+
+log = stage_logger("SnapshotStore")
+
+
+def snapshot_format():
+    """How the downloaders store documents: $SUMO_SNAPSHOT_FORMAT, else files."""
+    value = os.environ.get(SNAPSHOT_FORMAT_ENV_VAR, "files") or "files"
+    if value not in SNAPSHOT_FORMATS:
+        raise ValueError(
+            f"{SNAPSHOT_FORMAT_ENV_VAR} must be one of {', '.join(SNAPSHOT_FORMATS)}"
+        )
+    return value
+
+
+def shard_dir(folder_path):
+    """``<snapshot>/shards`` for a snapshot's basho/ or rikishi/ folder."""
+    return os.path.join(os.path.dirname(os.path.normpath(folder_path)), SHARD_DIRNAME)
+
+
+def index_path(folder_path):
+    kind = os.path.basename(os.path.normpath(folder_path))
+    return os.path.join(shard_dir(folder_path), f"{kind}.index.json")
+
+
+def document_key(folder_path, file_path):
+    relative = os.path.relpath(file_path, folder_path)
+    return relative.replace(os.sep, "/").split(".json")[0]
+
+
+class ShardWriter:
+    """Append documents of one kind to a snapshot's shards.
+
+    Thread safe, as the downloaders save from a thread pool. Documents
+    already packed stay readable; a key written again points at its new
+    copy. ``close`` flushes the last block and writes the index.
+    """
+
+    def __init__(self, folder_path, block_documents=BLOCK_DOCUMENTS):
+        self.folder_path = folder_path
+        self.kind = os.path.basename(os.path.normpath(folder_path))
+        self.directory = shard_dir(folder_path)
+        self.block_documents = block_documents
+        self.shards = []
+        self.blocks = []
+        self.documents = {}
+        existing = index_path(folder_path)
+        if os.path.exists(existing):
+            index = codec.read_json(existing)
+            if index.get("version") == INDEX_VERSION:
+                self.shards = index["shards"]
+                self.blocks = index["blocks"]
+                self.documents = index["documents"]
+        self._pending = []
+        # Bytes in the shard being appended to; None until one is started
+        self._shard_bytes = None
+        self._lock = threading.Lock()
+
+    def add(self, key, body):
+        # One document per line; the API sends compact JSON already
+        if b"\n" in body:
+            body = codec.dumps(codec.loads(body))
+        with self._lock:
+            self._pending.append((key, body))
+            if len(self._pending) >= self.block_documents:
+                self._flush()
+
+    def _start_shard(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.kind}-{len(self.shards):04d}.ndjson.gz"
+        # Truncated, in case an interrupted run left a file of the same name
+        with open(os.path.join(self.directory, name), "wb"):
+            pass
+        self.shards.append(name)
+        self._shard_bytes = 0
+
+    def _flush(self):
+        if not self._pending:
+            return
+        if self._shard_bytes is None or self._shard_bytes >= SHARD_BYTES:
+            self._start_shard()
+        block = gzip.compress(b"".join(body + b"\n" for _, body in self._pending))
+        # Opened per block, so no handle outlives a write
+        with open(os.path.join(self.directory, self.shards[-1]), "ab") as file:
+            file.write(block)
+        self.blocks.append([len(self.shards) - 1, self._shard_bytes, len(block)])
+        self._shard_bytes += len(block)
+        for line, (key, _) in enumerate(self._pending):
+            self.documents[key] = [len(self.blocks) - 1, line]
+        self._pending = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._shard_bytes = None
+            if not self.documents:
+                return None
+            # Written last, so readers never see blocks that aren't on disk
+            path = index_path(self.folder_path)
+            codec.write_json(
+                f"{path}.tmp",
+                {
+                    "version": INDEX_VERSION,
+                    "kind": self.kind,
+                    "shards": self.shards,
+                    "blocks": self.blocks,
+                    "documents": self.documents,
+                },
+            )
+            os.replace(f"{path}.tmp", path)
+            return path
+
+
+class ShardReader:
+    """Read a packed snapshot folder: by key, or streamed in storage order."""
+
+    def __init__(self, folder_path, cached_blocks=8):
+        self.folder_path = folder_path
+        self.directory = shard_dir(folder_path)
+        index = codec.read_json(index_path(folder_path))
+        self.shards = index["shards"]
+        self.blocks = index["blocks"]
+        self.documents = index["documents"]
+        self.cached_blocks = cached_blocks
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, key):
+        return key in self.documents
+
+    def keys(self):
+        return sorted(self.documents)
+
+    def get(self, key):
+        location = self.documents.get(key)
+        if location is None:
+            return None
+        block, line = location
+        return self._block(block)[line]
+
+    def _block(self, block):
+        # Keys are mostly read in order, so a few decoded blocks go a long way
+        lines = self._cache.get(block)
+        if lines is None:
+            shard, offset, length = self.blocks[block]
+            with open(os.path.join(self.directory, self.shards[shard]), "rb") as f:
+                f.seek(offset)
+                lines = gzip.decompress(f.read(length)).split(b"\n")
+            self._cache[block] = lines
+            if len(self._cache) > self.cached_blocks:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(block)
+        return lines
+
+    def __iter__(self):
+        """(key, body) for every document, reading each shard front to back."""
+        live = defaultdict(list)
+        for key, (block, line) in self.documents.items():
+            live[block].append((line, key))
+        shard_blocks = defaultdict(list)
+        for block in sorted(live):
+            shard_blocks[self.blocks[block][0]].append(block)
+        for shard in sorted(shard_blocks):
+            path = os.path.join(self.directory, self.shards[shard])
+            with open(path, "rb") as file:
+                for block in shard_blocks[shard]:
+                    _, offset, length = self.blocks[block]
+                    file.seek(offset)
+                    lines = gzip.decompress(file.read(length)).split(b"\n")
+                    for line, key in sorted(live[block]):
+                        yield key, lines[line]
+
+
+class FileDocuments:
+    """The per-file layout behind the ShardReader interface.
+
+    Covers ``*.json`` in the folder and one level of subfolders (the lower
+    division banzuke in basho/<Division>/).
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+
+    def _paths(self):
+        if not os.path.isdir(self.folder_path):
+            return
+        for entry in os.scandir(self.folder_path):
+            if entry.is_file() and entry.name.endswith(".json"):
+                yield entry.path
+            elif entry.is_dir():
+                for child in os.scandir(entry.path):
+                    if child.is_file() and child.name.endswith(".json"):
+                        yield child.path
+
+    def __len__(self):
+        return sum(1 for _ in self._paths())
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def path(self, key):
+        return os.path.join(self.folder_path, *key.split("/")) + ".json"
+
+    def keys(self):
+        return sorted(document_key(self.folder_path, path) for path in self._paths())
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def __iter__(self):
+        for path in self._paths():
+            with open(path, "rb") as file:
+                yield document_key(self.folder_path, path), file.read()
+
+
+def is_packed(folder_path):
+    return os.path.exists(index_path(folder_path))
+
+
+def open_documents(folder_path):
+    """A snapshot folder's documents, from its shards if it has been packed."""
+    if is_packed(folder_path):
+        return ShardReader(folder_path)
+    return FileDocuments(folder_path)
+
+
+def pack(folder_path, remove_files=False):
+    """Write every file of ``folder_path`` into fresh shards, in key order."""
+    files = FileDocuments(folder_path)
+    keys = files.keys()
+    if not keys:
+        return 0
+    if is_packed(folder_path):
+        os.remove(index_path(folder_path))
+    directory = shard_dir(folder_path)
+    kind = os.path.basename(os.path.normpath(folder_path))
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith(f"{kind}-"):
+                os.remove(os.path.join(directory, name))
+    writer = ShardWriter(folder_path)
+    for key in keys:
+        writer.add(key, files.get(key))
+    writer.close()
+    if remove_files:
+        for key in keys:
+            os.remove(files.path(key))
+    return len(keys)
+
+
+def unpack(folder_path, remove_shards=False):
+    """Write every packed document of ``folder_path`` back to its own file."""
+    reader = ShardReader(folder_path)
+    files = FileDocuments(folder_path)
+    for key, body in reader:
+        path = files.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body)
+    if remove_shards:
+        kind = os.path.basename(os.path.normpath(folder_path))
+        os.remove(index_path(folder_path))
+        for name in reader.shards:
+            os.remove(os.path.join(reader.directory, name))
+        if not os.listdir(reader.directory):
+            shutil.rmtree(reader.directory)
+        log.info("Removed the %s shards", kind)
+    return len(reader)
+
+
+def main(argv=None):
+    from .base_classes import get_data_root
+
+    parser = argparse.ArgumentParser(
+        description="Convert a snapshot between per-file JSON and packed shards"
+    )
+    parser.add_argument("action", choices=("pack", "unpack"))
+    parser.add_argument("--snapshot", help="YYYYMM (default: the latest)")
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Delete the source layout once converted",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+    data_path = get_data_root()
+    snapshot = args.snapshot or max(
+        d for d in os.listdir(data_path) if d.isdigit() and len(d) == 6
+    )
+    for kind in ("basho", "rikishi"):
+        folder_path = os.path.join(data_path, snapshot, kind)
+        if args.action == "pack":
+            count = pack(folder_path, remove_files=args.remove)
+        elif is_packed(folder_path):
+            count = unpack(folder_path, remove_shards=args.remove)
+        else:
+            count = 0
+        print(f"{args.action}ed {count} {kind} documents of {snapshot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Ingest validation of API payloads against the schemas in schemas/.
+
+Each schema is compiled once into nested closures, so checking a document
+is a walk over it with no per-call schema interpretation, and error
+messages are only built for documents that fail. Only the
+keywords the schemas use are supported (type, properties, required,
+items), and compiling a schema with any other constraint fails rather
+than silently ignoring it.
+"""
+
+import functools
+import logging
+import os
+import random
+
+from . import codec
+
+SCHEMA_DIR = os.path.join(os.path.dirname(__file__), "schemas")
+SAMPLE_RATE_ENV_VAR = "SUMO_VALIDATE_SAMPLE"
+# Annotations, not constraints ("optional" is the schemas' own marker)
+IGNORED_KEYWORDS = {"$schema", "title", "description", "format", "optional"}
+SUPPORTED_KEYWORDS = {"type", "properties", "required", "items"}
+# Errors kept per document; one is enough to reject it
+MAX_ERRORS = 10
+
+TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        or isinstance(value, float)
+        and value.is_integer()
+    ),
+    "number": lambda value: (
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+    ),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+# Exact types decoded JSON uses for each schema type, for the fast path
+# (bool is not an int here; an integral float falls back to TYPE_CHECKS)
+JSON_TYPES = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+_MISSING = object()
+
+
+def schema_path(kind):
+    return os.path.join(SCHEMA_DIR, f"{kind}.json")
+
+
+def compile_schema(schema):
+    """Compile ``schema`` into ``(is_valid, report)``.
+
+    ``is_valid(value)`` only answers yes or no and allocates nothing, for
+    the common case; ``report(value, path, errors)`` appends readable
+    errors and is only run on documents that failed.
+    """
+    unknown = set(schema) - SUPPORTED_KEYWORDS - IGNORED_KEYWORDS
+    if unknown:
+        raise ValueError(f"Unsupported schema keywords: {', '.join(sorted(unknown))}")
+    types = schema.get("type")
+    if isinstance(types, str):
+        types = [types]
+    exact_types = (
+        frozenset(t for name in types for t in JSON_TYPES[name]) if types else None
+    )
+    type_checks = [TYPE_CHECKS[name] for name in types or ()]
+    required = tuple(schema.get("required", ()))
+    properties = {
+        name: compile_schema(subschema)
+        for name, subschema in schema.get("properties", {}).items()
+    }
+    property_checks = tuple((name, fast) for name, (fast, _) in properties.items())
+    items = compile_schema(schema["items"]) if "items" in schema else None
+    item_check = items[0] if items else None
+
+    def type_ok(value):
+        if exact_types is None or type(value) in exact_types:
+            return True
+        return any(type_check(value) for type_check in type_checks)
+
+    def is_leaf_valid(value):
+        return type(value) in exact_types or type_ok(value)
+
+    def is_valid(value):
+        if (
+            exact_types is not None
+            and type(value) not in exact_types
+            and not type_ok(value)
+        ):
+            return False
+        if type(value) is dict:
+            for name in required:
+                if name not in value:
+                    return False
+            for name, check in property_checks:
+                member = value.get(name, _MISSING)
+                if member is not _MISSING and not check(member):
+                    return False
+        elif item_check is not None and type(value) is list:
+            for item in value:
+                if not item_check(item):
+                    return False
+        return True
+
+    if exact_types is not None and not (required or properties or items):
+        # Most of a document is leaves, which only need the type check
+        is_valid = is_leaf_valid
+
+    def report(value, path, errors):
+        if not type_ok(value):
+            expected = " or ".join(types)
+            errors.append(f"{path}: {value!r:.40} is not of type {expected}")
+            return
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: {name!r} is a required property")
+            for name, (check, report_member) in properties.items():
+                if name in value and not check(value[name]):
+                    report_member(value[name], f"{path}.{name}", errors)
+        elif items is not None and isinstance(value, list):
+            for position, item in enumerate(value):
+                if not item_check(item):
+                    items[1](item, f"{path}[{position}]", errors)
+                    if len(errors) >= MAX_ERRORS:
+                        return
+
+    return is_valid, report
+
+
+@functools.cache
+def compiled_schema(kind):
+    return compile_schema(codec.read_json(schema_path(kind)))
+
+
+def validate(kind, document):
+    """Error messages for ``document`` against the ``kind`` schema (empty if valid)."""
+    is_valid, report = compiled_schema(kind)
+    if is_valid(document):
+        return []
+    errors = []
+    report(document, "$", errors)
+    return errors
+
+
+def sample_rate():
+    """Share of documents to validate: $SUMO_VALIDATE_SAMPLE, else all of them."""
+    rate = float(os.environ.get(SAMPLE_RATE_ENV_VAR, "1") or "1")
+    if not 0 <= rate <= 1:
+        raise ValueError(f"{SAMPLE_RATE_ENV_VAR} must be between 0 and 1")
+    return rate
+
+
+class IngestValidator:
+    """Validate documents on their way into a snapshot, quarantining failures.
+
+    A rejected body goes to ``quarantine_dir`` (as ``<key>.json``, next to
+    ``<key>.errors.json``) instead of the snapshot, so the builders never
+    see it. With a ``sample_rate`` below 1 only that share of documents is
+    checked. Time spent is recorded per document in ``metrics``.
+    """
+
+    def __init__(self, kind, quarantine_dir, metrics, sample_rate=1.0, rng=None):
+        self.kind = kind
+        self.quarantine_dir = quarantine_dir
+        self.metrics = metrics
+        self.sample_rate = sample_rate
+        self.rng = rng or random.Random()
+        # Compiled here rather than on the first download thread
+        compiled_schema(kind)
+
+    def check(self, key, document, body):
+        """True if the document may be saved."""
+        if self.sample_rate < 1 and self.rng.random() >= self.sample_rate:
+            self.metrics.inc("validation_skipped")
+            return True
+        with self.metrics.timer("validation_seconds"):
+            errors = validate(self.kind, document)
+        self.metrics.inc("documents_validated")
+        if not errors:
+            return True
+        self.quarantine(key, body, errors)
+        return False
+
+    def quarantine(self, key, body, errors):
+        path = os.path.join(self.quarantine_dir, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.json", "wb") as file:
+            file.write(body)
+        codec.write_json(f"{path}.errors.json", errors)
+        self.metrics.inc("documents_quarantined")
+        logging.getLogger(__name__).error(
+            "Quarantined %s %s: %s",
+            self.kind,
+            key,
+            errors[0],
+            extra={"key": key, "errors": len(errors)},
+        )
+
+    def summary(self):
+        validated = self.metrics.counters.get("documents_validated", 0)
+        histogram = self.metrics.histograms.get("validation_seconds")
+        seconds = histogram.sum if histogram else 0.0
+        return {
+            "validated": validated,
+            "skipped": self.metrics.counters.get("validation_skipped", 0),
+            "quarantined": self.metrics.counters.get("documents_quarantined", 0),
+            "mean_microseconds": round(1e6 * seconds / validated, 1)
+            if validated
+            else None,
+        }
@@ -0,0 +1,211 @@
+import os
+import socket
+import sqlite3
+import time
+from typing import NamedTuple
+
+from . import codec
+
+QUEUE_ENV_VAR = "SUMO_WORK_QUEUE"
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (stage, payload)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (stage, state, lease_expires);
+"""
+
+
+class Task(NamedTuple):
+    id: int
+    stage: str
+    payload: object
+    attempts: int
+
+
+def worker_name():
+    """Identifies a lease holder across hosts sharing the queue file."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """A durable task queue in one SQLite file, shared by worker processes.
+
+    Workers claim tasks under a lease. A task whose worker dies goes back to
+    the queue once its lease expires, and a task that keeps failing is
+    parked as ``failed`` after ``max_attempts``. Only the current lease
+    holder can complete a task, so a worker that stalled past its lease
+    can't mark work done that another worker has picked up since. Workers
+    running a long task renew its lease with ``extend``.
+
+    Tasks are unique per (stage, payload), so enqueueing is idempotent.
+    Work is processed at least once; the stages it runs are idempotent
+    (file writes, MERGE).
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS, clock=time.time):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.clock = clock
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Transactions are explicit (BEGIN IMMEDIATE), so claims from several
+        # processes serialise on SQLite's write lock. The rollback journal
+        # needs only file locks; WAL's shared memory index would not be
+        # shared between hosts on a network filesystem
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode = DELETE")
+        self.connection.executescript(SCHEMA)
+
+    @classmethod
+    def default_path(cls):
+        from .base_classes import get_project_root
+
+        return os.environ.get(
+            QUEUE_ENV_VAR, str(get_project_root() / "state" / "work_queue.sqlite")
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def enqueue(self, stage, payloads, reset=False):
+        """Add tasks; with ``reset``, tasks already there start over."""
+        now = self.clock()
+        rows = [(stage, codec.dumps(payload).decode(), now) for payload in payloads]
+        connection = self._transaction()
+        try:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (stage, payload, updated_at) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            added = connection.total_changes - before
+            if reset:
+                connection.executemany(
+                    "UPDATE tasks SET state = 'pending', attempts = 0, "
+                    "lease_owner = NULL, lease_expires = NULL, last_error = NULL, "
+                    "updated_at = ? WHERE stage = ? AND payload = ?",
+                    [(now, stage, payload) for stage, payload, now in rows],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def claim(self, stage, owner, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease up to ``limit`` pending (or abandoned) tasks of ``stage``."""
+        now = self.clock()
+        connection = self._transaction()
+        try:
+            rows = connection.execute(
+                "SELECT id, payload, attempts FROM tasks WHERE stage = ? AND "
+                "(state = 'pending' OR (state = 'leased' AND lease_expires <= ?)) "
+                "ORDER BY id LIMIT ?",
+                (stage, now, limit),
+            ).fetchall()
+            tasks = []
+            for task_id, payload, attempts in rows:
+                if attempts >= self.max_attempts:
+                    # Its last worker died holding it; don't hand it out again
+                    connection.execute(
+                        "UPDATE tasks SET state = 'failed', lease_owner = NULL, "
+                        "last_error = coalesce(last_error, 'lease expired'), "
+                        "updated_at = ? WHERE id = ?",
+                        (now, task_id),
+                    )
+                    continue
+                connection.execute(
+                    "UPDATE tasks SET state = 'leased', lease_owner = ?, "
+                    "lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (owner, now + lease_seconds, now, task_id),
+                )
+                tasks.append(Task(task_id, stage, codec.loads(payload), attempts + 1))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return tasks
+
+    def _update_leased(self, task, owner, sql, params):
+        connection = self._transaction()
+        try:
+            changed = connection.execute(
+                f"{sql} WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                (*params, task.id, owner),
+            ).rowcount
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return bool(changed)
+
+    def extend(self, task, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Renew the lease; False if it was lost to another worker meanwhile."""
+        now = self.clock()
+        return self._update_leased(
+            task,
+            owner,
+            "UPDATE tasks SET lease_expires = ?, updated_at = ?",
+            (now + lease_seconds, now),
+        )
+
+    def complete(self, task, owner):
+        """Mark done; False if the lease was lost to another worker meanwhile."""
+        return self._update_leased(
+            task,
+            owner,
+            "UPDATE tasks SET state = 'done', lease_owner = NULL, updated_at = ?",
+            (self.clock(),),
+        )
+
+    def fail(self, task, owner, error):
+        """Release the task for a retry, or park it once out of attempts."""
+        state = "failed" if task.attempts >= self.max_attempts else "pending"
+        return self._update_leased(
+            task,
+            owner,
+            "UPDATE tasks SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+            "last_error = ?, updated_at = ?",
+            (state, str(error)[:1000], self.clock()),
+        )
+
+    def remaining(self, stage):
+        """Tasks of ``stage`` not yet done or failed (including leased ones)."""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE stage = ? "
+            "AND state IN ('pending', 'leased')",
+            (stage,),
+        ).fetchone()[0]
+
+    def stats(self):
+        """{stage: {state: count}}."""
+        stats = {}
+        for stage, state, count in self.connection.execute(
+            "SELECT stage, state, COUNT(*) FROM tasks GROUP BY stage, state"
+        ):
+            stats.setdefault(stage, {})[state] = count
+        return stats
+
+    def failures(self, stage):
+        return self.connection.execute(
+            "SELECT payload, attempts, last_error FROM tasks "
+            "WHERE stage = ? AND state = 'failed' ORDER BY id",
+            (stage,),
+        ).fetchall()
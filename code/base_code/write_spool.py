@@ -0,0 +1,411 @@
+"""A write-ahead spool between the builders and Neo4j.
+
+With ``SUMO_GRAPH_SINK=spool`` a builder's writes are appended to segment
+files under ``state/write_spool/`` (or $SUMO_WRITE_SPOOL) instead of being
+sent to Aura, so extraction runs at its own speed whether or not the
+database is up. ``python -m code.base_code.write_spool drain`` replays the
+segments into Neo4j in order, one transaction per batch, and records how
+far it got in ``ack.json`` after each one; fully replayed segments are
+deleted. If Neo4j goes away the drainer waits and retries the same batch,
+so nothing is lost, and a drainer that is restarted carries on from the
+last acknowledged batch. A batch can be replayed twice after a crash
+between commit and acknowledgement, which the builders' MERGE writes
+tolerate.
+
+A segment is NDJSON. Each query text is written once per segment, as
+``{"define": id, "text": query}``, and the writes that use it as
+``{"q": id, "o": operation, "p": params}``. A writer appends to
+``<created>-<pid>.open`` and renames it to ``.seg`` once it has been
+synced, when it reaches SEGMENT_BYTES or the builder closes. The drainer
+follows an open segment as it grows but doesn't move past it until it is
+sealed, or its writer process has died, so writes are replayed in the order
+they were made.
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from . import codec
+from .graph_sinks import CREATE_INDEX, GraphSink
+from .log_config import configure_logging, stage_logger
+from .metrics import StageMetrics
+
+SPOOL_ENV_VAR = "SUMO_WRITE_SPOOL"
+SEGMENT_BYTES = 4 * 1024 * 1024
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".seg"
+ACK_FILENAME = "ack.json"
+DEFAULT_BATCH_SIZE = 500
+MAX_BACKOFF_SECONDS = 60
+
+log = stage_logger("SpoolDrainer")
+
+
+def default_spool_dir():
+    from .base_classes import get_project_root
+
+    return os.environ.get(
+        SPOOL_ENV_VAR, str(get_project_root() / "state" / "write_spool")
+    )
+
+
+def _to_native(value):
+    # numpy scalars that came out of a DataFrame
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Can't spool a {type(value).__name__}")
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SpoolWriter:
+    """Append writes to this process's current segment. Thread safe."""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        # A raw descriptor: each os.write reaches the OS without buffering
+        self._fd = None
+        self._size = 0
+        self._path = None
+        self._query_ids = {}
+        self._lock = threading.Lock()
+
+    def _open_segment(self):
+        name = f"{time.time_ns():020d}-{os.getpid()}{OPEN_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = 0
+        self._query_ids = {}
+
+    def append(self, query, params, operation=None):
+        """Spool one write; returns the bytes appended."""
+        with self._lock:
+            if self._fd is None:
+                self._open_segment()
+            lines = []
+            query_id = self._query_ids.get(query)
+            if query_id is None:
+                query_id = self._query_ids[query] = len(self._query_ids)
+                lines.append(codec.dumps({"define": query_id, "text": query}))
+            lines.append(
+                codec.dumps(
+                    {"q": query_id, "o": operation, "p": params}, default=_to_native
+                )
+            )
+            data = b"\n".join(lines) + b"\n"
+            # Handed to the OS on every write, so a crash of this process loses
+            # nothing and the drainer sees each write straight away
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view) :]
+            self._size += len(data)
+            if self._size >= self.segment_bytes:
+                self._seal()
+            return len(data)
+
+    def flush(self):
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+
+    def _seal(self):
+        os.fsync(self._fd)
+        os.close(self._fd)
+        os.replace(self._path, self._path[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        self._fd = None
+        self._path = None
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._seal()
+
+
+class SpoolGraphSink(GraphSink):
+    """Spool every write for the drainer; nothing is read back (returns None)."""
+
+    def __init__(self, writer, metrics=None):
+        self.writer = writer
+        self.metrics = metrics
+
+    def run(self, query, params, operation=None):
+        written = self.writer.append(query, params, operation)
+        if self.metrics is not None:
+            self.metrics.inc("spooled_writes")
+            self.metrics.inc("spooled_bytes", written)
+
+    def close(self):
+        self.writer.close()
+
+
+class Segment:
+    def __init__(self, directory, filename):
+        self.path = os.path.join(directory, filename)
+        self.name, suffix = os.path.splitext(filename)
+        self.sealed = suffix == SEALED_SUFFIX
+        self.pid = int(self.name.rsplit("-", 1)[1])
+
+    def finished(self):
+        """No more writes will arrive: sealed, or its writer is gone."""
+        return self.sealed or not _process_alive(self.pid)
+
+
+class SpoolDrainer:
+    """Replay a spool's segments, in order, through ``apply_batch``.
+
+    ``apply_batch(records)`` gets a list of (query, params, operation) and
+    must apply all of them or raise. Errors in ``retry_on`` are treated as
+    the database being unavailable: the batch is retried with backoff.
+    Anything else stops the drainer with the batch unacknowledged.
+    """
+
+    def __init__(
+        self,
+        directory,
+        apply_batch,
+        batch_size=DEFAULT_BATCH_SIZE,
+        retry_on=(),
+        metrics=None,
+        sleep=time.sleep,
+    ):
+        self.directory = directory
+        self.apply_batch = apply_batch
+        self.batch_size = batch_size
+        self.retry_on = tuple(retry_on)
+        self.metrics = metrics or StageMetrics("SpoolDrainer")
+        self.sleep = sleep
+        self.ack_path = os.path.join(directory, ACK_FILENAME)
+
+    def segments(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            (
+                Segment(self.directory, filename)
+                for filename in os.listdir(self.directory)
+                if filename.endswith((OPEN_SUFFIX, SEALED_SUFFIX))
+            ),
+            key=lambda segment: segment.name,
+        )
+
+    def read_ack(self):
+        if not os.path.exists(self.ack_path):
+            return "", 0
+        ack = codec.read_json(self.ack_path)
+        return ack["segment"], ack["offset"]
+
+    def write_ack(self, name, offset):
+        temporary_path = f"{self.ack_path}.tmp"
+        codec.write_json(temporary_path, {"segment": name, "offset": offset})
+        os.replace(temporary_path, self.ack_path)
+
+    def pending_bytes(self):
+        acked_name, acked_offset = self.read_ack()
+        total = 0
+        for segment in self.segments():
+            size = os.path.getsize(segment.path)
+            if segment.name == acked_name:
+                size -= acked_offset
+            elif segment.name < acked_name:
+                size = 0
+            total += size
+        return total
+
+    def drain(self, follow=False, poll_seconds=1.0):
+        """Replay everything written so far; with ``follow``, keep waiting for more.
+
+        Returns the number of writes replayed.
+        """
+        replayed = 0
+        while True:
+            count = self._drain_once()
+            replayed += count
+            if not follow:
+                return replayed
+            if not count:
+                self.sleep(poll_seconds)
+
+    def _drain_once(self):
+        acked_name, acked_offset = self.read_ack()
+        replayed = 0
+        for segment in self.segments():
+            if segment.name < acked_name:
+                # Replayed already; the drainer stopped before deleting it
+                os.remove(segment.path)
+                continue
+            offset = acked_offset if segment.name == acked_name else 0
+            # Checked before reading, so nothing written after it is missed
+            finished = segment.finished()
+            try:
+                replayed += self._replay_segment(segment, offset)
+            except FileNotFoundError:
+                # Sealed (renamed) since it was listed; picked up next pass
+                break
+            if not finished:
+                break
+            self.metrics.inc("segments_drained")
+            os.remove(segment.path)
+        return replayed
+
+    def _replay_segment(self, segment, offset):
+        queries = {}
+        replayed = 0
+        with open(segment.path, "rb") as file:
+            if offset:
+                # Query texts defined before the acknowledged position
+                for line in file.read(offset).splitlines():
+                    entry = codec.loads(line)
+                    if "define" in entry:
+                        queries[entry["define"]] = entry["text"]
+            batch = []
+            position = offset
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # Still being written, or cut short by a crashed writer
+                    break
+                position += len(line)
+                entry = codec.loads(line)
+                if "define" in entry:
+                    queries[entry["define"]] = entry["text"]
+                    continue
+                batch.append((queries[entry["q"]], entry["p"], entry["o"]))
+                if len(batch) >= self.batch_size:
+                    self._apply(batch)
+                    self.write_ack(segment.name, position)
+                    replayed += len(batch)
+                    batch = []
+            if batch:
+                self._apply(batch)
+                replayed += len(batch)
+            if position > offset:
+                self.write_ack(segment.name, position)
+        return replayed
+
+    def _apply(self, batch):
+        delay = 1
+        while True:
+            try:
+                with self.metrics.timer("batch_write_seconds"):
+                    self.apply_batch(batch)
+            except self.retry_on as e:
+                self.metrics.inc("drain_retries")
+                log.warning("Graph unavailable (%s), retrying in %ss", e, delay)
+                self.sleep(delay)
+                delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+                continue
+            self.metrics.inc("writes_replayed", len(batch))
+            self.metrics.inc("batches_replayed")
+            return
+
+
+def sink_applier(sink):
+    """apply_batch for a GraphSink (the in-memory graph in dry runs and tests)."""
+
+    def apply_batch(records):
+        for query, params, operation in records:
+            sink.run(query, params, operation=operation)
+
+    return apply_batch
+
+
+def neo4j_applier(driver):
+    """apply_batch that runs a batch's data writes in Neo4j write transactions.
+
+    Neo4j won't mix schema and data writes in one transaction, so index
+    writes run on their own, auto-committed, and the data writes either side
+    of them go in separate transactions. Index writes are IF NOT EXISTS, so
+    a batch replayed after a crash part way through is still safe.
+    """
+
+    def write_batch(tx, records):
+        for query, params, _ in records:
+            tx.run(query, **params).consume()
+
+    def apply_batch(records):
+        with driver.session() as session:
+            pending = []
+            for record in records:
+                query, params, operation = record
+                if operation != CREATE_INDEX:
+                    pending.append(record)
+                    continue
+                if pending:
+                    session.execute_write(write_batch, pending)
+                    pending = []
+                session.run(query, **params).consume()
+            if pending:
+                session.execute_write(write_batch, pending)
+
+    return apply_batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay spooled builder writes into Neo4j"
+    )
+    parser.add_argument("action", choices=("drain", "status"))
+    parser.add_argument("--spool", help="Spool directory (default state/write_spool)")
+    parser.add_argument(
+        "--follow", action="store_true", help="Keep draining new writes until stopped"
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    directory = args.spool or default_spool_dir()
+
+    if args.action == "status":
+        drainer = SpoolDrainer(directory, apply_batch=None)
+        segments = drainer.segments()
+        open_segments = sum(1 for segment in segments if not segment.sealed)
+        print(
+            f"{len(segments)} segments ({open_segments} open), "
+            f"{drainer.pending_bytes()} bytes to replay"
+        )
+        return
+
+    from dotenv import load_dotenv
+    from neo4j import GraphDatabase
+    from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+    configure_logging()
+    load_dotenv()
+    driver = GraphDatabase.driver(
+        os.environ.get("uri"),
+        auth=(os.environ.get("username"), os.environ.get("password")),
+    )
+    metrics = StageMetrics("SpoolDrainer")
+    drainer = SpoolDrainer(
+        directory,
+        neo4j_applier(driver),
+        batch_size=args.batch_size,
+        retry_on=(ServiceUnavailable, SessionExpired, TransientError),
+        metrics=metrics,
+    )
+    try:
+        replayed = drainer.drain(follow=args.follow)
+        log.info("Replayed %s writes", replayed)
+    except KeyboardInterrupt:
+        log.info("Stopped; the next drain carries on from the last acknowledged batch")
+    finally:
+        driver.close()
+        if not metrics.is_empty():
+            from .base_classes import get_project_root
+
+            metrics.write_report(
+                os.environ.get("SUMO_METRICS_DIR", str(get_project_root() / "metrics"))
+            )
+
+
+if __name__ == "__main__":
+    main()
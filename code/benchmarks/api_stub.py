@@ -0,0 +1,110 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BANZUKE_PATH = re.compile(r"^/api/basho/(\d{6})/banzuke/(\w+)$")
+RIKISHI_PATH = re.compile(r"^/api/rikishi/(\d+)$")
+
+
+class SumoApiStub:
+    """Local stand-in for the sumo-api banzuke and rikishi endpoints.
+
+    Serves documents from a snapshot directory (``<snapshot>/basho`` and
+    ``<snapshot>/rikishi``) with a fixed ``latency`` in seconds per request
+    and a random ``error_rate`` of HTTP 500 responses.
+    """
+
+    def __init__(self, snapshot_dir, latency=0.0, error_rate=0.0, seed=0, port=0):
+        self.snapshot_dir = snapshot_dir
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.request_count = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    @property
+    def banzuke_url(self):
+        # Same shape as SumoApiQuery.base_url
+        return self.base_url + "/basho/{}/banzuke/Makuuchi"
+
+    @property
+    def rikishi_url(self):
+        return self.base_url + "/rikishi/{}?intai=true"
+
+    def _should_fail(self):
+        with self._random_lock:
+            self.request_count += 1
+            return self.random.random() < self.error_rate
+
+    def _load(self, kind, document_id):
+        path = os.path.join(self.snapshot_dir, kind, f"{document_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return file.read()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._should_fail():
+                    self._send(500, b'{"error":"INTERNAL"}')
+                    return
+                path = self.path.split("?", 1)[0]
+                banzuke = BANZUKE_PATH.match(path)
+                rikishi = RIKISHI_PATH.match(path)
+                if banzuke:
+                    # The real API answers unknown bashos with an empty body
+                    self._send(200, stub._load("basho", banzuke.group(1)) or b"")
+                elif rikishi:
+                    body = stub._load("rikishi", rikishi.group(1))
+                    if body is None:
+                        body = json.dumps({"error": "INVALID_RIKISHI_ID"}).encode()
+                    self._send(200, body)
+                else:
+                    self._send(404, b'{"error":"NOT_FOUND"}')
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Keep benchmark output clean
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -0,0 +1,426 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from ..base_code import codec
+from ..base_code.base_classes import SumoApiQuery, get_project_root
+from ..base_code.profiling import get_git_revision
+from ..base_code.snapshot_store import SHARD_DIRNAME, open_documents, pack
+from ..dry_run import DRY_RUN_STAGES, run_dry_run
+from ..node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+from ..relationship_builders.create_rikishi_rank_history import (
+    RANK_RANGE_QUERIES,
+    RANK_STORAGE,
+    AuraDBLoaderRikishiRankHistory,
+    rank_history_between,
+)
+from .api_stub import SumoApiStub
+from .synthetic_data import SyntheticSumoData
+
+SCENARIOS = (
+    "download",
+    "bout_extraction",
+    "graph_writes",
+    "rank_history",
+    "cli_startup",
+    "snapshot_read",
+)
+# Seconds `sumo-graph --help` may add on top of starting the interpreter
+CLI_STARTUP_BUDGET_SECONDS = 0.05
+
+
+@contextmanager
+def environment(**values):
+    """Set environment variables for the block, restoring the old values after."""
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def timed(function):
+    start = time.perf_counter()
+    items = function()
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "items_per_second": round(items / seconds, 2) if seconds else None,
+    }
+
+
+def list_ids(folder_path):
+    return sorted(
+        f.split(".json")[0] for f in os.listdir(folder_path) if f.endswith(".json")
+    )
+
+
+def run_download(snapshot_dir, work_dir, latency, error_rate):
+    basho_ids = list_ids(os.path.join(snapshot_dir, "basho"))
+    rikishi_ids = list_ids(os.path.join(snapshot_dir, "rikishi"))
+    with SumoApiStub(snapshot_dir, latency=latency, error_rate=error_rate) as stub:
+        basho_query = SumoApiQuery(iters=basho_ids)
+        basho_query.base_url = stub.banzuke_url
+        basho_query.schema = "basho"
+        basho_query.output_dir = os.path.join(work_dir, "download", "basho")
+        rikishi_query = SumoApiQuery(iters=rikishi_ids)
+        rikishi_query.base_url = stub.rikishi_url
+        rikishi_query.schema = "rikishi"
+        rikishi_query.output_dir = os.path.join(work_dir, "download", "rikishi")
+
+        def download():
+            basho_query.run_queries()
+            rikishi_query.run_queries()
+            return len(basho_ids) + len(rikishi_ids)
+
+        return timed(download)
+
+
+def run_bout_extraction(snapshot_dir):
+    basho_dir = os.path.join(snapshot_dir, "basho")
+
+    def extract():
+        bouts = 0
+        for basho_id in list_ids(basho_dir):
+            banzuke = codec.read_banzuke(os.path.join(basho_dir, f"{basho_id}.json"))
+            extracted = AuraDBLoaderBoutNodes.extract_bouts(banzuke, basho_id)
+            if extracted is not None:
+                bouts += len(extracted[0]) + len(extracted[1])
+        return bouts
+
+    return timed(extract)
+
+
+def run_graph_writes(snapshot_dir, sink, neo4j_uri):
+    if sink == "memory":
+        result = {}
+
+        def dry_run():
+            result["counts"] = run_dry_run(snapshot_dir)
+            return sum(result["counts"]["nodes"].values()) + sum(
+                result["counts"]["relationships"].values()
+            )
+
+        result.update(timed(dry_run))
+        return result
+    if not neo4j_uri:
+        return {"skipped": "pass --neo4j-uri to benchmark graph writes"}
+    # AuraDBLoader reads its connection settings from the environment
+    with environment(uri=neo4j_uri):
+        loader = AuraDBLoaderBoutNodes()
+    try:
+
+        def write():
+            loader.load_jsons_from_folder_and_create_bout_nodes(
+                os.path.join(snapshot_dir, "basho")
+            )
+            return loader.metrics.counters.get("rows_extracted", 0)
+
+        return timed(write)
+    finally:
+        loader.close()
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        "queries": len(latencies),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+        "p95_ms": round(1000 * latencies[int(len(latencies) * 0.95)], 3),
+    }
+
+
+def rank_query_sample(snapshot_dir, queries, seed=0):
+    """(rikishiId, start, end) lookups spanning a random window of bashos."""
+    rng = random.Random(seed)
+    rikishi_ids = [int(i) for i in list_ids(os.path.join(snapshot_dir, "rikishi"))]
+    basho_ids = list_ids(os.path.join(snapshot_dir, "basho"))
+    sample = []
+    for _ in range(queries):
+        first, last = sorted(rng.sample(range(len(basho_ids)), 2))
+        sample.append((rng.choice(rikishi_ids), basho_ids[first], basho_ids[last]))
+    return sample
+
+
+def run_rank_history(snapshot_dir, sink, neo4j_uri, queries=200):
+    """Load time and range-query latency of each rank history storage, by storage."""
+    basho_dir = os.path.join(snapshot_dir, "basho")
+    sample = rank_query_sample(snapshot_dir, queries)
+    results = {}
+    if sink == "neo4j" and not neo4j_uri:
+        skipped = {"skipped": "pass --neo4j-uri to benchmark graph writes"}
+        return {storage: skipped for storage in RANK_STORAGE}
+    if sink == "neo4j":
+        # Expects the Basho and Rikishi nodes to be loaded already
+        settings = {"uri": neo4j_uri}
+    else:
+        settings = {"SUMO_GRAPH_SINK": "memory"}
+    with environment(**settings):
+        for storage in RANK_STORAGE:
+            results[storage] = rank_history_result(
+                snapshot_dir, basho_dir, storage, sink, sample
+            )
+    return results
+
+
+def rank_history_result(snapshot_dir, basho_dir, storage, sink, sample):
+    """Load time and range-query latency of one rank history storage."""
+    loader = AuraDBLoaderRikishiRankHistory()
+    try:
+        if sink == "memory":
+            # Rank history attaches to the Basho and Rikishi node stages
+            for loader_cls, kind, method_name in DRY_RUN_STAGES[:2]:
+                node_loader = loader_cls()
+                node_loader.sink = loader.sink
+                try:
+                    getattr(node_loader, method_name)(os.path.join(snapshot_dir, kind))
+                finally:
+                    node_loader.close()
+        result = timed(lambda: loader.run_create_rank_history(basho_dir, storage))
+        latencies = []
+        if sink == "neo4j":
+            with loader.driver.session() as session:
+                for rikishi_id, start, end in sample:
+                    began = time.perf_counter()
+                    records = list(
+                        session.run(
+                            RANK_RANGE_QUERIES[storage],
+                            rikishiId=rikishi_id,
+                            start=start,
+                            end=end,
+                        )
+                    )
+                    if storage == "arrays" and records and records[0]["bashoIds"]:
+                        low, high = rank_history_between(
+                            records[0]["bashoIds"], start, end
+                        )
+                        records[0]["ranks"][low:high]
+                    latencies.append(time.perf_counter() - began)
+        elif storage == "arrays":
+            # The in-memory graph has no query engine; time the client-side
+            # slice of the array properties, the part arrays add over edges
+            nodes = {
+                node["rikishiID"]: node
+                for node in loader.sink.rikishi_nodes
+                if "rankBashoIds" in node
+            }
+            for rikishi_id, start, end in sample:
+                began = time.perf_counter()
+                node = nodes.get(rikishi_id)
+                if node:
+                    low, high = rank_history_between(node["rankBashoIds"], start, end)
+                    node["ranks"][low:high]
+                latencies.append(time.perf_counter() - began)
+        if latencies:
+            result["query_latency"] = latency_summary(latencies)
+        return result
+    finally:
+        loader.close()
+
+
+def run_cli_startup(repeat=5):
+    """Best-of-``repeat`` wall time of `--help` and of a builder's `--help`."""
+
+    def best_of(*args):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, *args],
+                cwd=str(get_project_root()),
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    interpreter = best_of("-c", "pass")
+    help_seconds = best_of("-m", "code", "--help")
+    noop_seconds = best_of("-m", "code", "bout-nodes", "--help")
+    overhead = max(help_seconds, noop_seconds) - interpreter
+    return {
+        "seconds": round(help_seconds, 4),
+        "noop_seconds": round(noop_seconds, 4),
+        "interpreter_seconds": round(interpreter, 4),
+        "overhead_seconds": round(overhead, 4),
+        "budget_seconds": CLI_STARTUP_BUDGET_SECONDS,
+        "over_budget": overhead > CLI_STARTUP_BUDGET_SECONDS,
+    }
+
+
+def folder_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def run_snapshot_read(snapshot_dir, work_dir):
+    """Read and decode every document, packed into shards and as files.
+
+    Both runs read through the page cache, so this compares syscalls and
+    decoding rather than disk reads.
+    """
+    packed_dir = os.path.join(work_dir, "packed")
+    for kind in ("basho", "rikishi"):
+        shutil.copytree(
+            os.path.join(snapshot_dir, kind), os.path.join(packed_dir, kind)
+        )
+        pack(os.path.join(packed_dir, kind), remove_files=True)
+
+    def read_all(folder):
+        def read():
+            documents = 0
+            for kind in ("basho", "rikishi"):
+                for _, body in open_documents(os.path.join(folder, kind)):
+                    codec.loads(body)
+                    documents += 1
+            return documents
+
+        return read
+
+    files = timed(read_all(snapshot_dir))
+    result = timed(read_all(packed_dir))
+    result["files_seconds"] = files["seconds"]
+    result["shards_bytes"] = folder_bytes(os.path.join(packed_dir, SHARD_DIRNAME))
+    result["files_bytes"] = sum(
+        folder_bytes(os.path.join(snapshot_dir, kind)) for kind in ("basho", "rikishi")
+    )
+    return result
+
+
+def compare_results(current, baseline, threshold):
+    """Return {scenario: relative change in seconds} and the regressed scenarios."""
+    changes = {}
+    regressions = []
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name, {})
+        if "seconds" not in result or not previous.get("seconds"):
+            continue
+        change = (result["seconds"] - previous["seconds"]) / previous["seconds"]
+        changes[name] = round(change, 4)
+        if change > threshold:
+            regressions.append(name)
+    return changes, regressions
+
+
+def run_benchmarks(args):
+    work_dir = tempfile.mkdtemp(prefix="sumo_bench_")
+    os.environ.setdefault("SUMO_METRICS_DIR", os.path.join(work_dir, "metrics"))
+    if args.data_dir:
+        snapshot_dir = args.data_dir
+    else:
+        generator = SyntheticSumoData(scale=args.scale, seed=args.seed)
+        snapshot_dir = generator.write(os.path.join(work_dir, "synthetic"))
+    print(f"Benchmarking against {snapshot_dir}")
+
+    scenarios = {}
+    if "download" in args.scenarios:
+        scenarios["download"] = run_download(
+            snapshot_dir, work_dir, args.latency, args.error_rate
+        )
+    if "bout_extraction" in args.scenarios:
+        scenarios["bout_extraction"] = run_bout_extraction(snapshot_dir)
+    if "graph_writes" in args.scenarios:
+        scenarios["graph_writes"] = run_graph_writes(
+            snapshot_dir, args.sink, args.neo4j_uri
+        )
+    if "rank_history" in args.scenarios:
+        for storage, result in run_rank_history(
+            snapshot_dir, args.sink, args.neo4j_uri
+        ).items():
+            scenarios[f"rank_history_{storage}"] = result
+    if "cli_startup" in args.scenarios:
+        scenarios["cli_startup"] = run_cli_startup()
+    if "snapshot_read" in args.scenarios:
+        scenarios["snapshot_read"] = run_snapshot_read(snapshot_dir, work_dir)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": get_git_revision(),
+            "scale": args.scale,
+            "data_dir": args.data_dir,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "sink": args.sink,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sumo_graph pipeline")
+    parser.add_argument("--scale", type=int, default=1, choices=[1, 10, 100])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--data-dir", help="Use an existing snapshot instead of synthetic data"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--sink",
+        default="memory",
+        choices=["memory", "neo4j"],
+        help="Graph sink for the graph_writes scenario",
+    )
+    parser.add_argument("--neo4j-uri", help="Local Neo4j for --sink neo4j")
+    parser.add_argument(
+        "--output-dir", default=str(get_project_root() / "benchmarks" / "results")
+    )
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown that counts as a regression",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        changes, regressions = compare_results(results, baseline, args.threshold)
+        results["comparison"] = {
+            "baseline": args.baseline,
+            "changes": changes,
+            "regressions": regressions,
+        }
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir, f"bench_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output_path}")
+    if results["scenarios"].get("cli_startup", {}).get("over_budget"):
+        print("CLI startup is over budget")
+        return 1
+    return 1 if results.get("comparison", {}).get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import json
+import os
+import random
+
+# Roughly the shape of the real Makuuchi history: 407 bashos since 1958,
+# ~21 rikishi a side, 15 days, careers of a few dozen tournaments
+REAL_BASHO_COUNT = 407
+RIKISHI_PER_SIDE = 21
+DAYS = 15
+BASHO_MONTHS = ["01", "03", "05", "07", "09", "11"]
+KIMARITE = [
+    "yorikiri",
+    "oshidashi",
+    "hatakikomi",
+    "tsukiotoshi",
+    "uwatenage",
+    "yoritaoshi",
+    "hikiotoshi",
+    "oshitaoshi",
+    "sukuinage",
+    "shitatenage",
+]
+HEYA = ["Isegahama", "Sadogatake", "Nishonoseki", "Kokonoe", "Takadagawa"]
+
+
+class SyntheticSumoData:
+    """Generate basho and rikishi JSON shaped like the sumo-api responses.
+
+    ``scale`` multiplies the number of bashos relative to the real history
+    (1, 10, 100). Output passes the ingest schemas in code/base_code/schemas
+    and uses the same ``<root>/<snapshot>/{basho,rikishi}/<id>.json`` layout
+    as data/.
+    """
+
+    def __init__(self, scale=1, seed=42, snapshot="209901"):
+        self.scale = scale
+        self.snapshot = snapshot
+        self.random = random.Random(seed)
+        self.basho_count = REAL_BASHO_COUNT * scale
+        self.rikishi = {}
+        self._next_rikishi_id = 1
+
+    def basho_ids(self):
+        ids = []
+        year = 1958
+        while len(ids) < self.basho_count:
+            for month in BASHO_MONTHS:
+                if len(ids) == self.basho_count:
+                    break
+                ids.append(f"{year}{month}")
+            year += 1
+        return ids
+
+    def _new_rikishi(self, basho_id):
+        rikishi_id = self._next_rikishi_id
+        self._next_rikishi_id += 1
+        self.rikishi[rikishi_id] = {
+            "id": rikishi_id,
+            "sumodbId": 10000 + rikishi_id,
+            "nskId": 0,
+            "shikonaEn": f"Synthetic{rikishi_id}yama",
+            "shikonaJp": "",
+            "heya": self.random.choice(HEYA),
+            "birthDate": "1990-01-01T00:00:00Z",
+            "shusshin": "Tokyo-to",
+            "height": self.random.randint(170, 195),
+            "weight": self.random.randint(120, 200),
+            "debut": basho_id,
+        }
+        return rikishi_id
+
+    def generate_basho(self, basho_id, roster):
+        """Build one basho document for ``roster`` (2 * RIKISHI_PER_SIDE ids)."""
+        records = {rikishi_id: [] for rikishi_id in roster}
+        for _ in range(DAYS):
+            order = roster[:]
+            self.random.shuffle(order)
+            for rikishi1, rikishi2 in zip(order[0::2], order[1::2]):
+                kimarite = self.random.choice(KIMARITE)
+                winner_first = self.random.random() < 0.5
+                for me, opponent, won in (
+                    (rikishi1, rikishi2, winner_first),
+                    (rikishi2, rikishi1, not winner_first),
+                ):
+                    records[me].append(
+                        {
+                            "result": "win" if won else "loss",
+                            "opponentShikonaEn": self.rikishi[opponent]["shikonaEn"],
+                            "opponentShikonaJp": "",
+                            "opponentID": opponent,
+                            "kimarite": kimarite,
+                        }
+                    )
+
+        def side_entries(side, rikishi_ids, offset):
+            entries = []
+            for position, rikishi_id in enumerate(rikishi_ids):
+                record = records[rikishi_id]
+                wins = sum(1 for bout in record if bout["result"] == "win")
+                entries.append(
+                    {
+                        "side": side,
+                        "rikishiID": rikishi_id,
+                        "shikonaEn": self.rikishi[rikishi_id]["shikonaEn"],
+                        "rankValue": 100 + 2 * position + offset,
+                        "rank": f"Maegashira {position + 1} {side}",
+                        "record": record,
+                        "wins": wins,
+                        "losses": len(record) - wins,
+                        "absences": 0,
+                    }
+                )
+            return entries
+
+        return {
+            "bashoId": basho_id,
+            "division": "Makuuchi",
+            "east": side_entries("East", roster[0::2], 0),
+            "west": side_entries("West", roster[1::2], 1),
+        }
+
+    def generate(self):
+        """Yield (basho_id, basho_document) pairs; rikishi accumulate as a side effect."""
+        roster = []
+        for basho_id in self.basho_ids():
+            # Retire a few rikishi each basho and promote fresh ones
+            retiring = self.random.sample(roster, k=min(len(roster), 3))
+            roster = [rikishi_id for rikishi_id in roster if rikishi_id not in retiring]
+            while len(roster) < 2 * RIKISHI_PER_SIDE:
+                roster.append(self._new_rikishi(basho_id))
+            yield basho_id, self.generate_basho(basho_id, roster)
+
+    def write(self, output_root):
+        """Write a full snapshot under ``output_root`` and return its directory."""
+        snapshot_dir = os.path.join(output_root, self.snapshot)
+        basho_dir = os.path.join(snapshot_dir, "basho")
+        rikishi_dir = os.path.join(snapshot_dir, "rikishi")
+        os.makedirs(basho_dir, exist_ok=True)
+        os.makedirs(rikishi_dir, exist_ok=True)
+        for basho_id, document in self.generate():
+            with open(os.path.join(basho_dir, f"{basho_id}.json"), "w") as file:
+                json.dump(document, file)
+        for rikishi_id, document in self.rikishi.items():
+            with open(os.path.join(rikishi_dir, f"{rikishi_id}.json"), "w") as file:
+                json.dump(document, file)
+        return snapshot_dir
@@ -0,0 +1,160 @@
+"""``sumo-graph``: one entry point for every downloader, builder and tool.
+
+Only the standard library is imported here. A subcommand's module, and with
+it pandas, neo4j, requests and the rest, is imported when that subcommand
+runs, so ``--help`` and argument errors return immediately.
+"""
+
+import argparse
+import os
+import runpy
+import sys
+
+PROG = "sumo-graph"
+
+# name -> (module under this package, help, flags the module reads from
+# sys.argv). None means the module parses its own arguments, so everything
+# after the command name (including --help) is passed through to it.
+COMMANDS = {
+    "download-basho": (
+        "downloaders.basho_downloader",
+        "Download every banzuke since 1958 for the selected divisions",
+        ("--profile",),
+    ),
+    "download-rikishi": (
+        "downloaders.rikishi_downloader",
+        "Download every rikishi on the latest banzuke snapshot",
+        ("--profile",),
+    ),
+    "basho-nodes": (
+        "node_builders.create_basho_nodes",
+        "Create Basho nodes and the NEXT_BASHO chain",
+        ("--profile",),
+    ),
+    "rikishi-nodes": (
+        "node_builders.create_rikishi_nodes",
+        "Create Rikishi nodes",
+        ("--profile",),
+    ),
+    "bout-nodes": (
+        "node_builders.create_bout_nodes",
+        "Create Bout nodes",
+        ("--profile",),
+    ),
+    "basho-bout-relationships": (
+        "relationship_builders.create_basho_bout_relationships",
+        "Link bashos to their bouts (BOUT_EVENT)",
+        ("--profile",),
+    ),
+    "rikishi-bout-relationships": (
+        "relationship_builders.create_rikishi_bout_relationships",
+        "Link rikishi to their bouts (RIKISHI_IN_BOUT_EVENT)",
+        ("--profile",),
+    ),
+    "faced-relationships": (
+        "relationship_builders.create_rikishi_faced_relationships",
+        "Create head-to-head FACED relationships",
+        ("--profile", "--full"),
+    ),
+    "rank-history": (
+        "relationship_builders.create_rikishi_rank_history",
+        "Load banzuke rank history",
+        None,
+    ),
+    "ratings": (
+        "analytics.rating_engine",
+        "Compute Elo ratings",
+        ("--profile", "--full"),
+    ),
+    "gds-analytics": (
+        "analytics.gds_analytics",
+        "Run PageRank, Louvain and node similarity with GDS",
+        ("--profile",),
+    ),
+    "shikona": ("analytics.shikona_index", "Fuzzy shikona lookups", None),
+    "read": ("read_api.graph_reader", "Run a cached read query", None),
+    "export": ("read_api.parquet_export", "Export the graph to Parquet", None),
+    "replica": (
+        "read_api.sqlite_replica",
+        "Build a SQLite replica of a snapshot",
+        None,
+    ),
+    "snapshot": (
+        "base_code.snapshot_store",
+        "Pack a snapshot into shards, or unpack it to files",
+        None,
+    ),
+    "worker": (
+        "pipeline_worker",
+        "Queue stage tasks and run them in worker processes",
+        None,
+    ),
+    "spool": (
+        "base_code.write_spool",
+        "Replay spooled builder writes into Neo4j",
+        None,
+    ),
+    "live": (
+        "downloaders.live_poller",
+        "Poll the current basho and write new bouts as they land",
+        None,
+    ),
+    "dry-run": ("dry_run", "Load a snapshot into an in-memory graph", None),
+    "bench": ("benchmarks.run_benchmarks", "Benchmark the pipeline", None),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog=PROG, description="Pull sumo-api.com data and load it into Neo4j"
+    )
+    parser.add_argument(
+        "--root", help="Project root (default $SUMO_GRAPH_ROOT, else the git root)"
+    )
+    parser.add_argument(
+        "--data-dir", help="Snapshot directory (default $SUMO_DATA_DIR, else data/)"
+    )
+    parser.add_argument(
+        "--divisions",
+        help='Comma separated banzuke divisions or "all" (default $SUMO_DIVISIONS, '
+        "else Makuuchi)",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="<command>")
+    for name, (_, help_text, flags) in COMMANDS.items():
+        if flags is None:
+            subparsers.add_parser(name, help=help_text, add_help=False)
+            continue
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flag in flags:
+            subparser.add_argument(flag, action="store_true")
+    return parser
+
+
+def run_command(name, argv):
+    module = f"{__package__}.{COMMANDS[name][0]}"
+    sys.argv = [f"{PROG} {name}", *argv]
+    runpy.run_module(module, run_name="__main__")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 0
+    flags = COMMANDS[args.command][2]
+    if flags is not None and extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    # Exported so the subcommand, and any process it starts, skips the lookup
+    if args.root:
+        os.environ["SUMO_GRAPH_ROOT"] = os.path.abspath(args.root)
+    if args.data_dir:
+        os.environ["SUMO_DATA_DIR"] = os.path.abspath(args.data_dir)
+    if args.divisions:
+        os.environ["SUMO_DIVISIONS"] = args.divisions
+    if flags is None:
+        forwarded = extra
+    else:
+        forwarded = [flag for flag in flags if getattr(args, flag[2:])]
+    run_command(args.command, forwarded)
+    return 0
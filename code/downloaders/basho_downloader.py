@@ -1,11 +1,75 @@
+import os
 from datetime import datetime
 
-from ..base_code.base_classes import SumoApiQuery
+from ..base_code.base_classes import SumoApiQuery, division_dir, selected_divisions
+from ..base_code.codec import Banzuke
+from ..base_code.http_cache import COMPLETED_TTL, LIVE_TTL
+from ..base_code.profiling import StageProfiler
+from .download_planner import DownloadPlanner
+from .rikishi_index import INDEX_FILENAME, RikishiIndex
+
+EMPTY_RESPONSE = "Empty response received"
 
 
 class SumoApiQueryBasho(SumoApiQuery):
-    def __init__(self):
+    schema = "basho"
+
+    def __init__(self, divisions=None, cache_path=None):
         super().__init__()
+        self.base_url = "https://www.sumo-api.com/api/basho/{}/banzuke/{}"
+        # SUMO_DIVISIONS picks divisions when none are given (default Makuuchi)
+        self.divisions = selected_divisions(divisions)
+        self.planner = DownloadPlanner(
+            cache_path or DownloadPlanner.default_cache_path()
+        )
+        self.rikishi_index = RikishiIndex()
+
+    def query_endpoint(self, job):
+        output_dir = division_dir(self.output_dir, job.division)
+        os.makedirs(output_dir, exist_ok=True)
+        status = self.fetch(
+            job,
+            self.base_url.format(job.basho_id, job.division),
+            os.path.join(output_dir, f"{job.basho_id}.json"),
+        )
+        if status == EMPTY_RESPONSE:
+            self.planner.record_empty(job)
+        return status
+
+    def handle_response(self, job, response_data):
+        banzuke = Banzuke.from_dict(response_data)
+        if not (banzuke.east or banzuke.west):
+            self.planner.record_empty(job)
+        self.rikishi_index.add_banzuke(banzuke, job.basho_id, job.division)
+
+    def log_fields(self, job):
+        return {"basho": job.basho_id, "division": job.division}
+
+    def cache_ttl(self, job, response_data):
+        # Only the current basho's banzuke (and bouts) can still change; an
+        # empty answer for an earlier one is as final as a full one
+        current = self.planner.current_basho_id
+        if current is None or job.basho_id >= current:
+            return LIVE_TTL
+        return COMPLETED_TTL
+
+    def run_queries(self):
+        # Basho ids become (basho, division) jobs, most wanted first, minus
+        # the combinations already known to be empty
+        basho_ids = self.iters
+        self.iters = self.planner.plan(basho_ids, self.divisions)
+        skipped = len(basho_ids or ()) * len(self.divisions) - len(self.iters)
+        self.metrics.inc("jobs_skipped", skipped)
+        self.log.info(
+            "Planned %s downloads, skipped %s known empty", len(self.iters), skipped
+        )
+        super().run_queries()
+        self.planner.save()
+        # Saved next to basho/ for the rikishi downloader
+        path = self.rikishi_index.save(
+            os.path.join(os.path.dirname(self.output_dir), INDEX_FILENAME)
+        )
+        self.log.info("Indexed %s rikishi in %s", len(self.rikishi_index.spans), path)
 
     def generate_timestamps(self):
         current_year = datetime.now().year
@@ -22,8 +86,9 @@ class SumoApiQueryBasho(SumoApiQuery):
 if __name__ == "__main__":
     # setup_logging()
     query = SumoApiQueryBasho()
-    query.generate_timestamps()
-    print(f"Generated {len(query.iters)} timestamps to query.")
-    query.run_queries()
+    with StageProfiler("basho_downloader", snapshot=query.now):
+        query.generate_timestamps()
+        print(f"Generated {len(query.iters)} timestamps to query.")
+        query.run_queries()
     print("Process completed.")
     # example command for running this module python -m code.downloaders.pulling_data
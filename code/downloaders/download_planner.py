@@ -0,0 +1,87 @@
+import os
+import threading
+from typing import NamedTuple
+
+from ..base_code import codec
+from ..base_code.base_classes import DIVISIONS, get_project_root
+
+CACHE_VERSION = 1
+
+
+class DownloadJob(NamedTuple):
+    basho_id: str
+    division: str
+
+
+class DownloadPlanner:
+    """Expand basho ids into (basho, division) jobs in download order.
+
+    The current basho comes first, then each division from the top down,
+    newest basho first. Combinations the API has answered with an empty
+    banzuke (divisions that didn't exist yet, cancelled bashos) are kept in
+    a negative cache and not requested again. The current basho is never
+    cached, as its banzuke may simply not be published yet.
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.known_empty = set()
+        self.current_basho_id = None
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            data = codec.read_json(cache_path)
+            if data.get("version") == CACHE_VERSION:
+                self.known_empty = {
+                    DownloadJob(basho_id, division)
+                    for basho_id, division in data["empty"]
+                }
+
+    @classmethod
+    def default_cache_path(cls):
+        return str(get_project_root() / "state" / "download_negative_cache.json")
+
+    def plan(self, basho_ids, divisions):
+        if not basho_ids:
+            return []
+        self.current_basho_id = max(basho_ids)
+        jobs = [
+            DownloadJob(basho_id, division)
+            for basho_id in basho_ids
+            for division in divisions
+            if DownloadJob(basho_id, division) not in self.known_empty
+        ]
+        jobs.sort(
+            key=lambda job: (
+                job.basho_id != self.current_basho_id,
+                DIVISIONS.index(job.division),
+                -int(job.basho_id),
+            )
+        )
+        return jobs
+
+    def record_empty(self, job):
+        if job.basho_id == self.current_basho_id:
+            return
+        with self._lock:
+            self.known_empty.add(job)
+
+    def save(self):
+        if not self.cache_path:
+            return None
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        # Worker processes (see pipeline_worker) each save what they learnt,
+        # so keep whatever another one saved meanwhile
+        on_disk = DownloadPlanner(self.cache_path).known_empty
+        with self._lock:
+            self.known_empty |= on_disk
+        # Replaced atomically, so a concurrent reader never sees half a file
+        temporary_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        codec.write_json(
+            temporary_path,
+            {
+                "version": CACHE_VERSION,
+                "empty": [list(job) for job in sorted(self.known_empty)],
+            },
+        )
+        os.replace(temporary_path, self.cache_path)
+        return self.cache_path
@@ -0,0 +1,305 @@
+"""Poll the current basho during a tournament and write new bouts as they land.
+
+Each poll is a conditional GET (If-None-Match / If-Modified-Since) of the
+current basho's banzuke per division, so an unchanged banzuke costs a 304.
+A changed one is diffed against the previous poll: only rikishi with more
+decided bouts than before, and their opponents, are paired (see
+AuraDBLoaderBoutNodes.pair_records), and only bouts that weren't decided
+last time are written, in one batched MERGE. The bout's Basho and Rikishi
+relationships follow, and the load version is bumped so cached reads see
+them. What has been written, with the validators, is kept in
+``state/live_poller.json``, so a restarted poller carries on.
+"""
+
+import argparse
+import email.utils
+import json
+import os
+import time
+from datetime import date
+
+import requests
+
+from ..base_code import codec
+from ..base_code.base_classes import SumoApiQuery, get_project_root, selected_divisions
+from ..base_code.codec import Banzuke, BanzukeEntry, Bout
+from ..base_code.validation import validate
+from ..node_builders.create_basho_nodes import AuraDBLoaderBashoNodes
+from ..node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+from ..relationship_builders.create_basho_bout_relationships import (
+    AuraDBLoaderBashoBoutRelationships,
+)
+from ..relationship_builders.create_rikishi_bout_relationships import (
+    AuraDBLoaderRikishiBoutRelationships,
+)
+
+DEFAULT_INTERVAL_SECONDS = 60
+STATE_VERSION = 1
+
+
+def current_basho_id(today=None):
+    """The latest honbasho month (odd months) up to ``today``, as YYYYMM."""
+    today = today or date.today()
+    month = today.month if today.month % 2 else today.month - 1
+    return f"{today.year}{month:02d}"
+
+
+def decided_count(entry):
+    """Bouts of ``entry`` with a result; scheduled bouts come with an empty one."""
+    count = 0
+    for bout in entry.record or ():
+        if not bout.result:
+            break
+        count += 1
+    return count
+
+
+class AuraDBLoaderLiveBouts(
+    AuraDBLoaderBoutNodes,
+    AuraDBLoaderBashoNodes,
+    AuraDBLoaderBashoBoutRelationships,
+    AuraDBLoaderRikishiBoutRelationships,
+):
+    """The builders' writes for one poll's new bouts."""
+
+    def __init__(self):
+        super().__init__()
+        self.basho_ids = set()
+
+    def write_live_bouts(self, basho_id, rows):
+        if basho_id not in self.basho_ids:
+            self.create_basho_node(basho_id)
+            self.basho_ids.add(basho_id)
+        self.create_bout_nodes_batch(rows)
+        self.create_basho_bout_relationship(bashoId=basho_id)
+        rikishi_ids = {
+            row[name]
+            for row in rows
+            for name in ("RikishiID_rikishi1", "RikishiID_rikishi2")
+            if row[name] != ""
+        }
+        for rikishi_id in sorted(rikishi_ids, key=str):
+            self.create_rikishi_bout_relationship(rikishiId=rikishi_id)
+        # So cached reads (read_api) see the new bouts now, not at exit
+        self.bump_load_version()
+
+
+class LiveBashoPoller(SumoApiQuery):
+    schema = "basho"
+
+    def __init__(self, basho_id=None, divisions=None, loader=None, state_path=None):
+        super().__init__()
+        project_root = get_project_root()
+        self.base_url = "https://www.sumo-api.com/api/basho/{}/banzuke/{}"
+        self.log_file_name = str(project_root / "sumo_live_poller.log")
+        self.basho_id = basho_id or current_basho_id()
+        self.divisions = selected_divisions(divisions)
+        self.loader = loader
+        self.state_path = state_path or str(project_root / "state" / "live_poller.json")
+        self.state = self.load_state()
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            state = codec.read_json(self.state_path)
+            if state.get("version") == STATE_VERSION:
+                return state
+        return {"version": STATE_VERSION, "urls": {}}
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        temporary_path = f"{self.state_path}.tmp"
+        codec.write_json(temporary_path, self.state)
+        os.replace(temporary_path, self.state_path)
+
+    def graph_loader(self):
+        # Created on the first change, so polling alone needs no database
+        if self.loader is None:
+            self.loader = AuraDBLoaderLiveBouts()
+        return self.loader
+
+    def conditional_get(self, url, known):
+        headers = {}
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+        with self.metrics.timer("request_latency_seconds"):
+            response = self.session.get(url, headers=headers, timeout=30)
+        self.metrics.inc("requests")
+        self.metrics.inc("bytes_downloaded", len(response.content or b""))
+        return response
+
+    def new_bouts(self, banzuke, previous):
+        """Bout params of the bouts decided since ``previous`` ({rikishiID: count})."""
+        decided = {}
+        entries = {}
+        for _, side_entries in banzuke.sides():
+            for entry in side_entries:
+                decided[entry.rikishiID] = decided_count(entry)
+                entries[entry.rikishiID] = entry
+        new = {
+            (rikishi_id, number)
+            for rikishi_id, count in decided.items()
+            for number in range(previous.get(str(rikishi_id), 0) + 1, count + 1)
+        }
+        # A bout is written once both sides have it decided, as a one-sided
+        # row would be MERGEd under a different key than the pair later on.
+        # Until then the count stops short of it, so a later poll retries it
+        held = True
+        while held:
+            held = False
+            for rikishi_id, number in sorted(new):
+                opponent = entries[rikishi_id].record[number - 1].opponentID
+                if (
+                    opponent in decided
+                    and decided[opponent] < number <= decided[rikishi_id]
+                ):
+                    decided[rikishi_id] = number - 1
+                    held = True
+            new = {
+                (rikishi_id, number)
+                for rikishi_id, number in new
+                if number <= decided[rikishi_id]
+            }
+        if not new:
+            return decided, []
+        # The changed rikishi and their new opponents, whose side of the bout
+        # may have been published in an earlier poll
+        involved = {rikishi_id for rikishi_id, _ in new}
+        for rikishi_id, number in new:
+            involved.add(entries[rikishi_id].record[number - 1].opponentID)
+
+        def trimmed(side_entries):
+            return tuple(
+                BanzukeEntry(
+                    entry.side,
+                    entry.rikishiID,
+                    record=entry.record[: decided[entry.rikishiID]],
+                )
+                for entry in side_entries
+                if entry.rikishiID in involved
+            )
+
+        partial = Banzuke(
+            banzuke.bashoId,
+            banzuke.division,
+            trimmed(banzuke.east),
+            trimmed(banzuke.west),
+        )
+        matched, unmatched = AuraDBLoaderBoutNodes.pair_records(partial, self.basho_id)
+        rows = [
+            row
+            for row in matched.to_dict("records")
+            if (row["RikishiID_rikishi1"], row["Fight_Number"]) in new
+            or (row["RikishiID_rikishi2"], row["Fight_Number"]) in new
+        ]
+        rows += [
+            row
+            for row in unmatched.to_dict("records")
+            if (row["RikishiID_rikishi1"], row["Fight_Number"]) in new
+        ]
+        return decided, [Bout.from_row(row).params() for row in rows]
+
+    def poll_division(self, division):
+        """Poll one division; returns the number of new bouts written."""
+        url = self.base_url.format(self.basho_id, division)
+        known = self.state["urls"].setdefault(url, {"decided": {}})
+        fields = {"basho": self.basho_id, "division": division}
+        try:
+            response = self.conditional_get(url, known)
+        except requests.RequestException as e:
+            self.metrics.inc("request_errors")
+            self.log.error("Poll failed: %s", e, extra=fields)
+            return 0
+        received = time.time()
+        if response.status_code == 304:
+            self.metrics.inc("not_modified")
+            return 0
+        if not response.ok or not response.content.strip():
+            self.metrics.inc("request_errors")
+            self.log.error("Poll got HTTP %s", response.status_code, extra=fields)
+            return 0
+        try:
+            data = codec.loads(response.content)
+        except json.JSONDecodeError as e:
+            self.metrics.inc("request_errors")
+            self.log.error("Poll got invalid JSON: %s", e, extra=fields)
+            return 0
+        errors = validate(self.schema, data)
+        if errors:
+            self.metrics.inc("documents_quarantined")
+            self.log.error("Invalid banzuke: %s", errors[0], extra=fields)
+            return 0
+        decided, rows = self.new_bouts(Banzuke.from_dict(data), known["decided"])
+        if rows:
+            try:
+                self.graph_loader().write_live_bouts(self.basho_id, rows)
+            except Exception:
+                # State isn't saved, so the next poll writes these bouts again
+                self.metrics.inc("write_errors")
+                self.log.exception("Writing bouts failed", extra=fields)
+                return 0
+            written = time.time()
+            self.metrics.inc("new_bouts", len(rows))
+            self.metrics.observe("detect_to_graph_seconds", written - received)
+            latency = {"detect_to_graph_seconds": round(written - received, 3)}
+            # The API's own update time, when it says; else only detection counts
+            updated = response.headers.get("Last-Modified")
+            if updated:
+                update_time = email.utils.parsedate_to_datetime(updated).timestamp()
+                self.metrics.observe("update_to_graph_seconds", written - update_time)
+                latency["update_to_graph_seconds"] = round(written - update_time, 3)
+            self.log.info(
+                "%d new bouts",
+                len(rows),
+                extra={**fields, "bouts": len(rows), **latency},
+            )
+        # Recorded once the bouts are written, so a failed write is retried
+        known["decided"] = {
+            str(rikishi_id): count for rikishi_id, count in decided.items()
+        }
+        known["etag"] = response.headers.get("ETag")
+        known["last_modified"] = response.headers.get("Last-Modified")
+        self.save_state()
+        return len(rows)
+
+    def poll(self):
+        self.metrics.inc("polls")
+        return sum(self.poll_division(division) for division in self.divisions)
+
+    def run(self, interval=DEFAULT_INTERVAL_SECONDS, max_polls=None, sleep=time.sleep):
+        self.setup_logging()
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                started = time.monotonic()
+                self.poll()
+                polls += 1
+                if max_polls is not None and polls >= max_polls:
+                    break
+                sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.loader is not None:
+                self.loader.close()
+            self.write_metrics_report()
+        return polls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Poll the current basho and write new bouts to the graph"
+    )
+    parser.add_argument("--basho", help="YYYYMM (default: the current basho)")
+    parser.add_argument(
+        "--interval", type=float, default=DEFAULT_INTERVAL_SECONDS, help="Seconds"
+    )
+    parser.add_argument("--once", action="store_true", help="Poll once and exit")
+    args = parser.parse_args()
+    poller = LiveBashoPoller(basho_id=args.basho)
+    print(f"Polling {poller.basho_id} ({', '.join(poller.divisions)})")
+    polls = poller.run(interval=args.interval, max_polls=1 if args.once else None)
+    print(
+        f"Stopped after {polls} polls, {poller.metrics.counters.get('new_bouts', 0)} new bouts"
+    )
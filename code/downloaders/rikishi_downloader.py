@@ -1,17 +1,40 @@
 import json
 import os
+import re
 
-from ..base_code.base_classes import SumoApiQuery, get_project_root
+from ..base_code import codec
+from ..base_code.base_classes import SumoApiQuery, get_data_root, get_project_root
+from ..base_code.http_cache import COMPLETED_TTL, DEFAULT_TTL, NEGATIVE_TTL
+from ..base_code.profiling import StageProfiler
+from ..base_code.snapshot_store import open_documents
+from .rikishi_index import INDEX_FILENAME, RikishiIndex
 
 
 class SumoApiQueryRikishi(SumoApiQuery):
+    schema = "rikishi"
+
     def __init__(self):
         super().__init__()
         project_root = get_project_root()
         self.base_url = "https://www.sumo-api.com/api/rikishi/{}?intai=true"
-        self.output_dir = str(project_root / "data" / self.now / "rikishi")
+        self.output_dir = str(get_data_root() / self.now / "rikishi")
         self.log_file_name = str(project_root / "sumo_api_query_rikishi.log")
 
+    def log_fields(self, rikishi_id):
+        return {"rikishi": rikishi_id}
+
+    def cache_ttl(self, rikishi_id, response_data):
+        if not response_data:
+            return NEGATIVE_TTL
+        # Ids the API doesn't know and retired rikishi stay that way
+        if response_data.get("error") == "INVALID_RIKISHI_ID":
+            return COMPLETED_TTL
+        if "error" in response_data:
+            return NEGATIVE_TTL
+        if response_data.get("intai"):
+            return COMPLETED_TTL
+        return DEFAULT_TTL
+
     def get_latest_directory(self):
         # List all directories in the base directory
         all_dirs = [
@@ -23,64 +46,113 @@ class SumoApiQueryRikishi(SumoApiQuery):
         if not all_dirs:
             return None
 
-        # Sort directories by their timestamp
-        latest_dir = max(all_dirs, key=os.path.getmtime)
+        # Snapshots are named YYYYMM, which sorts by date; mtime only breaks
+        # ties for other layouts, as copying or touching a directory moves it
+        snapshots = [d for d in all_dirs if re.fullmatch(r"\d{6}", os.path.basename(d))]
+        if snapshots:
+            latest_dir = max(snapshots)
+        else:
+            latest_dir = max(all_dirs, key=os.path.getmtime)
         return f"{latest_dir}/basho"
 
     def extract_rikishi_ids_from_directory(self, directory):
         unique_rikishi_ids = set()
 
-        # List all JSON files in the directory
-        json_files = [f for f in os.listdir(directory) if f.endswith(".json")]
-
-        if not json_files:
+        # Every banzuke document, whether the snapshot is packed or not
+        documents = open_documents(directory)
+        if not len(documents):
             return unique_rikishi_ids
 
-        for file_name in json_files:
-            file_path = os.path.join(directory, file_name)
+        for _, body in documents:
             try:
-                with open(file_path) as file:
-                    data = json.load(file)
+                with self.metrics.timer("json_parse_seconds"):
+                    banzuke = codec.decode_banzuke(body)
             except json.JSONDecodeError:
                 continue
 
-            # Check if 'east' and 'west' are not None before processing
-            east_rikishi_ids = (
-                [
-                    rikishi.get("rikishiID")
-                    for rikishi in data.get("east", [])
-                    if rikishi
-                ]
-                if data.get("east")
-                else []
-            )
-            west_rikishi_ids = (
-                [
-                    rikishi.get("rikishiID")
-                    for rikishi in data.get("west", [])
-                    if rikishi
-                ]
-                if data.get("west")
-                else []
-            )
-
-            # Combine and deduplicate the list, removing any None values
-            unique_rikishi_ids.update([id for id in east_rikishi_ids if id is not None])
-            unique_rikishi_ids.update([id for id in west_rikishi_ids if id is not None])
+            unique_rikishi_ids.update(banzuke.rikishi_ids())
 
+        self.metrics.inc("rows_extracted", len(unique_rikishi_ids))
         self.iters = list(unique_rikishi_ids)
 
+    def load_rikishi_index(self, basho_dir):
+        """The basho downloader's index, if it covers every file in ``basho_dir``."""
+        index = RikishiIndex.load(
+            os.path.join(os.path.dirname(basho_dir), INDEX_FILENAME)
+        )
+        if index is None or not index.covers(basho_dir):
+            return None
+        return index
+
+    def previous_rikishi_dir(self):
+        """The newest snapshot's rikishi/ directory, if one exists."""
+        snapshots = sorted(
+            (
+                d
+                for d in os.listdir(self.base_directory)
+                if re.fullmatch(r"\d{6}", d)
+                and len(open_documents(os.path.join(self.base_directory, d, "rikishi")))
+            ),
+            reverse=True,
+        )
+        if not snapshots:
+            return None
+        return os.path.join(self.base_directory, snapshots[0], "rikishi")
+
+    def skip_retired_rikishi(self, active_ids):
+        """Copy retired rikishi forward from the previous snapshot.
+
+        A rikishi whose previous file has an ``intai`` (retirement) date
+        can't change any more, unless they are back on the latest banzuke.
+        """
+        previous_dir = self.previous_rikishi_dir()
+        if previous_dir is None:
+            return 0
+        same_dir = os.path.abspath(previous_dir) == os.path.abspath(self.output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        previous = open_documents(previous_dir)
+        remaining = []
+        for rikishi_id in self.iters:
+            body = None if rikishi_id in active_ids else previous.get(str(rikishi_id))
+            if body is None:
+                remaining.append(rikishi_id)
+                continue
+            try:
+                retired = codec.decode_rikishi(body).get("intai")
+            except json.JSONDecodeError:
+                retired = None
+            if not retired:
+                remaining.append(rikishi_id)
+                continue
+            if not same_dir:
+                path = os.path.join(self.output_dir, f"{rikishi_id}.json")
+                self.save_document(path, body)
+        skipped = len(self.iters) - len(remaining)
+        self.metrics.inc("rikishi_reused", skipped)
+        self.iters = remaining
+        return skipped
+
     def process_latest_directory(self):
         latest_dir = self.get_latest_directory()
-        if latest_dir:
-            return self.extract_rikishi_ids_from_directory(latest_dir)
-        else:
+        if not latest_dir:
             return "No directories found."
+        index = self.load_rikishi_index(latest_dir)
+        if index is None:
+            # No index from the basho download: parse every basho file
+            self.extract_rikishi_ids_from_directory(latest_dir)
+            active_ids = set()
+        else:
+            self.iters = index.rikishi_ids()
+            self.metrics.inc("rows_extracted", len(self.iters))
+            active_ids = index.active_ids()
+        skipped = self.skip_retired_rikishi(active_ids)
+        self.log.info("Reused %s retired rikishi from the previous snapshot", skipped)
 
 
 if __name__ == "__main__":
     query = SumoApiQueryRikishi()
-    query.process_latest_directory()
-    print(f"Generated {len(query.iters)} rikishi ids to query.")
-    query.run_queries()
+    with StageProfiler("rikishi_downloader", snapshot=query.now):
+        query.process_latest_directory()
+        print(f"Generated {len(query.iters)} rikishi ids to query.")
+        query.run_queries()
     print("Process completed.")
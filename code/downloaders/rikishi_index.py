@@ -0,0 +1,86 @@
+import os
+import threading
+
+from ..base_code import codec
+from ..base_code.snapshot_store import open_documents
+
+INDEX_FILENAME = "rikishi_index.json"
+INDEX_VERSION = 1
+
+
+class RikishiIndex:
+    """Every rikishi on a snapshot's banzuke with their first and last basho.
+
+    The basho downloader fills it in as responses arrive and saves it next to
+    the snapshot's basho/ directory, so the rikishi downloader gets its ids
+    from one small file instead of parsing every basho again.
+    """
+
+    def __init__(self, spans=None, basho_ids=None):
+        # rikishi id -> [first bashoId, last bashoId]
+        self.spans = spans or {}
+        self.basho_ids = set(basho_ids or ())
+        self._lock = threading.Lock()
+
+    def add_banzuke(self, banzuke, basho_id=None, division="Makuuchi"):
+        # Keyed by the requested basho (the file name) when given, so empty
+        # banzuke still count towards covers()
+        basho_id = basho_id or banzuke.bashoId
+        if not basho_id:
+            return
+        rikishi_ids = banzuke.rikishi_ids()
+        # Files of the lower divisions live in basho/<Division>/
+        file_key = basho_id if division == "Makuuchi" else f"{division}/{basho_id}"
+        # Downloads run in a thread pool and bashos arrive in any order
+        with self._lock:
+            self.basho_ids.add(file_key)
+            for rikishi_id in rikishi_ids:
+                span = self.spans.get(rikishi_id)
+                if span is None:
+                    self.spans[rikishi_id] = [basho_id, basho_id]
+                else:
+                    span[0] = min(span[0], basho_id)
+                    span[1] = max(span[1], basho_id)
+
+    def rikishi_ids(self):
+        return sorted(self.spans)
+
+    def latest_basho_id(self):
+        return max((span[1] for span in self.spans.values()), default=None)
+
+    def active_ids(self):
+        """Rikishi on the most recent banzuke that had any."""
+        latest = self.latest_basho_id()
+        return {
+            rikishi_id for rikishi_id, span in self.spans.items() if span[1] == latest
+        }
+
+    def covers(self, basho_dir):
+        """True if every banzuke in ``basho_dir`` went into this index."""
+        return set(open_documents(basho_dir).keys()) <= self.basho_ids
+
+    def save(self, path):
+        codec.write_json(
+            path,
+            {
+                "version": INDEX_VERSION,
+                "bashoIds": sorted(self.basho_ids),
+                "rikishi": [
+                    [rikishi_id, *self.spans[rikishi_id]]
+                    for rikishi_id in self.rikishi_ids()
+                ],
+            },
+        )
+        return path
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        data = codec.read_json(path)
+        if data.get("version") != INDEX_VERSION:
+            return None
+        spans = {
+            rikishi_id: [first, last] for rikishi_id, first, last in data["rikishi"]
+        }
+        return cls(spans, data["bashoIds"])
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import time
+
+from .base_code.base_classes import get_data_root
+from .base_code.graph_sinks import InMemoryGraphSink
+from .node_builders.create_basho_nodes import AuraDBLoaderBashoNodes
+from .node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+from .node_builders.create_rikishi_nodes import AuraDBLoaderRikishiNodes
+from .relationship_builders.create_basho_bout_relationships import (
+    AuraDBLoaderBashoBoutRelationships,
+)
+from .relationship_builders.create_rikishi_bout_relationships import (
+    AuraDBLoaderRikishiBoutRelationships,
+)
+
+# Same order as a real load: nodes first, then the relationships between them
+DRY_RUN_STAGES = (
+    (AuraDBLoaderBashoNodes, "basho", "run_create_basho_nodes"),
+    (AuraDBLoaderRikishiNodes, "rikishi", "run_create_rikishi_nodes"),
+    (AuraDBLoaderBoutNodes, "basho", "load_jsons_from_folder_and_create_bout_nodes"),
+    (
+        AuraDBLoaderBashoBoutRelationships,
+        "basho",
+        "run_create_basho_bout_relationship",
+    ),
+    (
+        AuraDBLoaderRikishiBoutRelationships,
+        "rikishi",
+        "run_create_rikishi_bout_relationship",
+    ),
+)
+
+
+def run_dry_run(snapshot_dir, sink=None):
+    """Run every builder against one shared in-memory graph and return its counts."""
+    sink = sink or InMemoryGraphSink()
+    previous_sink_setting = os.environ.get("SUMO_GRAPH_SINK")
+    os.environ["SUMO_GRAPH_SINK"] = "memory"
+    try:
+        for loader_cls, kind, method_name in DRY_RUN_STAGES:
+            loader = loader_cls()
+            loader.sink = sink
+            try:
+                getattr(loader, method_name)(os.path.join(snapshot_dir, kind))
+            finally:
+                loader.close()
+    finally:
+        if previous_sink_setting is None:
+            os.environ.pop("SUMO_GRAPH_SINK", None)
+        else:
+            os.environ["SUMO_GRAPH_SINK"] = previous_sink_setting
+    return sink.counts()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load a snapshot into an in-memory graph and print its counts"
+    )
+    parser.add_argument("--snapshot", help="YYYYMM directory under data/")
+    args = parser.parse_args()
+    data_path = str(get_data_root())
+    snapshot = args.snapshot or max(
+        d for d in os.listdir(data_path) if d.isdigit() and len(d) == 6
+    )
+    start = time.perf_counter()
+    counts = run_dry_run(os.path.join(data_path, snapshot))
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(counts, indent=2))
@@ -1,7 +1,27 @@
-import json
 import os
+from datetime import date
 
 from ..base_code.base_classes import AuraDBLoader
+from ..base_code.graph_sinks import CREATE_INDEX, MERGE_BASHO, MERGE_NEXT_BASHO
+from ..base_code.log_config import Progress
+from ..base_code.profiling import StageProfiler
+
+# Honbasho have been held in odd months, six a year, since 1958
+FIRST_BASHO_YEAR = 1958
+
+
+def basho_date(basho_id):
+    """First day of the basho's month; bashoIds are YYYYMM."""
+    return date(int(basho_id[:4]), int(basho_id[4:6]), 1)
+
+
+def basho_ordinal(basho_id):
+    """Position of the basho's slot in the six-a-year calendar, from 195801 = 0.
+
+    Cancelled bashos keep their slot, so ordinals are monotonic with gaps.
+    """
+    year, month = int(basho_id[:4]), int(basho_id[4:6])
+    return (year - FIRST_BASHO_YEAR) * 6 + (month - 1) // 2
 
 
 class AuraDBLoaderBashoNodes(AuraDBLoader):
@@ -9,26 +29,70 @@ class AuraDBLoaderBashoNodes(AuraDBLoader):
         super().__init__()
 
     def create_basho_node(self, basho_id):
-        with self.driver.session() as session:
-            # Cypher query to merge a node, preventing duplication
-            query = "MERGE (b:Basho {bashoId: $basho_id}) " "RETURN b"
-            result = session.run(query, basho_id=basho_id)
-            return result.single()[0]
+        # Cypher query to merge a node, preventing duplication
+        query = (
+            "MERGE (b:Basho {bashoId: $basho_id}) "
+            "SET b.date = date($date), b.ordinal = $ordinal "
+            "RETURN b"
+        )
+        record = self.run_query(
+            query,
+            operation=MERGE_BASHO,
+            basho_id=basho_id,
+            date=basho_date(basho_id).isoformat(),
+            ordinal=basho_ordinal(basho_id),
+        )
+        return record[0] if record else None
+
+    def create_basho_indexes(self):
+        # Range indexes, so time windows and bashoId lookups are index seeks
+        for name, key in (
+            ("basho_basho_id", "bashoId"),
+            ("basho_date", "date"),
+            ("basho_ordinal", "ordinal"),
+        ):
+            self.run_query(
+                f"CREATE INDEX {name} IF NOT EXISTS FOR (b:Basho) ON (b.{key})",
+                operation=CREATE_INDEX,
+            )
+
+    def create_next_basho_chain(self, basho_ids, batch_size=1000):
+        """Link each basho to the next one held with a NEXT_BASHO edge."""
+        basho_ids = sorted(set(basho_ids), key=basho_ordinal)
+        rows = [
+            {"previous": previous, "next": following}
+            for previous, following in zip(basho_ids, basho_ids[1:])
+        ]
+        query = """UNWIND $rows AS row
+                    MATCH (a:Basho {bashoId: row.previous})
+                    MATCH (b:Basho {bashoId: row.next})
+                    MERGE (a)-[:NEXT_BASHO]->(b)"""
+        self.write_batches(
+            query, rows, batch_size=batch_size, operation=MERGE_NEXT_BASHO
+        )
+        return len(rows)
 
     def load_jsons_from_folder_and_create_basho_nodes(self, folder_path):
-        for filename in os.listdir(folder_path):
-            if filename.endswith(".json"):
-                file_path = os.path.join(folder_path, filename)
-                with open(file_path) as file:
-                    data = json.load(file)
-                    basho_id = data.get(
-                        "bashoId", ""
-                    )  # Get bashoId or default to empty string
-                    if basho_id:  # Check if basho_id is not empty
-                        self.create_basho_node(basho_id)
-                        print(f"Processed and created node for {filename}")
-                    else:
-                        print(f"Skipped {filename} due to empty bashoId")
+        basho_ids = []
+        documents = self.banzuke_documents(folder_path, unique=True)
+        with Progress(self.log, "basho nodes") as progress:
+            for _, file_path, banzuke in documents:
+                basho_id = banzuke.bashoId
+                if basho_id:  # Check if basho_id is not empty
+                    self.metrics.inc("rows_extracted")
+                    self.create_basho_node(basho_id)
+                    basho_ids.append(basho_id)
+                    progress.update(basho=basho_id)
+                else:
+                    progress.skip("empty bashoId", key=file_path)
+        return basho_ids
+
+    def run_create_basho_nodes(self, folder_path):
+        self.create_basho_indexes()
+        # Chain only the bashos that got a node; empty files are skipped
+        basho_ids = self.load_jsons_from_folder_and_create_basho_nodes(folder_path)
+        linked = self.create_next_basho_chain(basho_ids)
+        self.log.info("Linked %s NEXT_BASHO edges", linked)
 
 
 if __name__ == "__main__":
@@ -38,7 +102,8 @@ if __name__ == "__main__":
         recent_dir = loader.get_most_recent_directory(loader.data_path)
         if recent_dir:
             basho_folder_path = os.path.join(loader.data_path, recent_dir, "basho")
-            loader.load_jsons_from_folder_and_create_basho_nodes(basho_folder_path)
+            with StageProfiler("create_basho_nodes", snapshot=recent_dir):
+                loader.run_create_basho_nodes(basho_folder_path)
         else:
             print("No recent directory found")
     finally:
@@ -1,10 +1,13 @@
-import json
 import os
+from collections import Counter
 
 import pandas as pd
-from tqdm import tqdm
 
 from ..base_code.base_classes import AuraDBLoader
+from ..base_code.codec import Banzuke, Bout
+from ..base_code.graph_sinks import MERGE_BOUT, MERGE_BOUTS
+from ..base_code.log_config import Progress
+from ..base_code.profiling import StageProfiler
 
 
 class AuraDBLoaderBoutNodes(AuraDBLoader):
@@ -23,257 +26,190 @@ class AuraDBLoaderBoutNodes(AuraDBLoader):
         Side_rikishi2,
         bashoId,
     ):
-        with self.driver.session() as session:
-            # Cypher query to merge a node, preventing duplication
-            query = """MERGE (b:Bout {result_rikishi1: $result_rikishi1,rikishiId_rikishi1: $RikishiID_rikishi1,
-                              side_rikishi1: $Side_rikishi1, fightNumber: $Fight_Number,
-                               kimarite: $kimarite, result_rikishi2: $result_rikishi2,
-                               rikishiId_rikishi2: $RikishiID_rikishi2,
-                               side_rikishi2: $Side_rikishi2,bashoId:$bashoId})
-                             RETURN b"""
-            result = session.run(
-                query,
-                result_rikishi1=result_rikishi1,
-                RikishiID_rikishi1=RikishiID_rikishi1,
-                Side_rikishi1=Side_rikishi1,
-                kimarite=kimarite,
-                result_rikishi2=result_rikishi2,
-                Fight_Number=Fight_Number,
-                RikishiID_rikishi2=RikishiID_rikishi2,
-                Side_rikishi2=Side_rikishi2,
-                bashoId=bashoId,
-            )
-            return result.single()[0]
+        # Cypher query to merge a node, preventing duplication
+        query = """MERGE (b:Bout {result_rikishi1: $result_rikishi1,rikishiId_rikishi1: $RikishiID_rikishi1,
+                          side_rikishi1: $Side_rikishi1, fightNumber: $Fight_Number,
+                           kimarite: $kimarite, result_rikishi2: $result_rikishi2,
+                           rikishiId_rikishi2: $RikishiID_rikishi2,
+                           side_rikishi2: $Side_rikishi2,bashoId:$bashoId})
+                         RETURN b"""
+        record = self.run_query(
+            query,
+            operation=MERGE_BOUT,
+            result_rikishi1=result_rikishi1,
+            RikishiID_rikishi1=RikishiID_rikishi1,
+            Side_rikishi1=Side_rikishi1,
+            kimarite=kimarite,
+            result_rikishi2=result_rikishi2,
+            Fight_Number=Fight_Number,
+            RikishiID_rikishi2=RikishiID_rikishi2,
+            Side_rikishi2=Side_rikishi2,
+            bashoId=bashoId,
+        )
+        return record[0] if record else None
+
+    @staticmethod
+    def extract_bouts(data, basho):
+        """Pair the east/west banzuke records of one basho into bouts.
+
+        ``data`` is a Banzuke (or the raw dict, which is decoded first).
+        Returns a (matched, unmatched) pair of DataFrames, or None when the
+        file has no usable records. Unmatched rows are bouts whose opponent
+        is not on this banzuke.
+        """
+        if isinstance(data, dict):
+            data = Banzuke.from_dict(data)
+        if not (data.east and data.west):
+            return None
+        if not all(
+            any(entry.record is not None for entry in entries)
+            for _, entries in data.sides()
+        ):
+            return None
+        return AuraDBLoaderBoutNodes.pair_records(data, basho)
+
+    @staticmethod
+    def pair_records(data, basho):
+        """extract_bouts without the checks: pair whatever records ``data`` has.
+
+        The live poller pairs a partial banzuke with it (see live_poller).
+        """
+        # Flatten every rikishi's record straight from the slotted records,
+        # numbering each rikishi's bouts per side
+        columns = {
+            "result": [],
+            "opponentShikonaEn": [],
+            "opponentShikonaJp": [],
+            "opponentID": [],
+            "kimarite": [],
+            "RikishiID": [],
+            "Fight_Number": [],
+            "Side": [],
+        }
+        for side, entries in data.sides():
+            fight_numbers = Counter()
+            for entry in entries:
+                if entry.record is None:
+                    continue
+                for bout in entry.record:
+                    fight_numbers[entry.rikishiID] += 1
+                    columns["result"].append(bout.result)
+                    columns["opponentShikonaEn"].append(bout.opponentShikonaEn)
+                    columns["opponentShikonaJp"].append(bout.opponentShikonaJp)
+                    columns["opponentID"].append(bout.opponentID)
+                    columns["kimarite"].append(bout.kimarite)
+                    columns["RikishiID"].append(entry.rikishiID)
+                    columns["Fight_Number"].append(fight_numbers[entry.rikishiID])
+                    columns["Side"].append(side)
+        all_records = pd.DataFrame(columns)
+        all_records["bashoId"] = basho
+        matched_df = pd.merge(
+            all_records,
+            all_records,
+            left_on=["opponentID", "kimarite", "Fight_Number"],
+            right_on=["RikishiID", "kimarite", "Fight_Number"],
+            suffixes=("_rikishi1", "_rikishi2"),
+        )
+
+        # Create a unique match identifier that is order-agnostic
+        # (string-sorted rikishi ids, kimarite, fight number)
+        rikishi1_ids = matched_df["RikishiID_rikishi1"].astype(str)
+        rikishi2_ids = matched_df["RikishiID_rikishi2"].astype(str)
+        first_is_lower = rikishi1_ids <= rikishi2_ids
+        matched_df["match_id"] = (
+            rikishi1_ids.where(first_is_lower, rikishi2_ids)
+            + "_"
+            + rikishi2_ids.where(first_is_lower, rikishi1_ids)
+            + "_"
+            + matched_df["kimarite"]
+            + "_"
+            + matched_df["Fight_Number"].astype(str)
+        )
+
+        unique_matches_df = matched_df.drop_duplicates(subset=["match_id"])
+        left_merged_df = pd.merge(
+            all_records,
+            all_records,
+            left_on=["opponentID", "kimarite", "Fight_Number"],
+            right_on=["RikishiID", "kimarite", "Fight_Number"],
+            suffixes=("_rikishi1", "_rikishi2"),
+            how="left",
+            indicator=True,
+        )
+        no_match_df = left_merged_df[left_merged_df["_merge"] == "left_only"]
+        unique_matches_df = unique_matches_df.rename(
+            columns={"bashoId_rikishi1": "bashoId"}
+        )
+        no_match_df = no_match_df.rename(columns={"bashoId_rikishi1": "bashoId"})
+        return unique_matches_df, no_match_df
+
+    @staticmethod
+    def bout_row_to_params(row):
+        return Bout.from_row(row).params()
+
+    def create_bout_nodes_batch(self, rows, batch_size=1000):
+        """MERGE Bout nodes for bout_row_to_params rows, a batch per transaction."""
+        query = """UNWIND $rows AS row
+                    MERGE (b:Bout {result_rikishi1: row.result_rikishi1,
+                                   rikishiId_rikishi1: row.RikishiID_rikishi1,
+                                   side_rikishi1: row.Side_rikishi1,
+                                   fightNumber: row.Fight_Number,
+                                   kimarite: row.kimarite,
+                                   result_rikishi2: row.result_rikishi2,
+                                   rikishiId_rikishi2: row.RikishiID_rikishi2,
+                                   side_rikishi2: row.Side_rikishi2,
+                                   bashoId: row.bashoId})"""
+        return self.write_batches(
+            query, rows, batch_size=batch_size, operation=MERGE_BOUTS
+        )
+
+    def create_bout_nodes_from_frame(self, bouts_df):
+        # Plain dicts are much cheaper to read than the Series iterrows builds
+        for row in bouts_df.to_dict("records"):
+            self.create_bout_node(**self.bout_row_to_params(row))
+
+    def extract_matched_bouts(self, folder_path, since_basho_id=None):
+        """Matched bouts of every basho file, optionally from ``since_basho_id`` on.
+
+        Only bouts with both rikishi on the banzuke are kept, as those are
+        the ones later stages can attach to two Rikishi nodes.
+        """
+        frames = []
+        for basho, _, data in self.banzuke_documents(folder_path):
+            if since_basho_id and basho < since_basho_id:
+                continue
+            bouts = self.extract_bouts(data, basho)
+            if bouts is None:
+                continue
+            frames.append(bouts[0])
+        if not frames:
+            return pd.DataFrame()
+        bouts = pd.concat(frames, ignore_index=True)
+        self.metrics.inc("rows_extracted", len(bouts))
+        return bouts
+
+    def create_bout_nodes_for_basho(self, basho, data):
+        """Create the Bout nodes of one banzuke; False if it has no usable records.
+
+        MERGE makes this safe to repeat, so a basho can be retried on its own
+        (see pipeline_worker).
+        """
+        bouts = self.extract_bouts(data, basho)
+        if bouts is None:
+            return False
+        unique_matches_df, no_match_df = bouts
+        self.metrics.inc("rows_extracted", len(unique_matches_df) + len(no_match_df))
+        self.create_bout_nodes_from_frame(unique_matches_df)
+        self.create_bout_nodes_from_frame(no_match_df)
+        return True
 
     def load_jsons_from_folder_and_create_bout_nodes(self, folder_path):
-        for filename in tqdm(os.listdir(folder_path)):
-            if filename.endswith(".json"):
-                file_path = os.path.join(folder_path, filename)
-                basho = filename.split(".json")[0]
-                with open(file_path) as file:
-                    data = json.load(file)
-                    east_data = data["east"]
-                    west_data = data["west"]
-                    if east_data and west_data:
-                        df_east = pd.DataFrame(east_data)
-                        df_west = pd.DataFrame(west_data)
-                        if "record" in df_east and "record" in df_west:
-                            df_east_cleaned = df_east.dropna(subset=["record"])
-                            df_east_cleaned.reset_index(drop=True, inplace=True)
-                            df_west_cleaned = df_west.dropna(subset=["record"])
-                            df_west_cleaned.reset_index(drop=True, inplace=True)
-                            print(f"Processing and creating nodes for {basho}")
-                            # Concatenating the 'record' columns from both DataFrames
-                            east_records = df_east_cleaned["record"]
-                            west_records = df_west_cleaned["record"]
-
-                            # Flattening the list of records into a DataFrame
-                            east_records = pd.json_normalize(east_records.sum())
-                            west_records = pd.json_normalize(west_records.sum())
-
-                            east_rikishi_ids = [
-                                [rikishi_id] * len(record)
-                                for rikishi_id, record in zip(
-                                    df_east_cleaned["rikishiID"],
-                                    df_east_cleaned["record"],
-                                )
-                            ]
-                            west_rikishi_ids = [
-                                [rikishi_id] * len(record)
-                                for rikishi_id, record in zip(
-                                    df_west_cleaned["rikishiID"],
-                                    df_west_cleaned["record"],
-                                )
-                            ]
-                            flat_east_rikishi_ids = [
-                                id for sublist in east_rikishi_ids for id in sublist
-                            ]
-                            flat_west_rikishi_ids = [
-                                id for sublist in west_rikishi_ids for id in sublist
-                            ]
-                            east_records["RikishiID"] = flat_east_rikishi_ids
-                            west_records["RikishiID"] = flat_west_rikishi_ids
-
-                            west_records["Fight_Number"] = (
-                                west_records.groupby("RikishiID").cumcount() + 1
-                            )
-                            east_records["Fight_Number"] = (
-                                east_records.groupby("RikishiID").cumcount() + 1
-                            )
-                            east_records["Side"] = "East"
-                            west_records["Side"] = "West"
-                            all_records = pd.concat([east_records, west_records])
-                            all_records["bashoId"] = basho
-                            matched_df = pd.merge(
-                                all_records,
-                                all_records,
-                                left_on=["opponentID", "kimarite", "Fight_Number"],
-                                right_on=["RikishiID", "kimarite", "Fight_Number"],
-                                suffixes=("_rikishi1", "_rikishi2"),
-                            )
-
-                            # Assuming final_df is your DataFrame resulting from the merge operation
-                            # Create a unique match identifier that is order-agnostic
-                            matched_df["match_id"] = matched_df.apply(
-                                lambda x: "_".join(
-                                    sorted(
-                                        [
-                                            str(x["RikishiID_rikishi1"]),
-                                            str(x["RikishiID_rikishi2"]),
-                                        ]
-                                    )
-                                )
-                                + "_"
-                                + x["kimarite"]
-                                + "_"
-                                + str(x["Fight_Number"]),
-                                axis=1,
-                            )
-
-                            unique_matches_df = matched_df.drop_duplicates(
-                                subset=["match_id"]
-                            )
-                            left_merged_df = pd.merge(
-                                all_records,
-                                all_records,
-                                left_on=["opponentID", "kimarite", "Fight_Number"],
-                                right_on=["RikishiID", "kimarite", "Fight_Number"],
-                                suffixes=("_rikishi1", "_rikishi2"),
-                                how="left",
-                                indicator=True,
-                            )
-                            no_match_df = left_merged_df[
-                                left_merged_df["_merge"] == "left_only"
-                            ]
-                            unique_matches_df.rename(
-                                columns={"bashoId_rikishi1": "bashoId"}, inplace=True
-                            )
-                            no_match_df.rename(
-                                columns={"bashoId_rikishi1": "bashoId"}, inplace=True
-                            )
-
-                            for index, row in unique_matches_df.iterrows():
-                                result_rikishi1 = (
-                                    row["result_rikishi1"]
-                                    if pd.notna(row.get("result_rikishi1", ""))
-                                    else ""
-                                )
-                                RikishiID_rikishi1 = (
-                                    row["RikishiID_rikishi1"]
-                                    if pd.notna(row.get("RikishiID_rikishi1", ""))
-                                    else ""
-                                )
-                                Side_rikishi1 = (
-                                    row["Side_rikishi1"]
-                                    if pd.notna(row.get("Side_rikishi1", ""))
-                                    else ""
-                                )
-                                kimarite = (
-                                    row["kimarite"]
-                                    if pd.notna(row.get("kimarite", ""))
-                                    else ""
-                                )
-
-                                Fight_Number = (
-                                    row["Fight_Number"]
-                                    if pd.notna(row.get("Fight_Number", 0))
-                                    else 0
-                                )
-                                result_rikishi2 = (
-                                    row["result_rikishi2"]
-                                    if pd.notna(row.get("result_rikishi2", ""))
-                                    else ""
-                                )
-                                RikishiID_rikishi2 = (
-                                    row["RikishiID_rikishi2"]
-                                    if pd.notna(row.get("RikishiID_rikishi2", ""))
-                                    else ""
-                                )
-                                Side_rikishi2 = (
-                                    row["Side_rikishi2"]
-                                    if pd.notna(row.get("Side_rikishi2", ""))
-                                    else ""
-                                )
-                                bashoId = (
-                                    row["bashoId"]
-                                    if pd.notna(row.get("bashoId", ""))
-                                    else ""
-                                )
-                                self.create_bout_node(
-                                    result_rikishi1=result_rikishi1,
-                                    RikishiID_rikishi1=RikishiID_rikishi1,
-                                    Side_rikishi1=Side_rikishi1,
-                                    kimarite=kimarite,
-                                    result_rikishi2=result_rikishi2,
-                                    Fight_Number=Fight_Number,
-                                    RikishiID_rikishi2=RikishiID_rikishi2,
-                                    Side_rikishi2=Side_rikishi2,
-                                    bashoId=bashoId,
-                                )
-                            for index, row in no_match_df.iterrows():
-                                result_rikishi1 = (
-                                    row["result_rikishi1"]
-                                    if pd.notna(row.get("result_rikishi1", ""))
-                                    else ""
-                                )
-                                RikishiID_rikishi1 = (
-                                    row["RikishiID_rikishi1"]
-                                    if pd.notna(row.get("RikishiID_rikishi1", ""))
-                                    else ""
-                                )
-                                Side_rikishi1 = (
-                                    row["Side_rikishi1"]
-                                    if pd.notna(row.get("Side_rikishi1", ""))
-                                    else ""
-                                )
-                                kimarite = (
-                                    row["kimarite"]
-                                    if pd.notna(row.get("kimarite", ""))
-                                    else ""
-                                )
-
-                                Fight_Number = (
-                                    row["Fight_Number"]
-                                    if pd.notna(row.get("Fight_Number", 0))
-                                    else 0
-                                )
-                                result_rikishi2 = (
-                                    row["result_rikishi2"]
-                                    if pd.notna(row.get("result_rikishi2", ""))
-                                    else ""
-                                )
-                                RikishiID_rikishi2 = (
-                                    row["RikishiID_rikishi2"]
-                                    if pd.notna(row.get("RikishiID_rikishi2", ""))
-                                    else ""
-                                )
-                                Side_rikishi2 = (
-                                    row["Side_rikishi2"]
-                                    if pd.notna(row.get("Side_rikishi2", ""))
-                                    else ""
-                                )
-                                bashoId = (
-                                    row["bashoId"]
-                                    if pd.notna(row.get("bashoId", ""))
-                                    else ""
-                                )
-                                self.create_bout_node(
-                                    result_rikishi1=result_rikishi1,
-                                    RikishiID_rikishi1=RikishiID_rikishi1,
-                                    Side_rikishi1=Side_rikishi1,
-                                    kimarite=kimarite,
-                                    result_rikishi2=result_rikishi2,
-                                    Fight_Number=Fight_Number,
-                                    RikishiID_rikishi2=RikishiID_rikishi2,
-                                    Side_rikishi2=Side_rikishi2,
-                                    bashoId=bashoId,
-                                )
-                        else:
-                            print(f"Skipped {filename} because of missing data")
-                            continue
-                    else:
-                        print(f"Skipped {filename} because of missing data")
-                        continue
+        with Progress(self.log, "bout nodes") as progress:
+            for basho, file_path, data in self.banzuke_documents(folder_path):
+                if self.create_bout_nodes_for_basho(basho, data):
+                    progress.update(basho=basho)
+                else:
+                    progress.skip("missing data", basho=basho, key=file_path)
 
 
 if __name__ == "__main__":
@@ -283,7 +219,8 @@ if __name__ == "__main__":
         recent_dir = loader.get_most_recent_directory(loader.data_path)
         if recent_dir:
             basho_folder_path = os.path.join(loader.data_path, recent_dir, "basho")
-            loader.load_jsons_from_folder_and_create_bout_nodes(basho_folder_path)
+            with StageProfiler("create_bout_nodes", snapshot=recent_dir):
+                loader.load_jsons_from_folder_and_create_bout_nodes(basho_folder_path)
         else:
             print("No recent directory found")
     finally:
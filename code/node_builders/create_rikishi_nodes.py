@@ -1,7 +1,9 @@
-import json
 import os
 
 from ..base_code.base_classes import AuraDBLoader
+from ..base_code.graph_sinks import CREATE_INDEX, MERGE_RIKISHI
+from ..base_code.log_config import Progress
+from ..base_code.profiling import StageProfiler
 
 
 class AuraDBLoaderRikishiNodes(AuraDBLoader):
@@ -9,30 +11,40 @@ class AuraDBLoaderRikishiNodes(AuraDBLoader):
         super().__init__()
 
     def create_rikishi_node(self, rikishi_data):
-        with self.driver.session() as session:
-            # Add a 'name' attribute that's equal to the 'id'
-            rikishi_data["rikishiID"] = rikishi_data.pop("id")
-            rikishi_data["name"] = rikishi_data["rikishiID"]
-
-            # Cypher query to merge a rikishi node, preventing duplication
-            # Cypher query to merge a rikishi node, preventing duplication
-            query = (
-                "MERGE (r:Rikishi {rikishiID: $rikishiID}) "
-                "SET r += $attributes "
-                "RETURN r"
-            )
-            session.run(
-                query, rikishiID=rikishi_data["rikishiID"], attributes=rikishi_data
-            )
+        # Add a 'name' attribute that's equal to the 'id'
+        rikishi_data["rikishiID"] = rikishi_data.pop("id")
+        rikishi_data["name"] = rikishi_data["rikishiID"]
+
+        # Cypher query to merge a rikishi node, preventing duplication
+        query = (
+            "MERGE (r:Rikishi {rikishiID: $rikishiID}) SET r += $attributes RETURN r"
+        )
+        self.run_query(
+            query,
+            operation=MERGE_RIKISHI,
+            rikishiID=rikishi_data["rikishiID"],
+            attributes=rikishi_data,
+        )
+
+    def create_rikishi_indexes(self):
+        # Every rikishi lookup (relationship builders, read_api) is by rikishiID
+        self.run_query(
+            "CREATE INDEX rikishi_rikishi_id IF NOT EXISTS "
+            "FOR (r:Rikishi) ON (r.rikishiID)",
+            operation=CREATE_INDEX,
+        )
 
     def load_jsons_and_create_rikishi_nodes(self, folder_path):
-        for filename in os.listdir(folder_path):
-            if filename.endswith(".json"):
-                file_path = os.path.join(folder_path, filename)
-                with open(file_path) as file:
-                    rikishi_data = json.load(file)
-                    self.create_rikishi_node(rikishi_data)
-                print(f"Processed {filename}")
+        with Progress(self.log, "rikishi nodes") as progress:
+            for _, rikishi in self.rikishi_documents(folder_path):
+                rikishi_data = rikishi.to_dict()
+                self.metrics.inc("rows_extracted")
+                self.create_rikishi_node(rikishi_data)
+                progress.update(rikishi=rikishi.id)
+
+    def run_create_rikishi_nodes(self, folder_path):
+        self.create_rikishi_indexes()
+        self.load_jsons_and_create_rikishi_nodes(folder_path)
 
 
 if __name__ == "__main__":
@@ -42,7 +54,8 @@ if __name__ == "__main__":
         recent_dir = loader.get_most_recent_directory(loader.data_path)
         if recent_dir:
             rikishi_folder_path = os.path.join(loader.data_path, recent_dir, "rikishi")
-            loader.load_jsons_and_create_rikishi_nodes(rikishi_folder_path)
+            with StageProfiler("create_rikishi_nodes", snapshot=recent_dir):
+                loader.run_create_rikishi_nodes(rikishi_folder_path)
         else:
             print("No recent directory found")
     finally:
@@ -0,0 +1,327 @@
+"""Run pipeline stages as tasks on a shared work queue (see work_queue).
+
+``enqueue <stage>`` plans a stage the way its script would and queues one
+task per unit of work: a (basho, division) banzuke download, a rikishi
+download, or one basho's Bout nodes. ``run <stage> --processes N`` starts N
+worker processes that claim tasks under a lease until the queue is drained;
+a task whose worker crashed is picked up again once its lease runs out,
+while a worker that is still running a task keeps renewing its lease.
+Workers on other machines can join by pointing $SUMO_WORK_QUEUE at the same
+file on a shared filesystem whose POSIX locks work across hosts.
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+from .base_code import codec
+from .base_code.base_classes import basho_keys, get_data_root
+from .base_code.log_config import stage_logger
+from .base_code.snapshot_store import open_documents, snapshot_format
+from .base_code.work_queue import DEFAULT_LEASE_SECONDS, WorkQueue, worker_name
+
+# How long an idle worker waits before looking for expired leases again
+POLL_SECONDS = 1
+# Leases are renewed this many times per lease period while a task runs
+RENEWALS_PER_LEASE = 3
+
+log = stage_logger("PipelineWorker")
+
+
+class TaskError(Exception):
+    """A task ran but did not succeed; it is retried up to max_attempts."""
+
+
+def latest_snapshot(data_path):
+    return max(d for d in os.listdir(data_path) if d.isdigit() and len(d) == 6)
+
+
+class DownloadStage:
+    """Shared by the downloaders: a failed request fails the task."""
+
+    def __init__(self):
+        # Every worker process saves into the same folder, which the shard
+        # index can't be shared for; pack the snapshot once the queue is done
+        if snapshot_format() == "shards":
+            raise ValueError(
+                "Queued downloads write per-file snapshots; run "
+                "`snapshot pack` after the queue has drained"
+            )
+
+    def fetch(self, item):
+        errors = self.query.metrics.counters.get("request_errors", 0)
+        status = self.query.query_endpoint(item)
+        if self.query.metrics.counters.get("request_errors", 0) > errors:
+            raise TaskError(f"Request for {item} failed")
+        return status
+
+    def close(self):
+        self.query.close_document_writer()
+        self.query.write_metrics_report()
+
+
+class BashoDownloadStage(DownloadStage):
+    def __init__(self):
+        from .downloaders.basho_downloader import SumoApiQueryBasho
+
+        super().__init__()
+        self.query = SumoApiQueryBasho()
+        self.query.setup_logging()
+        # The planner needs the current basho to know what not to cache
+        self.query.generate_timestamps()
+        self.query.planner.current_basho_id = max(self.query.iters)
+
+    @classmethod
+    def tasks(cls):
+        from .downloaders.basho_downloader import SumoApiQueryBasho
+
+        query = SumoApiQueryBasho()
+        query.generate_timestamps()
+        jobs = query.planner.plan(query.iters, query.divisions)
+        return [
+            {"snapshot": query.now, "basho_id": job.basho_id, "division": job.division}
+            for job in jobs
+        ]
+
+    def execute(self, payload):
+        from .downloaders.download_planner import DownloadJob
+
+        self.query.output_dir = str(get_data_root() / payload["snapshot"] / "basho")
+        self.fetch(DownloadJob(payload["basho_id"], payload["division"]))
+
+    def close(self):
+        super().close()
+        # The rikishi id index isn't written, as each worker only saw part of
+        # the snapshot; the rikishi downloader reads the banzuke instead
+        self.query.planner.save()
+
+
+class RikishiDownloadStage(DownloadStage):
+    def __init__(self):
+        from .downloaders.rikishi_downloader import SumoApiQueryRikishi
+
+        super().__init__()
+        self.query = SumoApiQueryRikishi()
+        self.query.setup_logging()
+
+    @classmethod
+    def tasks(cls):
+        from .downloaders.rikishi_downloader import SumoApiQueryRikishi
+
+        query = SumoApiQueryRikishi()
+        query.process_latest_directory()
+        query.close_document_writer()
+        return [
+            {"snapshot": query.now, "rikishi_id": rikishi_id}
+            for rikishi_id in sorted(query.iters or ())
+        ]
+
+    def execute(self, payload):
+        self.query.output_dir = str(get_data_root() / payload["snapshot"] / "rikishi")
+        os.makedirs(self.query.output_dir, exist_ok=True)
+        self.fetch(payload["rikishi_id"])
+
+
+class BoutNodesStage:
+    def __init__(self):
+        from .node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+
+        self.loader = AuraDBLoaderBoutNodes()
+        self.documents = {}
+
+    @classmethod
+    def tasks(cls):
+        from .base_code.base_classes import selected_divisions
+
+        snapshot = latest_snapshot(get_data_root())
+        folder_path = str(get_data_root() / snapshot / "basho")
+        keys = open_documents(folder_path).keys()
+        return [
+            {"snapshot": snapshot, "basho": basho, "key": key}
+            for basho, key in basho_keys(keys, selected_divisions())
+        ]
+
+    def execute(self, payload):
+        snapshot = payload["snapshot"]
+        if snapshot not in self.documents:
+            folder_path = str(get_data_root() / snapshot / "basho")
+            self.documents[snapshot] = open_documents(folder_path)
+        body = self.documents[snapshot].get(payload["key"])
+        if body is None:
+            raise TaskError(f"No banzuke {payload['key']} in {snapshot}")
+        with self.loader.metrics.timer("json_parse_seconds"):
+            banzuke = codec.decode_banzuke(body)
+        self.loader.create_bout_nodes_for_basho(payload["basho"], banzuke)
+
+    def close(self):
+        self.loader.close()
+
+
+STAGES = {
+    "download-basho": BashoDownloadStage,
+    "download-rikishi": RikishiDownloadStage,
+    "bout-nodes": BoutNodesStage,
+}
+
+
+class LeaseHeartbeat:
+    """Renew a task's lease from a background thread while it executes.
+
+    The thread has its own queue connection, as SQLite connections stay on
+    the thread that opened them. ``lost`` is set if another worker took the
+    task over anyway (this one stalled past a whole lease).
+    """
+
+    def __init__(self, queue_path, task, owner, lease_seconds):
+        self.queue_path = queue_path
+        self.task = task
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _renew(self):
+        queue = WorkQueue(self.queue_path)
+        try:
+            while not self._stop.wait(self.lease_seconds / RENEWALS_PER_LEASE):
+                if not queue.extend(self.task, self.owner, self.lease_seconds):
+                    self.lost = True
+                    log.warning("Lost the lease on task %s", self.task.id)
+                    return
+        finally:
+            queue.close()
+
+
+def enqueue(queue, stage, reset=False):
+    return queue.enqueue(stage, STAGES[stage].tasks(), reset=reset)
+
+
+def run_worker(
+    queue_path,
+    stage,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+    poll_seconds=POLL_SECONDS,
+    stages=None,
+):
+    """Claim and execute ``stage`` tasks until none are pending or leased.
+
+    Returns (completed, failed) counts for this worker.
+    """
+    queue = WorkQueue(queue_path)
+    owner = worker_name()
+    runner = (stages or STAGES)[stage]()
+    completed = failed = 0
+    try:
+        while True:
+            tasks = queue.claim(stage, owner, lease_seconds=lease_seconds)
+            if not tasks:
+                # Other workers may still hold leases that will expire
+                if not queue.remaining(stage):
+                    break
+                time.sleep(poll_seconds)
+                continue
+            task = tasks[0]
+            try:
+                with LeaseHeartbeat(queue_path, task, owner, lease_seconds):
+                    runner.execute(task.payload)
+            except Exception as e:
+                log.exception(
+                    "Task %s failed",
+                    task.id,
+                    extra={"task_stage": stage, "payload": task.payload},
+                )
+                queue.fail(task, owner, e)
+                failed += 1
+                continue
+            if queue.complete(task, owner):
+                completed += 1
+            else:
+                # Stalled past its lease and someone else took it over
+                log.warning("Lost the lease on task %s", task.id)
+    finally:
+        try:
+            runner.close()
+        finally:
+            queue.close()
+    return completed, failed
+
+
+def run_workers(queue_path, stage, processes, lease_seconds=DEFAULT_LEASE_SECONDS):
+    workers = [
+        multiprocessing.Process(
+            target=run_worker, args=(queue_path, stage, lease_seconds)
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+
+def print_status(queue):
+    stats = queue.stats()
+    if not stats:
+        print("The queue is empty")
+    for stage, states in sorted(stats.items()):
+        summary = ", ".join(
+            f"{count} {state}" for state, count in sorted(states.items())
+        )
+        print(f"{stage}: {summary}")
+        for payload, attempts, error in queue.failures(stage)[:10]:
+            print(f"  failed after {attempts} attempts: {payload}: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Queue pipeline stages and run them in worker processes"
+    )
+    parser.add_argument(
+        "--queue", help="Queue file (default $SUMO_WORK_QUEUE, else state/)"
+    )
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    enqueue_parser = subparsers.add_parser("enqueue", help="Queue a stage's tasks")
+    enqueue_parser.add_argument("stage", choices=sorted(STAGES))
+    enqueue_parser.add_argument(
+        "--reset", action="store_true", help="Run tasks already done again"
+    )
+    run_parser = subparsers.add_parser("run", help="Work through a stage's tasks")
+    run_parser.add_argument("stage", choices=sorted(STAGES))
+    run_parser.add_argument("--processes", type=int, default=4)
+    run_parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS)
+    subparsers.add_parser("status", help="Count tasks by stage and state")
+    args = parser.parse_args(argv)
+
+    queue_path = args.queue or WorkQueue.default_path()
+    if args.action == "run":
+        start = time.perf_counter()
+        exit_codes = run_workers(
+            queue_path, args.stage, args.processes, args.lease_seconds
+        )
+        print(
+            f"{len(exit_codes)} workers finished in {time.perf_counter() - start:.1f}s"
+        )
+    queue = WorkQueue(queue_path)
+    try:
+        if args.action == "enqueue":
+            added = enqueue(queue, args.stage, reset=args.reset)
+            print(f"Queued {added} new {args.stage} tasks")
+        print_status(queue)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
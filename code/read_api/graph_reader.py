@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from neo4j import READ_ACCESS, GraphDatabase
+
+from ..base_code.base_classes import LOAD_VERSION_QUERY, get_project_root
+from ..base_code.log_config import stage_logger
+from ..base_code.metrics import StageMetrics
+
+# Parameterised reads for the dashboards. Each one starts from an indexed
+# lookup (Rikishi.rikishiID and Basho.bashoId, indexed by the node builders)
+# or a precomputed relationship (FACED) rather than scanning Bout nodes.
+READ_QUERIES = {
+    "career_record": """
+        MATCH (:Rikishi {rikishiID: $rikishiId})-[:RIKISHI_IN_BOUT_EVENT]->(b:Bout)
+        WITH b.bashoId AS bashoId,
+             CASE WHEN b.rikishiId_rikishi1 = $rikishiId
+                  THEN b.result_rikishi1 ELSE b.result_rikishi2 END AS result
+        RETURN bashoId,
+               sum(CASE WHEN result IN ['win', 'fusen win'] THEN 1 ELSE 0 END) AS wins,
+               sum(CASE WHEN result IN ['loss', 'fusen loss'] THEN 1 ELSE 0 END) AS losses,
+               count(*) AS bouts
+        ORDER BY bashoId""",
+    "head_to_head": """
+        MATCH (:Rikishi {rikishiID: $rikishiId})-[f:FACED]->(:Rikishi {rikishiID: $opponentId})
+        RETURN f.wins AS wins, f.losses AS losses, f.bouts AS bouts,
+               f.firstBashoId AS firstBashoId, f.lastBashoId AS lastBashoId,
+               f.kimarite AS kimarite, f.kimariteCounts AS kimariteCounts""",
+    "basho_results": """
+        MATCH (:Basho {bashoId: $bashoId})-[:BOUT_EVENT]->(b:Bout)
+        UNWIND [[b.rikishiId_rikishi1, b.result_rikishi1],
+                [b.rikishiId_rikishi2, b.result_rikishi2]] AS side
+        WITH side[0] AS rikishiId, side[1] AS result
+        WHERE rikishiId <> ''
+        RETURN rikishiId,
+               sum(CASE WHEN result IN ['win', 'fusen win'] THEN 1 ELSE 0 END) AS wins,
+               sum(CASE WHEN result IN ['loss', 'fusen loss'] THEN 1 ELSE 0 END) AS losses
+        ORDER BY wins DESC, losses ASC""",
+    "kimarite_frequency": """
+        MATCH (:Basho {bashoId: $bashoId})-[:BOUT_EVENT]->(b:Bout)
+        WHERE b.kimarite <> ''
+        RETURN b.kimarite AS kimarite, count(*) AS bouts
+        ORDER BY bouts DESC""",
+}
+
+
+class LRUCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class SumoGraphReader:
+    """Cached read side of the graph.
+
+    Answers are cached in an in-process LRU and, with ``cache_dir``, on disk,
+    keyed by the graph's load version. Loaders bump that version whenever
+    they close after writing, so cached answers are served until the next
+    load. The version itself is re-read at most every ``version_ttl`` seconds.
+
+    Reads go straight to Neo4j in read sessions; unlike the loaders there is
+    no graph sink and nothing is written.
+    """
+
+    def __init__(self, max_size=256, cache_dir=None, version_ttl=5.0):
+        load_dotenv()
+        self.driver = GraphDatabase.driver(
+            os.environ.get("uri"),
+            auth=(os.environ.get("username"), os.environ.get("password")),
+        )
+        self.metrics = StageMetrics(type(self).__name__)
+        self.log = stage_logger(type(self).__name__)
+        self.metrics_dir = os.environ.get(
+            "SUMO_METRICS_DIR", str(get_project_root() / "metrics")
+        )
+        self.cache = LRUCache(max_size)
+        self.cache_dir = cache_dir
+        self.version_ttl = version_ttl
+        self._version = None
+        self._version_checked_at = None
+
+    def close(self):
+        try:
+            self.driver.close()
+        finally:
+            self.write_metrics_report()
+
+    def write_metrics_report(self):
+        if self.metrics.is_empty():
+            return None
+        try:
+            return self.metrics.write_report(self.metrics_dir)
+        except OSError as e:
+            self.log.error("Could not write metrics report: %s", e)
+
+    @classmethod
+    def default_cache_dir(cls):
+        return str(get_project_root() / "cache" / "read_api")
+
+    def _run_read(self, query, **params):
+        with (
+            self.metrics.timer("query_seconds"),
+            self.driver.session(default_access_mode=READ_ACCESS) as session,
+        ):
+            return [record.data() for record in session.run(query, **params)]
+
+    def load_version(self):
+        now = time.monotonic()
+        if (
+            self._version_checked_at is not None
+            and now - self._version_checked_at < self.version_ttl
+        ):
+            return self._version
+        records = self._run_read(LOAD_VERSION_QUERY)
+        version = records[0]["version"] if records else 0
+        if version != self._version:
+            self.cache.clear()
+            self._prune_disk_cache(version)
+        self._version = version
+        self._version_checked_at = now
+        return version
+
+    def _disk_path(self, version, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, str(version), f"{digest}.json")
+
+    def _prune_disk_cache(self, version):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.listdir(self.cache_dir):
+            if entry != str(version):
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+
+    def read(self, name, **params):
+        """Run the READ_QUERIES entry ``name``, serving cached answers when fresh."""
+        start = time.perf_counter()
+        version = self.load_version()
+        key = json.dumps([name, params], sort_keys=True, default=str)
+        result = self.cache.get(key)
+        if result is not None:
+            self.metrics.inc("cache_hits")
+        elif self.cache_dir and os.path.exists(self._disk_path(version, key)):
+            with open(self._disk_path(version, key)) as file:
+                result = json.load(file)
+            self.cache.put(key, result)
+            self.metrics.inc("disk_cache_hits")
+        else:
+            result = self._run_read(READ_QUERIES[name], **params)
+            self.cache.put(key, result)
+            self.metrics.inc("cache_misses")
+            if self.cache_dir:
+                path = self._disk_path(version, key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as file:
+                    json.dump(result, file, default=str)
+        self.metrics.observe("read_seconds", time.perf_counter() - start)
+        return result
+
+    def career_record(self, rikishi_id):
+        return self.read("career_record", rikishiId=rikishi_id)
+
+    def head_to_head(self, rikishi_id, opponent_id):
+        records = self.read(
+            "head_to_head", rikishiId=rikishi_id, opponentId=opponent_id
+        )
+        return records[0] if records else None
+
+    def basho_results(self, basho_id):
+        return self.read("basho_results", bashoId=basho_id)
+
+    def kimarite_frequency(self, basho_id):
+        return self.read("kimarite_frequency", bashoId=basho_id)
+
+    def cache_stats(self):
+        counters = self.metrics.counters
+        hits = counters.get("cache_hits", 0) + counters.get("disk_cache_hits", 0)
+        reads = hits + counters.get("cache_misses", 0)
+        latency = self.metrics.histograms.get("read_seconds")
+        return {
+            "load_version": self._version,
+            "reads": reads,
+            "hits": hits,
+            "disk_hits": counters.get("disk_cache_hits", 0),
+            "hit_rate": round(hits / reads, 4) if reads else None,
+            "mean_read_ms": (
+                round(1000 * latency.sum / latency.count, 3) if latency else None
+            ),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a cached read query")
+    parser.add_argument("name", choices=sorted(READ_QUERIES))
+    parser.add_argument("params", nargs="*", help="key=value, e.g. rikishiId=8850")
+    parser.add_argument("--no-disk-cache", action="store_true")
+    args = parser.parse_args()
+    params = {}
+    for param in args.params:
+        key, value = param.split("=", 1)
+        # rikishi ids are stored as integers, bashoIds as YYYYMM strings
+        params[key] = int(value) if key != "bashoId" and value.isdigit() else value
+    reader = SumoGraphReader(
+        cache_dir=None if args.no_disk_cache else SumoGraphReader.default_cache_dir()
+    )
+    try:
+        print(json.dumps(reader.read(args.name, **params), indent=2, default=str))
+        print(json.dumps(reader.cache_stats(), indent=2))
+    finally:
+        reader.close()
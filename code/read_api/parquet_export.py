@@ -0,0 +1,249 @@
+import argparse
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from neo4j import READ_ACCESS, GraphDatabase
+
+from ..base_code.base_classes import get_project_root
+from ..base_code.log_config import stage_logger
+from ..base_code.metrics import StageMetrics
+from ..base_code.profiling import StageProfiler
+
+# Node tables with an indexed key are read in keyset pages: WHERE key > $after
+# ORDER BY key LIMIT n, each page an index seek. Tables without one (key None)
+# are streamed by a single query, as paging on an unindexed key rescans the
+# graph for every page. Bouts are identified by elementId. Columns are (name,
+# Cypher expression, Arrow type), so every Parquet row group has the same
+# schema whatever the page held.
+EXPORT_TABLES = {
+    "basho": {
+        "match": "MATCH (b:Basho)",
+        "key": "b.bashoId",
+        "start": "",
+        "columns": [
+            ("bashoId", "b.bashoId", pa.string()),
+            ("date", "toString(b.date)", pa.string()),
+            ("ordinal", "b.ordinal", pa.int64()),
+        ],
+    },
+    "rikishi": {
+        "match": "MATCH (r:Rikishi)",
+        "key": "r.rikishiID",
+        "start": -1,
+        "columns": [
+            ("rikishiID", "r.rikishiID", pa.int64()),
+            ("shikonaEn", "r.shikonaEn", pa.string()),
+            ("heya", "r.heya", pa.string()),
+            ("birthDate", "r.birthDate", pa.string()),
+            ("shusshin", "r.shusshin", pa.string()),
+            ("height", "r.height", pa.float64()),
+            ("weight", "r.weight", pa.float64()),
+            ("debut", "r.debut", pa.string()),
+            ("elo", "r.elo", pa.float64()),
+        ],
+    },
+    "bout": {
+        "match": "MATCH (b:Bout)",
+        "key": None,
+        "columns": [
+            ("boutId", "elementId(b)", pa.string()),
+            ("bashoId", "b.bashoId", pa.string()),
+            ("fightNumber", "b.fightNumber", pa.int64()),
+            ("kimarite", "b.kimarite", pa.string()),
+            ("rikishiId_rikishi1", "b.rikishiId_rikishi1", pa.int64()),
+            ("result_rikishi1", "b.result_rikishi1", pa.string()),
+            ("side_rikishi1", "b.side_rikishi1", pa.string()),
+            ("rikishiId_rikishi2", "b.rikishiId_rikishi2", pa.int64()),
+            ("result_rikishi2", "b.result_rikishi2", pa.string()),
+            ("side_rikishi2", "b.side_rikishi2", pa.string()),
+        ],
+    },
+    "bout_event": {
+        "match": "MATCH (s:Basho)-[e:BOUT_EVENT]->(b:Bout)",
+        "key": None,
+        "columns": [
+            ("bashoId", "s.bashoId", pa.string()),
+            ("boutId", "elementId(b)", pa.string()),
+        ],
+    },
+    "rikishi_in_bout_event": {
+        "match": "MATCH (r:Rikishi)-[e:RIKISHI_IN_BOUT_EVENT]->(b:Bout)",
+        "key": None,
+        "columns": [
+            ("rikishiID", "r.rikishiID", pa.int64()),
+            ("boutId", "elementId(b)", pa.string()),
+        ],
+    },
+    "faced": {
+        "match": "MATCH (a:Rikishi)-[f:FACED]->(b:Rikishi)",
+        "key": None,
+        "columns": [
+            ("rikishiId", "a.rikishiID", pa.int64()),
+            ("opponentId", "b.rikishiID", pa.int64()),
+            ("wins", "f.wins", pa.int64()),
+            ("losses", "f.losses", pa.int64()),
+            ("bouts", "f.bouts", pa.int64()),
+            ("firstBashoId", "f.firstBashoId", pa.string()),
+            ("lastBashoId", "f.lastBashoId", pa.string()),
+            ("kimarite", "f.kimarite", pa.list_(pa.string())),
+            ("kimariteCounts", "f.kimariteCounts", pa.list_(pa.int64())),
+        ],
+    },
+    "ranked_in": {
+        "match": "MATCH (r:Rikishi)-[x:RANKED_IN]->(b:Basho)",
+        "key": None,
+        "columns": [
+            ("rikishiId", "r.rikishiID", pa.int64()),
+            ("bashoId", "b.bashoId", pa.string()),
+            ("rank", "x.rank", pa.string()),
+            ("rankValue", "x.rankValue", pa.int64()),
+            ("side", "x.side", pa.string()),
+        ],
+    },
+}
+
+
+def keyset_query(table):
+    columns = ", ".join(
+        f"{expression} AS {name}" for name, expression, _ in table["columns"]
+    )
+    if table["key"] is None:
+        return f"{table['match']} RETURN {columns}"
+    return (
+        f"{table['match']} WHERE {table['key']} > $after "
+        f"RETURN {table['key']} AS _key, {columns} "
+        f"ORDER BY _key LIMIT $page_size"
+    )
+
+
+def table_schema(table):
+    return pa.schema([(name, arrow_type) for name, _, arrow_type in table["columns"]])
+
+
+def _clean(value, arrow_type):
+    # Bouts against rikishi missing from the banzuke store "" as the id
+    if value == "" and not pa.types.is_string(arrow_type):
+        return None
+    return value
+
+
+class GraphParquetExporter:
+    """Stream graph tables into Parquet files, in keyset pages or one query.
+
+    Records are pulled with the driver's ``fetch_size`` and turned into
+    Arrow record batches of ``batch_rows`` rows as they arrive, so memory
+    holds at most one batch per table rather than the whole result.
+
+    Like the read API it only reads, in read sessions: there is no graph
+    sink and closing it doesn't bump the load version.
+    """
+
+    def __init__(self, page_size=50000, fetch_size=5000, batch_rows=10000):
+        load_dotenv()
+        self.driver = GraphDatabase.driver(
+            os.environ.get("uri"),
+            auth=(os.environ.get("username"), os.environ.get("password")),
+        )
+        self.metrics = StageMetrics(type(self).__name__)
+        self.log = stage_logger(type(self).__name__)
+        self.metrics_dir = os.environ.get(
+            "SUMO_METRICS_DIR", str(get_project_root() / "metrics")
+        )
+        self.page_size = page_size
+        self.fetch_size = fetch_size
+        self.batch_rows = batch_rows
+
+    def close(self):
+        try:
+            self.driver.close()
+        finally:
+            self.write_metrics_report()
+
+    def write_metrics_report(self):
+        if self.metrics.is_empty():
+            return None
+        try:
+            return self.metrics.write_report(self.metrics_dir)
+        except OSError as e:
+            self.log.error("Could not write metrics report: %s", e)
+
+    def export_table(self, name, output_dir):
+        table = EXPORT_TABLES[name]
+        schema = table_schema(table)
+        query = keyset_query(table)
+        path = os.path.join(output_dir, f"{name}.parquet")
+        paged = table["key"] is not None
+        params = {"after": table["start"], "page_size": self.page_size} if paged else {}
+        rows = 0
+        columns = {field.name: [] for field in schema}
+
+        def flush(writer):
+            if columns[schema.names[0]]:
+                batch = pa.record_batch(
+                    [
+                        pa.array(columns[field.name], type=field.type)
+                        for field in schema
+                    ],
+                    schema=schema,
+                )
+                writer.write_batch(batch)
+                for values in columns.values():
+                    values.clear()
+
+        os.makedirs(output_dir, exist_ok=True)
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            with self.driver.session(
+                default_access_mode=READ_ACCESS, fetch_size=self.fetch_size
+            ) as session:
+                while True:
+                    with self.metrics.timer("export_page_seconds"):
+                        page_rows = 0
+                        for record in session.run(query, **params):
+                            data = record.data()
+                            if paged:
+                                params["after"] = data["_key"]
+                            for field in schema:
+                                columns[field.name].append(
+                                    _clean(data[field.name], field.type)
+                                )
+                            page_rows += 1
+                            if len(columns[schema.names[0]]) >= self.batch_rows:
+                                flush(writer)
+                    rows += page_rows
+                    self.metrics.inc("export_pages")
+                    if not paged or page_rows < self.page_size:
+                        break
+            flush(writer)
+        self.metrics.inc("rows_exported", rows)
+        self.log.info("Exported %s rows to %s", rows, path)
+        return rows
+
+    def run_export(self, output_dir, tables=None):
+        return {
+            name: self.export_table(name, output_dir)
+            for name in tables or EXPORT_TABLES
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the graph to Parquet")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES))
+    parser.add_argument("--output-dir")
+    parser.add_argument("--page-size", type=int, default=50000)
+    parser.add_argument("--fetch-size", type=int, default=5000)
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+    output_dir = args.output_dir or str(
+        get_project_root() / "exports" / datetime.now().strftime("%Y%m%dT%H%M%S")
+    )
+    exporter = GraphParquetExporter(
+        page_size=args.page_size, fetch_size=args.fetch_size
+    )
+    try:
+        with StageProfiler("parquet_export"):
+            exporter.run_export(output_dir, args.tables)
+    finally:
+        exporter.close()
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from ..base_code import codec
+from ..base_code.base_classes import basho_keys, get_data_root, get_project_root
+from ..base_code.graph_sinks import BOUT_KEY_PARAMS
+from ..base_code.profiling import StageProfiler
+from ..base_code.snapshot_store import open_documents
+from ..node_builders.create_basho_nodes import basho_date, basho_ordinal
+from ..node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+
+RIKISHI_COLUMNS = (
+    "shikonaEn",
+    "shikonaJp",
+    "heya",
+    "birthDate",
+    "shusshin",
+    "height",
+    "weight",
+    "debut",
+    "intai",
+    "sumodbId",
+    "nskId",
+)
+
+# Same tables and merge keys as the graph: bouts are unique on the nine
+# bout properties, relationships only join nodes that exist
+SCHEMA = f"""
+CREATE TABLE basho (
+    bashoId TEXT PRIMARY KEY,
+    date TEXT,
+    ordinal INTEGER
+);
+CREATE TABLE rikishi (
+    rikishiID INTEGER PRIMARY KEY,
+    {", ".join(RIKISHI_COLUMNS)}
+);
+CREATE TABLE bout (
+    boutId INTEGER PRIMARY KEY,
+    result_rikishi1 TEXT,
+    rikishiId_rikishi1 INTEGER,
+    side_rikishi1 TEXT,
+    kimarite TEXT,
+    fightNumber INTEGER,
+    result_rikishi2 TEXT,
+    rikishiId_rikishi2 INTEGER,
+    side_rikishi2 TEXT,
+    bashoId TEXT
+);
+-- MERGE key of Bout nodes. IFNULL because UNIQUE treats NULLs as distinct
+CREATE UNIQUE INDEX bout_merge_key ON bout (
+    bashoId, fightNumber, kimarite,
+    IFNULL(rikishiId_rikishi1, ''), result_rikishi1, side_rikishi1,
+    IFNULL(rikishiId_rikishi2, ''), result_rikishi2, side_rikishi2
+);
+CREATE TABLE bout_event (
+    bashoId TEXT NOT NULL,
+    boutId INTEGER NOT NULL
+);
+CREATE TABLE rikishi_in_bout_event (
+    rikishiID INTEGER NOT NULL,
+    boutId INTEGER NOT NULL
+);
+"""
+
+# Created after the bulk insert, which is much faster than maintaining them
+INDEXES = """
+CREATE INDEX bout_basho ON bout (bashoId, fightNumber);
+CREATE INDEX bout_event_basho ON bout_event (bashoId, boutId);
+CREATE INDEX rikishi_in_bout_event_rikishi ON rikishi_in_bout_event (rikishiID, boutId);
+CREATE INDEX rikishi_in_bout_event_bout ON rikishi_in_bout_event (boutId);
+"""
+
+VIEWS = """
+CREATE VIEW rikishi_bout AS
+SELECT e.rikishiID,
+       b.boutId,
+       b.bashoId,
+       b.fightNumber,
+       b.kimarite,
+       CASE WHEN b.rikishiId_rikishi1 = e.rikishiID
+            THEN b.result_rikishi1 ELSE b.result_rikishi2 END AS result,
+       CASE WHEN b.rikishiId_rikishi1 = e.rikishiID
+            THEN b.rikishiId_rikishi2 ELSE b.rikishiId_rikishi1 END AS opponentId
+FROM rikishi_in_bout_event e
+JOIN bout b ON b.boutId = e.boutId;
+
+CREATE VIEW career_record AS
+SELECT rikishiID,
+       bashoId,
+       SUM(result IN ('win', 'fusen win')) AS wins,
+       SUM(result IN ('loss', 'fusen loss')) AS losses,
+       COUNT(*) AS bouts
+FROM rikishi_bout
+GROUP BY rikishiID, bashoId;
+
+CREATE VIEW head_to_head AS
+SELECT rikishiID,
+       opponentId,
+       SUM(result IN ('win', 'fusen win')) AS wins,
+       SUM(result IN ('loss', 'fusen loss')) AS losses,
+       COUNT(*) AS bouts,
+       MIN(bashoId) AS firstBashoId,
+       MAX(bashoId) AS lastBashoId
+FROM rikishi_bout
+WHERE opponentId IS NOT NULL
+GROUP BY rikishiID, opponentId;
+"""
+
+
+def _bout_rows(frame):
+    """Bout tuples in BOUT_KEY_PARAMS order, built column by column.
+
+    Same values as bout_row_to_params, except that a missing rikishi id is
+    NULL rather than "".
+    """
+    columns = []
+    for name in BOUT_KEY_PARAMS:
+        default = 0 if name == "Fight_Number" else ""
+        if name not in frame:
+            columns.append([default] * len(frame))
+        elif name.startswith("RikishiID"):
+            columns.append(
+                [
+                    None if pd.isna(value) or value == "" else int(value)
+                    for value in frame[name].tolist()
+                ]
+            )
+        else:
+            column = frame[name].astype(object)
+            columns.append(column.where(column.notna(), default).tolist())
+    return list(zip(*columns))
+
+
+class SqliteReplica:
+    """The snapshot as an embedded SQLite database, for offline queries and CI.
+
+    ``build`` loads the same basho/rikishi JSON the Neo4j builders consume
+    into indexed tables mirroring the graph (Basho, Rikishi, Bout,
+    BOUT_EVENT, RIKISHI_IN_BOUT_EVENT) plus views for common traversals.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+
+    @classmethod
+    def default_path(cls, snapshot):
+        return str(get_project_root() / "replica" / f"{snapshot}.sqlite")
+
+    @classmethod
+    def build(cls, snapshot_dir, db_path):
+        """Build into a temporary file and swap it in once complete."""
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        tmp_path = f"{db_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            # A half-built replica is thrown away, so skip the durability work
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.executescript(SCHEMA)
+            with connection:
+                cls._load_basho_and_bouts(
+                    connection, os.path.join(snapshot_dir, "basho")
+                )
+                cls._load_rikishi(connection, os.path.join(snapshot_dir, "rikishi"))
+                connection.execute(
+                    "INSERT INTO bout_event "
+                    "SELECT b.bashoId, b.boutId FROM bout b "
+                    "JOIN basho s ON s.bashoId = b.bashoId"
+                )
+                # A bout where both sides are the same rikishi yields one row
+                connection.execute(
+                    "INSERT INTO rikishi_in_bout_event "
+                    "SELECT DISTINCT r.rikishiID, b.boutId FROM bout b "
+                    "JOIN rikishi r ON r.rikishiID IN "
+                    "(b.rikishiId_rikishi1, b.rikishiId_rikishi2)"
+                )
+            connection.executescript(INDEXES)
+            connection.executescript(VIEWS)
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+        os.replace(tmp_path, db_path)
+        return cls(db_path)
+
+    @staticmethod
+    def _load_basho_and_bouts(connection, folder_path):
+        documents = open_documents(folder_path)
+        for basho, key in basho_keys(documents.keys()):
+            banzuke = codec.decode_banzuke(documents.get(key))
+            basho_id = banzuke.bashoId
+            if basho_id:
+                connection.execute(
+                    "INSERT OR IGNORE INTO basho VALUES (?, ?, ?)",
+                    (
+                        basho_id,
+                        basho_date(basho_id).isoformat(),
+                        basho_ordinal(basho_id),
+                    ),
+                )
+            bouts = AuraDBLoaderBoutNodes.extract_bouts(banzuke, basho)
+            if bouts is None:
+                continue
+            for frame in bouts:
+                rows = _bout_rows(frame)
+                connection.executemany(
+                    "INSERT OR IGNORE INTO bout (result_rikishi1, rikishiId_rikishi1, "
+                    "side_rikishi1, kimarite, fightNumber, result_rikishi2, "
+                    "rikishiId_rikishi2, side_rikishi2, bashoId) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    @staticmethod
+    def _load_rikishi(connection, folder_path):
+        rows = []
+        # Streamed in storage order rather than looked up key by key
+        for _, body in open_documents(folder_path):
+            rikishi = codec.decode_rikishi(body)
+            rows.append(
+                (rikishi.get("id"), *(rikishi.get(name) for name in RIKISHI_COLUMNS))
+            )
+        placeholders = ", ".join("?" * (len(RIKISHI_COLUMNS) + 1))
+        connection.executemany(
+            f"INSERT OR REPLACE INTO rikishi VALUES ({placeholders})", rows
+        )
+
+    def query(self, sql, *params):
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def career_record(self, rikishi_id):
+        return self.query(
+            "SELECT bashoId, wins, losses, bouts FROM career_record "
+            "WHERE rikishiID = ? ORDER BY bashoId",
+            rikishi_id,
+        )
+
+    def head_to_head(self, rikishi_id, opponent_id):
+        records = self.query(
+            "SELECT wins, losses, bouts, firstBashoId, lastBashoId "
+            "FROM head_to_head WHERE rikishiID = ? AND opponentId = ?",
+            rikishi_id,
+            opponent_id,
+        )
+        return records[0] if records else None
+
+    def counts(self):
+        return {
+            table: self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[
+                0
+            ]
+            for table in (
+                "basho",
+                "rikishi",
+                "bout",
+                "bout_event",
+                "rikishi_in_bout_event",
+            )
+        }
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a SQLite replica of a snapshot")
+    parser.add_argument("--snapshot", help="YYYYMM directory under data/")
+    parser.add_argument(
+        "--output", help="Database path (default replica/<snapshot>.sqlite)"
+    )
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+    data_path = str(get_data_root())
+    snapshot = args.snapshot or max(
+        d for d in os.listdir(data_path) if d.isdigit() and len(d) == 6
+    )
+    start = time.perf_counter()
+    with StageProfiler("sqlite_replica", snapshot=snapshot):
+        replica = SqliteReplica.build(
+            os.path.join(data_path, snapshot),
+            args.output or SqliteReplica.default_path(snapshot),
+        )
+    counts = replica.counts()
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(counts, indent=2))
+    replica.close()
@@ -1,7 +1,9 @@
-import json
 import os
 
 from ..base_code.base_classes import AuraDBLoader
+from ..base_code.graph_sinks import MERGE_BASHO_BOUT
+from ..base_code.log_config import Progress
+from ..base_code.profiling import StageProfiler
 
 
 class AuraDBLoaderBashoBoutRelationships(AuraDBLoader):
@@ -9,33 +11,27 @@ class AuraDBLoaderBashoBoutRelationships(AuraDBLoader):
         super().__init__()
 
     def create_basho_bout_relationship(self, bashoId):
-        with self.driver.session() as session:
-            query = """
+        query = """
             MATCH (b:Basho), (b2:Bout)
             WHERE b.bashoId = $bashoId AND b2.bashoId = $bashoId
             MERGE (b)-[:BOUT_EVENT]->(b2)
             """
-            result = session.run(query, bashoId=bashoId)
-            record = result.single()
-            if record is None:
-                return None  # Or handle this case as you see fit
-            return record[0]
+        record = self.run_query(query, operation=MERGE_BASHO_BOUT, bashoId=bashoId)
+        if record is None:
+            return None  # Or handle this case as you see fit
+        return record[0]
 
     def run_create_basho_bout_relationship(self, folder_path):
-        for filename in os.listdir(folder_path):
-            if filename.endswith(".json"):
-                file_path = os.path.join(folder_path, filename)
-                with open(file_path) as file:
-                    data = json.load(file)
-                    basho_id = data.get(
-                        "bashoId", ""
-                    )  # Get bashoId or default to empty string
-                    if basho_id:
-                        print(basho_id)  # Check if basho_id is not empty
-                        self.create_basho_bout_relationship(bashoId=basho_id)
-                        print(f"Processed and created relationships for {basho_id}")
-                    else:
-                        print(f"Skipped {filename} due to empty bashoId")
+        documents = self.banzuke_documents(folder_path, unique=True)
+        with Progress(self.log, "basho bout relationships") as progress:
+            for _, file_path, banzuke in documents:
+                basho_id = banzuke.bashoId
+                if basho_id:  # Check if basho_id is not empty
+                    self.metrics.inc("rows_extracted")
+                    self.create_basho_bout_relationship(bashoId=basho_id)
+                    progress.update(basho=basho_id)
+                else:
+                    progress.skip("empty bashoId", key=file_path)
 
 
 if __name__ == "__main__":
@@ -45,7 +41,8 @@ if __name__ == "__main__":
         recent_dir = loader.get_most_recent_directory(loader.data_path)
         if recent_dir:
             basho_folder_path = os.path.join(loader.data_path, recent_dir, "basho")
-            loader.run_create_basho_bout_relationship(basho_folder_path)
+            with StageProfiler("create_basho_bout_relationships", snapshot=recent_dir):
+                loader.run_create_basho_bout_relationship(basho_folder_path)
         else:
             print("No recent directory found")
     finally:
@@ -0,0 +1,154 @@
+import os
+import sys
+
+import pandas as pd
+
+from ..base_code.base_classes import get_project_root
+from ..base_code.graph_sinks import MERGE_RIKISHI_FACED
+from ..base_code.profiling import StageProfiler
+from ..node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
+
+WIN_RESULTS = ["win", "fusen win"]
+LOSS_RESULTS = ["loss", "fusen loss"]
+PAIR_COLUMNS = ["rikishiId", "opponentId"]
+# One row per (pair, basho, kimarite); kept on disk so later runs only parse new bashos
+COUNT_COLUMNS = PAIR_COLUMNS + ["bashoId", "kimarite", "wins", "losses", "bouts"]
+
+
+# Subclasses the bout builder to reuse its bout extraction
+class AuraDBLoaderRikishiFacedRelationships(AuraDBLoaderBoutNodes):
+    def __init__(self):
+        super().__init__()
+        self.state_path = str(get_project_root() / "state" / "faced_counts.parquet")
+
+    @staticmethod
+    def head_to_head_counts(bouts):
+        """Count wins/losses per (rikishi, opponent, basho, kimarite).
+
+        Every bout is counted from both sides, so the counts for A->B and
+        B->A mirror each other.
+        """
+        if bouts.empty:
+            return pd.DataFrame(columns=COUNT_COLUMNS)
+        sides = []
+        for me, opponent in (("rikishi1", "rikishi2"), ("rikishi2", "rikishi1")):
+            side = pd.DataFrame(
+                {
+                    "rikishiId": bouts[f"RikishiID_{me}"].astype("int64"),
+                    "opponentId": bouts[f"RikishiID_{opponent}"].astype("int64"),
+                    "bashoId": bouts["bashoId"],
+                    "kimarite": bouts["kimarite"].fillna(""),
+                    "result": bouts[f"result_{me}"],
+                }
+            )
+            sides.append(side)
+        both_sides = pd.concat(sides, ignore_index=True)
+        both_sides["wins"] = both_sides["result"].isin(WIN_RESULTS).astype("int64")
+        both_sides["losses"] = both_sides["result"].isin(LOSS_RESULTS).astype("int64")
+        both_sides["bouts"] = 1
+        return (
+            both_sides.groupby(
+                PAIR_COLUMNS + ["bashoId", "kimarite"], as_index=False, sort=False
+            )[["wins", "losses", "bouts"]]
+            .sum()
+            .loc[:, COUNT_COLUMNS]
+        )
+
+    @staticmethod
+    def aggregate_faced(counts):
+        """Collapse per-basho counts into one FACED row per directed pair."""
+        if counts.empty:
+            return []
+        # bashoIds are YYYYMM, so min/max over ints is cheaper and equivalent
+        counts = counts.assign(bashoOrdinal=counts["bashoId"].astype("int64"))
+        totals = counts.groupby(PAIR_COLUMNS, as_index=False).agg(
+            wins=("wins", "sum"),
+            losses=("losses", "sum"),
+            bouts=("bouts", "sum"),
+            firstBashoId=("bashoOrdinal", "min"),
+            lastBashoId=("bashoOrdinal", "max"),
+        )
+        for column in ("firstBashoId", "lastBashoId"):
+            totals[column] = totals[column].astype(str)
+        # Neo4j properties can't be maps, so the kimarite histogram is stored
+        # as two parallel lists sorted by count
+        histogram = (
+            counts[counts["kimarite"] != ""]
+            .groupby(PAIR_COLUMNS + ["kimarite"], as_index=False)["bouts"]
+            .sum()
+            .sort_values(
+                PAIR_COLUMNS + ["bouts", "kimarite"],
+                ascending=[True, True, False, True],
+            )
+            .groupby(PAIR_COLUMNS, as_index=False)
+            .agg(kimarite=("kimarite", list), kimariteCounts=("bouts", list))
+        )
+        faced = totals.merge(histogram, on=PAIR_COLUMNS, how="left")
+        for column in ("kimarite", "kimariteCounts"):
+            faced[column] = [
+                value if isinstance(value, list) else [] for value in faced[column]
+            ]
+        return faced.to_dict("records")
+
+    def create_faced_relationships(self, rows, batch_size=1000):
+        query = """UNWIND $rows AS row
+                    MATCH (a:Rikishi {rikishiID: row.rikishiId})
+                    MATCH (b:Rikishi {rikishiID: row.opponentId})
+                    MERGE (a)-[f:FACED]->(b)
+                    SET f.wins = row.wins, f.losses = row.losses, f.bouts = row.bouts,
+                        f.firstBashoId = row.firstBashoId, f.lastBashoId = row.lastBashoId,
+                        f.kimarite = row.kimarite, f.kimariteCounts = row.kimariteCounts"""
+        return self.write_batches(
+            query, rows, batch_size=batch_size, operation=MERGE_RIKISHI_FACED
+        )
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return pd.DataFrame(columns=COUNT_COLUMNS)
+        return pd.read_parquet(self.state_path)
+
+    def save_state(self, counts):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        counts.to_parquet(self.state_path, index=False)
+
+    def run_create_faced_relationships(self, folder_path, full_rebuild=False):
+        stored = pd.DataFrame(columns=COUNT_COLUMNS)
+        if not full_rebuild:
+            stored = self.load_state()
+        # Re-read the latest processed basho too: it may have been mid-tournament
+        since_basho_id = stored["bashoId"].max() if not stored.empty else None
+        new_counts = self.head_to_head_counts(
+            self.extract_matched_bouts(folder_path, since_basho_id)
+        )
+        if since_basho_id is not None:
+            stored = stored[stored["bashoId"] < since_basho_id]
+        counts = pd.concat([stored, new_counts], ignore_index=True)
+
+        # Only pairs that met in the re-read bashos need their edge rewritten
+        affected_pairs = new_counts[PAIR_COLUMNS].drop_duplicates()
+        rows = self.aggregate_faced(counts.merge(affected_pairs, on=PAIR_COLUMNS))
+        self.log.info("Writing %s FACED relationships", len(rows))
+        self.create_faced_relationships(rows)
+        self.flush()
+        if self.keeps_incremental_state():
+            self.save_state(counts)
+        return len(rows)
+
+
+if __name__ == "__main__":
+    loader = AuraDBLoaderRikishiFacedRelationships()
+    try:
+        # Get the most recent directory
+        recent_dir = loader.get_most_recent_directory(loader.data_path)
+        if recent_dir:
+            basho_folder_path = os.path.join(loader.data_path, recent_dir, "basho")
+            with StageProfiler(
+                "create_rikishi_faced_relationships", snapshot=recent_dir
+            ):
+                loader.run_create_faced_relationships(
+                    basho_folder_path, full_rebuild="--full" in sys.argv
+                )
+        else:
+            print("No recent directory found")
+    finally:
+        loader.close()
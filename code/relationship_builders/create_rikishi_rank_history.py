@@ -0,0 +1,155 @@
+import argparse
+import os
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+
+from ..base_code.base_classes import AuraDBLoader
+from ..base_code.graph_sinks import (
+    CREATE_INDEX,
+    MERGE_RIKISHI_RANKED_IN,
+    SET_RIKISHI_RANK_HISTORY,
+)
+from ..base_code.profiling import StageProfiler
+
+RANK_COLUMNS = ["rikishiId", "bashoId", "rank", "rankValue", "side"]
+RANK_STORAGE = ("edges", "arrays")
+
+# Range lookups for one rikishi, per storage. Array histories come back
+# whole and are sliced with rank_history_between.
+RANK_RANGE_QUERIES = {
+    "edges": """MATCH (r:Rikishi {rikishiID: $rikishiId})-[x:RANKED_IN]->(:Basho)
+                WHERE x.bashoId >= $start AND x.bashoId <= $end
+                RETURN x.bashoId AS bashoId, x.rank AS rank, x.rankValue AS rankValue
+                ORDER BY bashoId""",
+    "arrays": """MATCH (r:Rikishi {rikishiID: $rikishiId})
+                 RETURN r.rankBashoIds AS bashoIds, r.ranks AS ranks,
+                        r.rankValues AS rankValues""",
+}
+
+
+def rank_history_between(basho_ids, start, end):
+    """Slice bounds of bashos in [start, end] within a sorted rankBashoIds array."""
+    return bisect_left(basho_ids, start), bisect_right(basho_ids, end)
+
+
+class AuraDBLoaderRikishiRankHistory(AuraDBLoader):
+    def __init__(self):
+        super().__init__()
+
+    def extract_rank_history(self, folder_path):
+        """Every banzuke entry (rikishi, basho, rank) across all basho files."""
+        rows = []
+        for basho, _, banzuke in self.banzuke_documents(folder_path):
+            basho_id = banzuke.bashoId or basho
+            for side, entries in banzuke.sides():
+                for entry in entries:
+                    if entry.rikishiID is None or not entry.rank:
+                        continue
+                    rows.append(
+                        (
+                            entry.rikishiID,
+                            basho_id,
+                            entry.rank,
+                            entry.rankValue if entry.rankValue is not None else 0,
+                            entry.side or side,
+                        )
+                    )
+        self.metrics.inc("rows_extracted", len(rows))
+        return pd.DataFrame(rows, columns=RANK_COLUMNS)
+
+    def create_indexes(self, storage):
+        queries = [
+            (
+                "CREATE INDEX rikishi_rikishi_id IF NOT EXISTS "
+                "FOR (r:Rikishi) ON (r.rikishiID)"
+            )
+        ]
+        if storage == "edges":
+            # Lets bashoId range filters on RANKED_IN use an index seek
+            queries.append(
+                "CREATE INDEX ranked_in_basho_id IF NOT EXISTS "
+                "FOR ()-[x:RANKED_IN]-() ON (x.bashoId)"
+            )
+        for query in queries:
+            self.run_query(query, operation=CREATE_INDEX)
+
+    def create_ranked_in_relationships(self, history, batch_size=1000):
+        query = """UNWIND $rows AS row
+                    MATCH (r:Rikishi {rikishiID: row.rikishiId})
+                    MATCH (b:Basho {bashoId: row.bashoId})
+                    MERGE (r)-[x:RANKED_IN]->(b)
+                    SET x.bashoId = row.bashoId, x.rank = row.rank,
+                        x.rankValue = row.rankValue, x.side = row.side"""
+        rows = [
+            {
+                "rikishiId": int(row["rikishiId"]),
+                "bashoId": row["bashoId"],
+                "rank": row["rank"],
+                "rankValue": int(row["rankValue"]),
+                "side": row["side"],
+            }
+            for row in history.to_dict("records")
+        ]
+        self.write_batches(
+            query, rows, batch_size=batch_size, operation=MERGE_RIKISHI_RANKED_IN
+        )
+        return len(rows)
+
+    def create_rank_history_arrays(self, history, batch_size=1000):
+        query = """UNWIND $rows AS row
+                    MATCH (r:Rikishi {rikishiID: row.rikishiId})
+                    SET r.rankBashoIds = row.rankBashoIds, r.ranks = row.ranks,
+                        r.rankValues = row.rankValues"""
+        # bashoIds are YYYYMM, so the arrays are sorted and can be bisected
+        arrays = (
+            history.sort_values(["rikishiId", "bashoId"])
+            .groupby("rikishiId", as_index=False)
+            .agg(
+                rankBashoIds=("bashoId", list),
+                ranks=("rank", list),
+                rankValues=("rankValue", list),
+            )
+        )
+        rows = [
+            {
+                "rikishiId": int(row["rikishiId"]),
+                "rankBashoIds": row["rankBashoIds"],
+                "ranks": row["ranks"],
+                "rankValues": [int(value) for value in row["rankValues"]],
+            }
+            for row in arrays.to_dict("records")
+        ]
+        self.write_batches(
+            query, rows, batch_size=batch_size, operation=SET_RIKISHI_RANK_HISTORY
+        )
+        return len(rows)
+
+    def run_create_rank_history(self, folder_path, storage="edges"):
+        history = self.extract_rank_history(folder_path)
+        self.create_indexes(storage)
+        if storage == "edges":
+            written = self.create_ranked_in_relationships(history)
+        else:
+            written = self.create_rank_history_arrays(history)
+        self.log.info("Wrote %s rank history rows as %s", written, storage)
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load banzuke rank history")
+    parser.add_argument("--storage", choices=RANK_STORAGE, default="edges")
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+    loader = AuraDBLoaderRikishiRankHistory()
+    try:
+        # Get the most recent directory
+        recent_dir = loader.get_most_recent_directory(loader.data_path)
+        if recent_dir:
+            basho_folder_path = os.path.join(loader.data_path, recent_dir, "basho")
+            with StageProfiler("create_rikishi_rank_history", snapshot=recent_dir):
+                loader.run_create_rank_history(basho_folder_path, args.storage)
+        else:
+            print("No recent directory found")
+    finally:
+        loader.close()
@@ -1,4 +1,5 @@
 import json
+import os
 
 import jsonschema
 import pytest
@@ -6,6 +7,10 @@ import requests  # type: ignore
 from jsonschema import validate
 from requests.adapters import HTTPAdapter  # type: ignore
 
+SCHEMA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, "code", "base_code", "schemas"
+)
+
 
 def load_schema(file_path):
     with open(file_path) as file:
@@ -18,11 +23,11 @@ def load_schema(file_path):
     [
         (
             "https://www.sumo-api.com/api/basho/202301/banzuke/Makuuchi",
-            "./test_data/basho_test_response_schema.json",
+            os.path.join(SCHEMA_DIR, "basho.json"),
         ),
         (
             "https://www.sumo-api.com/api/rikishi/1?intai=true",
-            "./test_data/rikishi_test_response_schema.json",
+            os.path.join(SCHEMA_DIR, "rikishi.json"),
         ),
     ],
 )
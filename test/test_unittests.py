@@ -1,21 +1,114 @@
 import json
+import logging
 import os
-from code.base_code.base_classes import AuraDBLoader, SumoApiQuery
+import subprocess
+import sys
+import time
+from code import cli
+from code.analytics.gds_analytics import (
+    DELETE_SIMILAR_TO_QUERY,
+    MARK_WRITTEN_BACK_QUERY,
+    WRITTEN_BACK_QUERY,
+    AuraDBLoaderGdsAnalytics,
+)
+from code.analytics.rating_engine import AuraDBLoaderRikishiRatings, EloRatingEngine
+from code.analytics.shikona_index import (
+    INDEX_FILENAME,
+    ShikonaIndex,
+    normalise_shikona,
+)
+from code.base_code.base_classes import (
+    LOAD_VERSION_QUERY,
+    AuraDBLoader,
+    SumoApiQuery,
+    basho_files,
+    get_data_root,
+    get_project_root,
+    make_async_loader,
+)
+from code.base_code.codec import ABSENT, Bout, decode_banzuke, decode_rikishi
+from code.base_code.graph_sinks import (
+    BOUT_KEY_PARAMS,
+    CREATE_INDEX,
+    MERGE_BASHO,
+    MERGE_BOUT,
+    MERGE_RIKISHI,
+    InMemoryGraphSink,
+)
+from code.base_code.http_cache import (
+    COMPLETED_TTL,
+    DEFAULT_TTL,
+    LIVE_TTL,
+    NEGATIVE_TTL,
+    ResponseCache,
+)
+from code.base_code.log_config import (
+    Progress,
+    configure_logging,
+    parse_levels,
+    stage_logger,
+    stop_logging,
+)
+from code.base_code.metrics import StageMetrics
+from code.base_code.profiling import StageProfiler, profiling_enabled
+from code.base_code.snapshot_store import ShardReader, open_documents, pack, unpack
+from code.base_code.validation import compile_schema, schema_path, validate
+from code.base_code.work_queue import WorkQueue
+from code.base_code.write_spool import (
+    SpoolDrainer,
+    SpoolWriter,
+    neo4j_applier,
+    sink_applier,
+)
+from code.benchmarks.api_stub import SumoApiStub
+from code.benchmarks.run_benchmarks import compare_results, run_rank_history
+from code.benchmarks.synthetic_data import SyntheticSumoData
 from code.downloaders.basho_downloader import SumoApiQueryBasho
+from code.downloaders.download_planner import DownloadJob, DownloadPlanner
+from code.downloaders.live_poller import AuraDBLoaderLiveBouts, LiveBashoPoller
 from code.downloaders.rikishi_downloader import SumoApiQueryRikishi
-from code.node_builders.create_basho_nodes import AuraDBLoaderBashoNodes
+from code.downloaders.rikishi_index import INDEX_FILENAME as RIKISHI_INDEX_FILENAME
+from code.downloaders.rikishi_index import RikishiIndex
+from code.dry_run import run_dry_run
+from code.node_builders.create_basho_nodes import (
+    AuraDBLoaderBashoNodes,
+    basho_date,
+    basho_ordinal,
+)
 from code.node_builders.create_bout_nodes import AuraDBLoaderBoutNodes
 from code.node_builders.create_rikishi_nodes import AuraDBLoaderRikishiNodes
+from code.pipeline_worker import BoutNodesStage, run_worker
+from code.read_api.graph_reader import READ_QUERIES, LRUCache, SumoGraphReader
+from code.read_api.parquet_export import (
+    EXPORT_TABLES,
+    GraphParquetExporter,
+    keyset_query,
+)
+from code.read_api.sqlite_replica import SqliteReplica
 from code.relationship_builders.create_basho_bout_relationships import (
     AuraDBLoaderBashoBoutRelationships,
 )
 from code.relationship_builders.create_rikishi_bout_relationships import (
     AuraDBLoaderRikishiBoutRelationships,
 )
-from datetime import datetime
-from unittest.mock import MagicMock, call, mock_open, patch
-
+from code.relationship_builders.create_rikishi_faced_relationships import (
+    AuraDBLoaderRikishiFacedRelationships,
+)
+from code.relationship_builders.create_rikishi_rank_history import (
+    RANK_STORAGE,
+    AuraDBLoaderRikishiRankHistory,
+    rank_history_between,
+)
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, call, mock_open, patch
+
+import jsonschema
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
 import pytest
+import requests  # type: ignore
 
 
 @pytest.fixture
@@ -25,6 +118,13 @@ def base_directory_and_dirs():
     return base_directory, directories
 
 
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path, monkeypatch):
+    # Keep per-run metrics reports out of the repository during tests
+    monkeypatch.setenv("SUMO_METRICS_DIR", str(tmp_path / "metrics"))
+    return tmp_path / "metrics"
+
+
 @pytest.fixture
 def fixed_datetime():
     # Define a fixed date for testing
@@ -80,21 +180,16 @@ class TestSumoApiQuery:
         mock_get_project_root.return_value = Path("/fake/project/root")
         mock_exists.return_value = True
         mock_get = MagicMock()
+        mock_get.return_value.content = b'{"bashoId": "202301"}'
         mock_open = MagicMock()
-        mock_json_dump = MagicMock()
         mock_os_join = MagicMock()
         monkeypatch.setattr(
             "code.base_code.base_classes.requests.Session.get", mock_get
         )
         monkeypatch.setattr("builtins.open", mock_open)
-        monkeypatch.setattr("code.base_code.base_classes.json.dump", mock_json_dump)
         monkeypatch.setattr("code.base_code.base_classes.os.path.join", mock_os_join)
-        with (
-            patch("code.base_code.base_classes.logging.info"),
-            patch("code.base_code.base_classes.logging.error"),
-        ):
-            sumo_query = SumoApiQuery()
-            sumo_query.query_endpoint("202301")
+        sumo_query = SumoApiQuery()
+        sumo_query.query_endpoint("202301")
         expected_url = sumo_query.base_url.format(
             "202301"
         )  # Construct the expected URL
@@ -103,35 +198,42 @@ class TestSumoApiQuery:
         )  # Check that mock_get was called with the correct URL
         mock_get.assert_called_once()
         mock_open.assert_called_once()
-        mock_json_dump.assert_called_once()
+        # The response body is saved as received, not re-encoded
+        mock_open.return_value.__enter__.return_value.write.assert_called_once_with(
+            b'{"bashoId": "202301"}'
+        )
         mock_os_join.assert_called_once()
 
-    @patch("code.base_code.base_classes.get_project_root")
-    def test_setup_logging(self, mock_get_project_root, monkeypatch):
-        from pathlib import Path
-
-        # Test setup_logging method
-        mock_get_project_root.return_value = Path("/fake/project/root")
-        mock_logging = MagicMock()
-        monkeypatch.setattr(
-            "code.base_code.base_classes.logging.basicConfig", mock_logging
-        )
+    def test_setup_logging(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_LOG_LEVEL", "INFO,SumoApiQuery=DEBUG")
         sumo_query = SumoApiQuery()
+        sumo_query.log_file_name = str(tmp_path / "query.log")
         sumo_query.setup_logging()
-        mock_logging.assert_called_once()
+        try:
+            sumo_query.log.debug("Making API call", extra={"basho": "202301"})
+            logging.getLogger("sumo.Other").debug("Filtered out")
+        finally:
+            stop_logging()
+        lines = (tmp_path / "query.log").read_text().splitlines()
+        assert len(lines) == 1
+        record = json.loads(lines[0])
+        assert record["message"] == "Making API call"
+        assert record["level"] == "DEBUG"
+        assert record["stage"] == "SumoApiQuery"
+        assert record["basho"] == "202301"
 
     @patch("code.base_code.base_classes.get_project_root")
     @patch(
         "code.base_code.base_classes.SumoApiQuery.query_endpoint"
     )  # Mock the query_endpoint method
-    @patch("code.base_code.base_classes.logging")  # Mock the logging module
+    @patch("code.base_code.base_classes.configure_logging")
     @patch("code.base_code.base_classes.os.path.exists")
     @patch("code.base_code.base_classes.os.makedirs")
     def test_run_queries(
         self,
         mock_makedirs,
         mock_path_exists,
-        mock_logging,
+        mock_configure_logging,
         mock_query_endpoint,
         mock_get_project_root,
     ):
@@ -152,7 +254,91 @@ class TestSumoApiQuery:
         assert mock_query_endpoint.call_count == len(test_iters)
         for iter_val in test_iters:
             mock_query_endpoint.assert_any_call(iter_val)
-        mock_logging.basicConfig.assert_called_once()
+        mock_configure_logging.assert_called_once_with(sumo_api_query.log_file_name)
+
+
+class TestStageMetrics:
+    def test_counters_and_histograms(self):
+        metrics = StageMetrics("test_stage")
+        metrics.inc("bytes_downloaded", 100)
+        metrics.inc("bytes_downloaded", 50)
+        metrics.observe("request_latency_seconds", 0.02)
+        metrics.observe("request_latency_seconds", 3)
+
+        report = metrics.to_dict()
+        assert report["counters"] == {"bytes_downloaded": 150}
+        histogram = report["histograms"]["request_latency_seconds"]
+        assert histogram["count"] == 2
+        assert histogram["buckets"]["0.025"] == 1
+        assert histogram["buckets"]["5"] == 2
+
+        prometheus = metrics.to_prometheus()
+        assert 'sumo_bytes_downloaded_total{stage="test_stage"} 150' in prometheus
+        assert (
+            'sumo_request_latency_seconds_bucket{stage="test_stage",le="+Inf"} 2'
+            in prometheus
+        )
+
+    def test_record_summary_ignores_missing_counters(self):
+        metrics = StageMetrics("test_stage")
+        summary = MagicMock()
+        summary.counters.nodes_created = 2
+        summary.counters.relationships_created = 1
+        summary.counters.properties_set = 9
+        metrics.record_summary(summary)
+        metrics.record_summary(MagicMock())
+        assert metrics.counters == {
+            "nodes_created": 2,
+            "relationships_created": 1,
+            "properties_set": 9,
+        }
+
+    def test_write_report(self, tmp_path):
+        metrics = StageMetrics("test_stage")
+        metrics.inc("rows_extracted", 3)
+        json_path = metrics.write_report(str(tmp_path))
+        with open(json_path) as file:
+            assert json.load(file)["counters"] == {"rows_extracted": 3}
+        assert os.path.exists(json_path.replace(".json", ".prom"))
+
+
+class TestStageProfiler:
+    def test_profiling_enabled(self, monkeypatch):
+        monkeypatch.delenv("SUMO_PROFILE", raising=False)
+        assert not profiling_enabled(["prog"])
+        assert profiling_enabled(["prog", "--profile"])
+        monkeypatch.setenv("SUMO_PROFILE", "1")
+        assert profiling_enabled(["prog"])
+
+    def test_disabled_profiler_writes_nothing(self, tmp_path):
+        with StageProfiler("stage", output_dir=str(tmp_path), enabled=False):
+            sum(range(10))
+        assert list(tmp_path.iterdir()) == []
+
+    @patch("code.base_code.profiling.get_git_revision", return_value="abc1234")
+    def test_profile_outputs(self, mock_revision, tmp_path):
+        with StageProfiler(
+            "create_bout_nodes",
+            snapshot="202509",
+            output_dir=str(tmp_path),
+            enabled=True,
+        ) as profiler:
+            sorted(str(i) for i in range(20000))
+
+        assert set(profiler.output_paths) == {"pstats", "collapsed", "memory"}
+        for path in profiler.output_paths.values():
+            assert os.path.basename(path).startswith("create_bout_nodes_abc1234_")
+            assert os.path.dirname(path) == str(tmp_path / "202509")
+        with open(profiler.output_paths["collapsed"]) as file:
+            stacks = file.read().splitlines()
+        assert any(
+            line.startswith("<built-in method builtins.sorted>") for line in stacks
+        )
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+        with open(profiler.output_paths["memory"]) as file:
+            memory_report = json.load(file)
+        assert memory_report["git_revision"] == "abc1234"
+        assert memory_report["peak_bytes"] > 0
 
 
 class TestSumoApiQueryBasho:
@@ -229,6 +415,62 @@ class TestSumoApiQueryRikishi:
         mock_listdir.assert_called_once_with(base_directory)
         assert result is None, "Expected None for empty base directory"
 
+    def test_get_latest_directory_prefers_snapshot_names(self, tmp_path):
+        for snapshot in ("202509", "202507"):
+            os.makedirs(tmp_path / snapshot / "basho")
+        sumo_rikishi = SumoApiQueryRikishi()
+        sumo_rikishi.base_directory = str(tmp_path)
+        assert sumo_rikishi.get_latest_directory() == f"{tmp_path}/202509/basho"
+
+    def test_process_latest_directory_uses_index_and_skips_retired(self, tmp_path):
+        os.makedirs(tmp_path / "202507" / "rikishi")
+        os.makedirs(tmp_path / "202509" / "basho")
+        for rikishi in ({"id": 1, "intai": "2020-01-01"}, {"id": 2}, {"id": 3}):
+            with open(
+                tmp_path / "202507" / "rikishi" / f"{rikishi['id']}.json", "w"
+            ) as file:
+                json.dump(rikishi, file)
+        with open(tmp_path / "202509" / "basho" / "202509.json", "w") as file:
+            json.dump({"bashoId": "202509", "east": [], "west": []}, file)
+        index = RikishiIndex(
+            {1: ["195803", "202007"], 2: ["201001", "202507"], 3: ["202509", "202509"]},
+            ["202507", "202509"],
+        )
+        index.save(str(tmp_path / "202509" / RIKISHI_INDEX_FILENAME))
+
+        sumo_rikishi = SumoApiQueryRikishi()
+        sumo_rikishi.base_directory = str(tmp_path)
+        sumo_rikishi.output_dir = str(tmp_path / "202509" / "rikishi")
+        with patch.object(sumo_rikishi, "extract_rikishi_ids_from_directory") as scan:
+            sumo_rikishi.process_latest_directory()
+        scan.assert_not_called()
+        assert sumo_rikishi.iters == [2, 3]
+        assert os.listdir(sumo_rikishi.output_dir) == ["1.json"]
+        assert sumo_rikishi.metrics.counters["rikishi_reused"] == 1
+
+    def test_basho_downloader_writes_rikishi_index(self, tmp_path):
+        query = SumoApiQueryBasho(cache_path=str(tmp_path / "negative_cache.json"))
+        query.output_dir = str(tmp_path / "basho")
+        query.iters = []
+        query.handle_response(
+            DownloadJob("202509", "Makuuchi"),
+            {"bashoId": "202509", "east": [{"rikishiID": 3}], "west": []},
+        )
+        query.handle_response(
+            DownloadJob("202507", "Juryo"),
+            {
+                "bashoId": "202507",
+                "east": [{"rikishiID": 3}],
+                "west": [{"rikishiID": 2}],
+            },
+        )
+        with patch("code.base_code.base_classes.SumoApiQuery.run_queries"):
+            query.run_queries()
+        index = RikishiIndex.load(str(tmp_path / RIKISHI_INDEX_FILENAME))
+        assert index.spans == {2: ["202507", "202507"], 3: ["202507", "202509"]}
+        assert index.basho_ids == {"202509", "Juryo/202507"}
+        assert index.active_ids() == {3}
+
 
 class TestAuraDBLoader:
     @pytest.fixture(autouse=True)
@@ -264,6 +506,25 @@ class TestAuraDBLoader:
         # Verify close was called
         mock_driver_instance.close.assert_called_once()
 
+    def test_run_query_records_metrics(self, mocker, metrics_dir):
+        mock_driver_instance = mocker.MagicMock()
+        mocker.patch(
+            "code.base_code.base_classes.GraphDatabase.driver",
+            return_value=mock_driver_instance,
+        )
+        mock_session = mock_driver_instance.session.return_value.__enter__.return_value
+        mock_session.run.return_value.consume.return_value.counters.nodes_created = 1
+
+        loader = AuraDBLoader()
+        loader.run_query("MERGE (b:Basho {bashoId: $basho_id})", basho_id="202001")
+        loader.close()
+
+        # close() adds one write of its own: the load version bump
+        assert loader.metrics.counters["nodes_created"] == 2
+        assert loader.metrics.histograms["batch_write_seconds"].count == 2
+        assert "LoadVersion" in mock_session.run.call_args_list[-1].args[0]
+        assert len(list(metrics_dir.glob("AuraDBLoader_*.json"))) == 1
+
     def test_get_most_recent_directory(self, mocker):
         # Mock os.listdir and os.path.isdir to simulate filesystem behavior
         mocker.patch(
@@ -279,6 +540,161 @@ class TestAuraDBLoader:
         assert most_recent_dir == "202302"
 
 
+class TestInMemoryGraphSink:
+    def test_merge_semantics(self):
+        sink = InMemoryGraphSink()
+        sink.run("MERGE basho", {"basho_id": "202001"}, operation=MERGE_BASHO)
+        sink.run("MERGE basho", {"basho_id": "202001"}, operation=MERGE_BASHO)
+        sink.run(
+            "MERGE rikishi",
+            {"rikishiID": 1, "attributes": {"rikishiID": 1, "heya": "A"}},
+            operation=MERGE_RIKISHI,
+        )
+        sink.run(
+            "MERGE rikishi",
+            {"rikishiID": 1, "attributes": {"rikishiID": 1, "heya": "B"}},
+            operation=MERGE_RIKISHI,
+        )
+        sink.run(
+            "MERGE rikishi",
+            {"rikishiID": 1, "attributes": {"rikishiID": 1, "heya": None}},
+            operation=MERGE_RIKISHI,
+        )
+        sink.run("CREATE INDEX something", {})
+
+        counts = sink.counts()
+        assert counts["nodes"] == {"Basho": 1, "Rikishi": 1, "Bout": 0}
+        # A null removes the property, as SET r += $attributes does
+        assert "heya" not in sink.rikishi_nodes[0]
+        assert counts["unhandled_operations"] == {"CREATE": 1}
+
+    def test_relationships_are_merged_once(self):
+        sink = InMemoryGraphSink()
+        sink.merge_basho("202001")
+        sink.merge_rikishi(1, {})
+        sink.merge_rikishi("2", {})
+        bout = {
+            "result_rikishi1": "win",
+            "RikishiID_rikishi1": 1,
+            "Side_rikishi1": "East",
+            "kimarite": "yorikiri",
+            "Fight_Number": 1,
+            "result_rikishi2": "loss",
+            "RikishiID_rikishi2": 2,
+            "Side_rikishi2": "West",
+            "bashoId": "202001",
+        }
+        sink.run("MERGE bout", bout, operation=MERGE_BOUT)
+        sink.run("MERGE bout", bout, operation=MERGE_BOUT)
+        for _ in range(2):
+            sink.merge_basho_bout("202001")
+            sink.merge_rikishi_bout(1)
+            sink.merge_rikishi_bout(2)
+        assert sink.counts()["relationships"] == {
+            "BOUT_EVENT": 1,
+            "RIKISHI_IN_BOUT_EVENT": 2,
+            "FACED": 0,
+            "RANKED_IN": 0,
+            "NEXT_BASHO": 0,
+        }
+
+    def test_loader_uses_memory_sink(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        loader = AuraDBLoaderBashoNodes()
+        assert loader.driver is None
+        assert loader.create_basho_node("202001") == {
+            "bashoId": "202001",
+            "date": "2020-01-01",
+            "ordinal": 372,
+        }
+        loader.close()
+
+    def test_dry_run_counts(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=3)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path))
+        counts = run_dry_run(snapshot_dir)
+        bouts = 2 * 21 * 15
+        assert counts["nodes"] == {
+            "Basho": 2,
+            "Rikishi": len(generator.rikishi),
+            "Bout": bouts,
+        }
+        assert counts["relationships"] == {
+            "BOUT_EVENT": bouts,
+            "RIKISHI_IN_BOUT_EVENT": 2 * bouts,
+            "FACED": 0,
+            "RANKED_IN": 0,
+            "NEXT_BASHO": 1,
+        }
+
+
+class TestAsyncAuraDBLoader:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("uri", "neo4j+s://test_uri")
+        monkeypatch.setenv("username", "neo4j")
+        monkeypatch.setenv("password", "test")
+
+    @patch("code.base_code.base_classes.AsyncGraphDatabase.driver")
+    @patch("code.base_code.base_classes.GraphDatabase.driver", return_value=MagicMock())
+    def test_writes_go_through_async_driver(self, mock_driver, mock_async_driver):
+        mock_session = MagicMock()
+        mock_session.execute_write = AsyncMock()
+        mock_async_driver.return_value.session.return_value.__aenter__ = AsyncMock(
+            return_value=mock_session
+        )
+        mock_async_driver.return_value.session.return_value.__aexit__ = AsyncMock(
+            return_value=False
+        )
+        mock_async_driver.return_value.close = AsyncMock()
+
+        loader = make_async_loader(AuraDBLoaderBashoNodes)(max_in_flight=2)
+        assert loader.create_basho_node("202001") is None
+        assert loader.create_basho_node("202003") is None
+        loader.close()
+
+        # Two basho writes, then the load version bump from close()
+        assert mock_session.execute_write.await_count == 3
+        writes = mock_session.execute_write.await_args_list
+        basho_ids = [c.args[2]["basho_id"] for c in writes[:2]]
+        assert sorted(basho_ids) == ["202001", "202003"]
+        assert "LoadVersion" in writes[2].args[1]
+        # The sync driver is never used for writes in async mode
+        mock_driver.return_value.session.assert_not_called()
+        mock_async_driver.return_value.close.assert_awaited_once()
+
+    @patch("code.base_code.base_classes.AsyncGraphDatabase.driver")
+    @patch("code.base_code.base_classes.GraphDatabase.driver", return_value=MagicMock())
+    def test_failed_write_is_raised_on_close(self, mock_driver, mock_async_driver):
+        mock_session = MagicMock()
+        mock_session.execute_write = AsyncMock(side_effect=ValueError("boom"))
+        mock_async_driver.return_value.session.return_value.__aenter__ = AsyncMock(
+            return_value=mock_session
+        )
+        mock_async_driver.return_value.session.return_value.__aexit__ = AsyncMock(
+            return_value=False
+        )
+        mock_async_driver.return_value.close = AsyncMock()
+
+        loader = make_async_loader(AuraDBLoaderBashoNodes)()
+        loader.create_basho_node("202001")
+        with pytest.raises(RuntimeError):
+            loader.close()
+
+    @patch("code.base_code.base_classes.AsyncGraphDatabase.driver")
+    def test_other_sinks_are_written_synchronously(
+        self, mock_async_driver, monkeypatch
+    ):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        loader = make_async_loader(AuraDBLoaderBashoNodes)()
+        loader.create_basho_node("202001")
+        loader.close()
+
+        mock_async_driver.assert_not_called()
+        assert [node["bashoId"] for node in loader.sink.basho_nodes] == ["202001"]
+
+
 # node testers
 class TestAuraDBLoaderRikishiNodes:
     @pytest.fixture(autouse=True)
@@ -324,7 +740,7 @@ class TestAuraDBLoaderRikishiNodes:
     @patch(
         "builtins.open",
         new_callable=mock_open,
-        read_data=json.dumps({"id": "123", "name": "Test Rikishi"}),
+        read_data=json.dumps({"id": "123", "shikonaEn": "Test Rikishi"}),
     )
     @patch("os.path.join", return_value="/fakepath/fakedir/fakefile.json")
     @patch("os.listdir", return_value=["basho1.json", "basho2.json"])
@@ -341,7 +757,7 @@ class TestAuraDBLoaderRikishiNodes:
         mock_listdir.assert_called_once_with(folder_path)
 
         # Since we have 2 files, we expect 2 calls to create_rikishi_node.
-        expected_data = {"id": "123", "name": "Test Rikishi"}
+        expected_data = {"id": "123", "shikonaEn": "Test Rikishi"}
         expected_calls = [call(expected_data) for _ in range(2)]
         mock_create_bout_node.assert_has_calls(expected_calls, any_order=True)
 
@@ -372,9 +788,37 @@ class TestAuraDBLoaderBashoNodes:
 
         # Assert session.run was called with expected arguments
         mock_session.run.assert_called_once_with(
-            "MERGE (b:Basho {bashoId: $basho_id}) RETURN b", basho_id="202001"
+            "MERGE (b:Basho {bashoId: $basho_id}) "
+            "SET b.date = date($date), b.ordinal = $ordinal "
+            "RETURN b",
+            basho_id="202001",
+            date="2020-01-01",
+            ordinal=372,
         )
 
+    def test_basho_date_and_ordinal(self):
+        assert basho_date("195801") == date(1958, 1, 1)
+        assert basho_ordinal("195801") == 0
+        assert basho_ordinal("195811") == 5
+        assert basho_ordinal("195901") == 6
+
+    def test_next_basho_chain(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        loader = AuraDBLoaderBashoNodes()
+        # 201103 was cancelled, so 201101 links straight to 201105
+        for basho_id in ("201105", "201101", "201107"):
+            loader.create_basho_node(basho_id)
+        assert loader.create_next_basho_chain(["201105", "201101", "201107"]) == 2
+        edges = loader.sink.relationships["NEXT_BASHO"]
+        chain = [
+            (
+                loader.sink.basho_nodes[a]["bashoId"],
+                loader.sink.basho_nodes[b]["bashoId"],
+            )
+            for a, b in zip(edges.sources, edges.targets)
+        ]
+        assert chain == [("201101", "201105"), ("201105", "201107")]
+
     @patch(
         "code.node_builders.create_basho_nodes.AuraDBLoaderBashoNodes.create_basho_node"
     )
@@ -688,3 +1132,1546 @@ class TestAuraDBLoaderRikishiBoutRelationships:
 
         # Ensure the method attempts to process exactly 2 files.
         assert mock_create_basho_node.call_count == 2
+
+
+class TestAuraDBLoaderRikishiFacedRelationships:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+
+    @staticmethod
+    def bout(rikishi1, rikishi2, result1, kimarite, basho_id):
+        result2 = {"win": "loss", "loss": "win"}[result1]
+        return {
+            "RikishiID_rikishi1": rikishi1,
+            "RikishiID_rikishi2": rikishi2,
+            "result_rikishi1": result1,
+            "result_rikishi2": result2,
+            "kimarite": kimarite,
+            "bashoId": basho_id,
+        }
+
+    def test_aggregate_faced(self):
+        bouts = pd.DataFrame(
+            [
+                self.bout(1, 2, "win", "yorikiri", "202001"),
+                self.bout(2, 1, "loss", "yorikiri", "202003"),
+                self.bout(1, 2, "loss", "oshidashi", "202005"),
+            ]
+        )
+        counts = AuraDBLoaderRikishiFacedRelationships.head_to_head_counts(bouts)
+        rows = AuraDBLoaderRikishiFacedRelationships.aggregate_faced(counts)
+        by_pair = {(row["rikishiId"], row["opponentId"]): row for row in rows}
+        assert by_pair[(1, 2)] == {
+            "rikishiId": 1,
+            "opponentId": 2,
+            "wins": 2,
+            "losses": 1,
+            "bouts": 3,
+            "firstBashoId": "202001",
+            "lastBashoId": "202005",
+            "kimarite": ["yorikiri", "oshidashi"],
+            "kimariteCounts": [2, 1],
+        }
+        assert by_pair[(2, 1)]["wins"] == 1
+        assert by_pair[(2, 1)]["losses"] == 2
+
+    def test_incremental_run_only_rewrites_new_pairs(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=5)
+        generator.basho_count = 3
+        snapshot_dir = generator.write(str(tmp_path))
+        basho_dir = os.path.join(snapshot_dir, "basho")
+
+        loader = AuraDBLoaderRikishiFacedRelationships()
+        loader.state_path = str(tmp_path / "state" / "faced_counts.parquet")
+        # The in-memory graph stands in for Neo4j across both runs
+        loader.keeps_incremental_state = lambda: True
+        for rikishi_id in generator.rikishi:
+            loader.sink.merge_rikishi(rikishi_id, {})
+        full_rows = loader.run_create_faced_relationships(basho_dir)
+        faced = loader.sink.relationships["FACED"]
+        assert full_rows == len(faced)
+        total_bouts = sum(props["bouts"] for props in faced.properties.values())
+        assert total_bouts == 2 * 3 * 21 * 15
+
+        # Nothing new: only the pairs of the latest basho are re-read and rewritten
+        rerun_rows = loader.run_create_faced_relationships(basho_dir)
+        assert 0 < rerun_rows < full_rows
+        total_after = sum(props["bouts"] for props in faced.properties.values())
+        assert total_after == total_bouts
+
+    def test_state_is_kept_only_for_confirmed_neo4j_writes(self, tmp_path, monkeypatch):
+        generator = SyntheticSumoData(scale=1, seed=5)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path))
+        basho_dir = os.path.join(snapshot_dir, "basho")
+        state_path = str(tmp_path / "state" / "faced_counts.parquet")
+
+        # A dry run writes nothing that a later load could skip
+        loader = AuraDBLoaderRikishiFacedRelationships()
+        loader.state_path = state_path
+        assert loader.run_create_faced_relationships(basho_dir) > 0
+        assert not os.path.exists(state_path)
+
+        # Async writes that fail are caught before the state is saved
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "neo4j")
+        monkeypatch.setenv("uri", "neo4j+s://test_uri")
+        with (
+            patch("code.base_code.base_classes.GraphDatabase.driver"),
+            patch("code.base_code.base_classes.AsyncGraphDatabase.driver") as driver,
+        ):
+            session = MagicMock()
+            session.execute_write = AsyncMock(side_effect=ValueError("boom"))
+            driver.return_value.session.return_value.__aenter__ = AsyncMock(
+                return_value=session
+            )
+            driver.return_value.session.return_value.__aexit__ = AsyncMock(
+                return_value=False
+            )
+            driver.return_value.close = AsyncMock()
+            loader = make_async_loader(AuraDBLoaderRikishiFacedRelationships)()
+            loader.state_path = state_path
+            with pytest.raises(RuntimeError):
+                loader.run_create_faced_relationships(basho_dir)
+            with pytest.raises(RuntimeError):
+                loader.close()
+        assert not os.path.exists(state_path)
+
+
+class TestAuraDBLoaderRikishiRankHistory:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+
+    @pytest.fixture
+    def basho_dir(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=3)
+        generator.basho_count = 3
+        return os.path.join(generator.write(str(tmp_path)), "basho")
+
+    def loader_with_nodes(self, basho_dir):
+        loader = AuraDBLoaderRikishiRankHistory()
+        history = loader.extract_rank_history(basho_dir)
+        for basho_id in history["bashoId"].unique():
+            loader.sink.merge_basho(basho_id)
+        for rikishi_id in history["rikishiId"].unique():
+            loader.sink.merge_rikishi(int(rikishi_id), {})
+        return loader, history
+
+    def test_extract_rank_history(self, basho_dir):
+        _, history = self.loader_with_nodes(basho_dir)
+        assert len(history) == 3 * 2 * 21
+        assert list(history.columns) == [
+            "rikishiId",
+            "bashoId",
+            "rank",
+            "rankValue",
+            "side",
+        ]
+
+    def test_edge_storage(self, basho_dir):
+        loader, history = self.loader_with_nodes(basho_dir)
+        assert loader.run_create_rank_history(basho_dir, "edges") == len(history)
+        edges = loader.sink.relationships["RANKED_IN"]
+        assert len(edges) == len(history)
+        assert loader.sink.indexes_created == 2
+
+    def test_array_storage(self, basho_dir):
+        loader, history = self.loader_with_nodes(basho_dir)
+        written = loader.run_create_rank_history(basho_dir, "arrays")
+        assert written == history["rikishiId"].nunique()
+        node = loader.sink.rikishi_nodes[0]
+        assert node["rankBashoIds"] == sorted(node["rankBashoIds"])
+        assert len(node["ranks"]) == len(node["rankValues"])
+        low, high = rank_history_between(node["rankBashoIds"], "195803", "195805")
+        assert node["rankBashoIds"][low:high] == ["195803", "195805"]
+
+    def test_rank_history_between(self):
+        basho_ids = ["195801", "195803", "195805", "195807"]
+        assert rank_history_between(basho_ids, "195802", "195805") == (1, 3)
+        assert rank_history_between(basho_ids, "196001", "196012") == (4, 4)
+
+
+class TestEloRatingEngine:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+
+    def test_update_matches_sequential_elo(self):
+        bouts = pd.DataFrame(
+            {
+                "RikishiID_rikishi1": [1, 3, 1, 2, 1],
+                "RikishiID_rikishi2": [2, 4, 3, 4, 2],
+                "result_rikishi1": ["win", "loss", "loss", "win", "fusen win"],
+                "bashoId": ["202001", "202001", "202001", "202001", "202003"],
+                "Fight_Number": [1, 1, 2, 2, 1],
+            }
+        )
+        engine = EloRatingEngine(k_factor=32.0)
+        assert engine.update(bouts) == 4
+
+        ratings = {rikishi_id: 1500.0 for rikishi_id in (1, 2, 3, 4)}
+        for winner, loser in ((1, 2), (4, 3), (3, 1), (2, 4)):
+            expected = 1 / (1 + 10 ** ((ratings[loser] - ratings[winner]) / 400))
+            ratings[winner] += 32 * (1 - expected)
+            ratings[loser] -= 32 * (1 - expected)
+        for rikishi_id, rating in ratings.items():
+            position = engine.rikishi_ids.get_loc(rikishi_id)
+            assert engine.ratings[position] == pytest.approx(rating)
+        # The fusen bout is not rated, so 202003 has no history
+        assert set(engine.history["bashoId"]) == {202001}
+
+    def test_incremental_run_matches_full_run(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=9)
+        generator.basho_count = 4
+        snapshot_dir = generator.write(str(tmp_path))
+        basho_dir = os.path.join(snapshot_dir, "basho")
+
+        loader = AuraDBLoaderRikishiRatings()
+        loader.state_path = str(tmp_path / "state" / "elo_ratings.npz")
+        # The in-memory graph stands in for Neo4j across both runs
+        loader.keeps_incremental_state = lambda: True
+        for rikishi_id in generator.rikishi:
+            loader.sink.merge_rikishi(rikishi_id, {})
+        assert loader.run_rating_engine(basho_dir) == len(generator.rikishi)
+        full_state = EloRatingEngine.load(loader.state_path)
+
+        # A rerun only replays the latest basho and ends in the same state
+        assert loader.run_rating_engine(basho_dir) == 2 * 21
+        rerun_state = EloRatingEngine.load(loader.state_path)
+        np.testing.assert_allclose(rerun_state.ratings, full_state.ratings)
+        assert len(rerun_state.history) == len(full_state.history)
+
+        node = loader.sink.rikishi_nodes[0]
+        assert len(node["eloHistory"]) == len(node["eloBashoIds"])
+        assert node["elo"] == node["eloHistory"][-1]
+
+    def test_dry_run_keeps_no_state(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=9)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path))
+
+        loader = AuraDBLoaderRikishiRatings()
+        loader.state_path = str(tmp_path / "state" / "elo_ratings.npz")
+        assert loader.run_rating_engine(os.path.join(snapshot_dir, "basho")) > 0
+        assert not os.path.exists(loader.state_path)
+
+
+class TestShikonaIndex:
+    def test_normalise_shikona(self):
+        assert normalise_shikona("  Ōnosato  Taiki ") == "onosato taiki"
+
+    def test_search_ranks_close_names_first(self):
+        index = ShikonaIndex(
+            ["onosato", "aonosato", "hakuho", "terunofuji"], [[1], [2], [3], [4]]
+        )
+        matches = index.search("Onosatto", limit=2)
+        assert [match[0] for match in matches] == ["onosato", "aonosato"]
+        assert index.resolve("Hakuhoo") == [3]
+        assert index.resolve("Asashoryu") == []
+        assert index.search("Hakuho", limit=1) == [("hakuho", 1.0, [3])]
+
+    def test_for_snapshot_persists_index(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=2)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path))
+
+        index = ShikonaIndex.for_snapshot(snapshot_dir)
+        assert os.path.exists(os.path.join(snapshot_dir, INDEX_FILENAME))
+        assert len(index.names) == len(generator.rikishi)
+        assert index.resolve("Synthetic12yamma") == [12]
+
+        reloaded = ShikonaIndex.for_snapshot(snapshot_dir)
+        assert reloaded.names == index.names
+        assert reloaded.rikishi_ids == index.rikishi_ids
+
+    def test_for_snapshot_rebuilds_after_redownload(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=2)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path))
+        ShikonaIndex.for_snapshot(snapshot_dir)
+
+        # A rikishi file downloaded again with a new shikona
+        path = os.path.join(snapshot_dir, "rikishi", "12.json")
+        with open(path) as file:
+            rikishi = json.load(file)
+        rikishi["shikonaEn"] = "Kotozakura"
+        with open(path, "w") as file:
+            json.dump(rikishi, file)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        assert 12 in ShikonaIndex.for_snapshot(snapshot_dir).resolve("Kotozakura")
+
+
+class TestSumoGraphReader:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("uri", "neo4j+s://test_uri")
+        monkeypatch.setenv("username", "neo4j")
+        monkeypatch.setenv("password", "test")
+
+    @pytest.fixture
+    def graph(self, mocker):
+        """Fake read session: a load version plus a query call log."""
+        graph = {"version": 1, "queries": []}
+
+        def run(query, **params):
+            record = MagicMock()
+            if "LoadVersion" in query:
+                record.data.return_value = {"version": graph["version"]}
+            else:
+                graph["queries"].append((query, params))
+                record.data.return_value = {"wins": 10, "losses": 5, "bouts": 15}
+            return [record]
+
+        mock_driver = mocker.patch("code.base_code.base_classes.GraphDatabase.driver")
+        session = mock_driver.return_value.session.return_value.__enter__.return_value
+        session.run.side_effect = run
+        return graph
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+
+    def test_cached_until_load_version_changes(self, graph):
+        reader = SumoGraphReader(version_ttl=0)
+        first = reader.head_to_head(1, 2)
+        assert reader.head_to_head(1, 2) == first
+        assert len(graph["queries"]) == 1
+
+        graph["version"] = 2
+        reader.head_to_head(1, 2)
+        assert len(graph["queries"]) == 2
+        stats = reader.cache_stats()
+        assert stats["reads"] == 3
+        assert stats["hit_rate"] == pytest.approx(1 / 3, abs=1e-4)
+        assert stats["load_version"] == 2
+        reader.close()
+
+    def test_disk_cache_is_shared_across_readers(self, graph, tmp_path):
+        cache_dir = str(tmp_path / "cache")
+        reader = SumoGraphReader(cache_dir=cache_dir)
+        reader.career_record(8850)
+        reader.close()
+
+        reader = SumoGraphReader(cache_dir=cache_dir)
+        assert reader.career_record(8850) == [{"wins": 10, "losses": 5, "bouts": 15}]
+        assert reader.cache_stats()["disk_hits"] == 1
+        assert len(graph["queries"]) == 1
+
+        # A new load version drops the old answers from disk
+        graph["version"] = 2
+        reader.version_ttl = 0
+        reader.career_record(8850)
+        assert os.listdir(cache_dir) == ["2"]
+        reader.close()
+
+    def test_reader_is_read_only(self, graph, monkeypatch):
+        # The reader ignores the loaders' sink setting and never writes
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        reader = SumoGraphReader()
+        reader.career_record(8850)
+        reader.close()
+
+        session = reader.driver.session
+        run = session.return_value.__enter__.return_value.run
+        queries = [c.args[0] for c in run.call_args_list]
+        assert queries == [LOAD_VERSION_QUERY, READ_QUERIES["career_record"]]
+        assert all(
+            c.kwargs == {"default_access_mode": "READ"} for c in session.call_args_list
+        )
+
+    def test_loaders_bump_load_version_on_close(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        loader = AuraDBLoaderBashoNodes()
+        loader.close()
+        assert loader.sink.load_version == 0
+
+        loader = AuraDBLoaderBashoNodes()
+        loader.create_basho_node("202001")
+        loader.close()
+        assert loader.sink.load_version == 1
+
+
+class TestAuraDBLoaderGdsAnalytics:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("uri", "neo4j+s://test_uri")
+        monkeypatch.setenv("username", "neo4j")
+        monkeypatch.setenv("password", "test")
+
+    @pytest.fixture
+    def loader(self, mocker):
+        mocker.patch("code.base_code.base_classes.GraphDatabase.driver")
+        loader = AuraDBLoaderGdsAnalytics()
+        loader._gds = MagicMock()
+        written_back = {}
+
+        def run_cypher(query, params=None):
+            if query == LOAD_VERSION_QUERY:
+                return pd.DataFrame({"version": [7]})
+            if query == WRITTEN_BACK_QUERY:
+                return pd.DataFrame({"projection": list(written_back.values())})
+            if query == MARK_WRITTEN_BACK_QUERY:
+                written_back["graph"] = params["projection"]
+            return pd.DataFrame()
+
+        loader._gds.run_cypher.side_effect = run_cypher
+        return loader
+
+    def test_projection_built_once_per_load_version(self, loader):
+        gds = loader._gds
+        gds.graph.exists.return_value = {"exists": False}
+        gds.graph.list.return_value = pd.DataFrame(
+            {"graphName": ["sumo_wins_v6", "someone_elses_graph"]}
+        )
+        projected = MagicMock()
+        gds.graph.project.return_value = (projected, None)
+
+        assert loader.get_projection() is projected
+        assert gds.graph.project.call_args.args[0] == "sumo_wins_v7"
+        gds.graph.get.assert_called_once_with("sumo_wins_v6")
+        gds.graph.drop.assert_called_once()
+
+        gds.graph.exists.return_value = {"exists": True}
+        loader.get_projection()
+        assert gds.graph.project.call_count == 1
+        assert loader.metrics.counters["projection_reused"] == 1
+
+    def test_algorithms_run_once_per_projection(self, loader):
+        gds = loader._gds
+        graph = MagicMock()
+        graph.name.return_value = "sumo_wins_v7"
+        graph.node_properties.return_value = ["rikishiID"]
+        graph.relationship_types.return_value = ["BEATEN_BY"]
+        gds.graph.exists.return_value = {"exists": True}
+        gds.graph.get.return_value = graph
+
+        assert loader.run_gds_analytics() == ["pagerank", "community", "SIMILAR_TO"]
+        gds.graph.nodeProperties.write.assert_called_once_with(
+            graph, ["pagerank", "community"]
+        )
+
+        # The reused projection already holds every result
+        graph.node_properties.return_value = ["rikishiID", "pagerank", "community"]
+        graph.relationship_types.return_value = ["BEATEN_BY", "SIMILAR_TO"]
+        assert loader.run_gds_analytics() == []
+        assert gds.pageRank.mutate.call_count == 1
+        assert gds.graph.nodeProperties.write.call_count == 1
+        loader.close()
+        gds.close.assert_called_once()
+
+    def test_write_back_replaces_similarity_and_survives_a_crash(self, loader):
+        gds = loader._gds
+        graph = MagicMock()
+        graph.name.return_value = "sumo_wins_v7"
+        graph.node_properties.return_value = ["rikishiID"]
+        graph.relationship_types.return_value = ["BEATEN_BY"]
+        gds.graph.exists.return_value = {"exists": True}
+        gds.graph.get.return_value = graph
+        # Died after mutating the projection, before writing anything back
+        gds.graph.relationship.write.side_effect = RuntimeError("connection lost")
+        with pytest.raises(RuntimeError):
+            loader.run_gds_analytics()
+
+        gds.graph.relationship.write.side_effect = None
+        graph.node_properties.return_value = ["rikishiID", "pagerank", "community"]
+        graph.relationship_types.return_value = ["BEATEN_BY", "SIMILAR_TO"]
+        assert loader.run_gds_analytics() == []
+        gds.graph.relationship.write.assert_called_with(
+            graph, "SIMILAR_TO", "similarity"
+        )
+        # The previous SIMILAR_TO edges are deleted before each write-back
+        queries = [call.args[0] for call in gds.run_cypher.call_args_list]
+        assert queries.count(DELETE_SIMILAR_TO_QUERY) == 2
+        assert queries[-1] == MARK_WRITTEN_BACK_QUERY
+
+        assert loader.run_gds_analytics() == []
+        assert gds.graph.relationship.write.call_count == 2
+
+    def test_needs_neo4j(self, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        with pytest.raises(RuntimeError):
+            AuraDBLoaderGdsAnalytics()
+
+
+class TestGraphParquetExporter:
+    @pytest.fixture(autouse=True)
+    def setup_env_vars(self, monkeypatch):
+        monkeypatch.setenv("uri", "neo4j+s://test_uri")
+        monkeypatch.setenv("username", "neo4j")
+        monkeypatch.setenv("password", "test")
+
+    def test_keyset_query(self):
+        query = keyset_query(EXPORT_TABLES["basho"])
+        assert query.startswith("MATCH (b:Basho) WHERE b.bashoId > $after ")
+        assert query.endswith("ORDER BY _key LIMIT $page_size")
+
+    @staticmethod
+    def fake_session(mocker, rows):
+        """A session whose run pages through ``rows`` like the keyset queries."""
+
+        def run(query, **params):
+            page = rows
+            if "after" in params:
+                page = [row for row in rows if row["_key"] > params["after"]]
+                page = page[: params["page_size"]]
+            records = []
+            for row in page:
+                record = MagicMock()
+                record.data.return_value = row
+                records.append(record)
+            return records
+
+        mock_driver = mocker.patch("code.read_api.parquet_export.GraphDatabase.driver")
+        session = mock_driver.return_value.session.return_value.__enter__.return_value
+        session.run.side_effect = run
+        return mock_driver, session
+
+    def test_keyed_tables_are_paged(self, mocker, tmp_path):
+        bashos = [
+            {"_key": basho_id, "bashoId": basho_id, "date": None, "ordinal": i}
+            for i, basho_id in enumerate(["202001", "202003", "202005"])
+        ]
+        _, session = self.fake_session(mocker, bashos)
+        exporter = GraphParquetExporter(page_size=2, fetch_size=100)
+        assert exporter.run_export(str(tmp_path), ["basho"]) == {"basho": 3}
+        afters = [c.kwargs["after"] for c in session.run.call_args_list]
+        assert afters == ["", "202003"]
+        exporter.close()
+
+    def test_unkeyed_tables_stream_in_one_query(self, mocker, tmp_path):
+        bouts = [
+            {
+                "boutId": f"4:abc:{i}",
+                "bashoId": "202001",
+                "fightNumber": i,
+                "kimarite": "yorikiri",
+                "rikishiId_rikishi1": 1,
+                "result_rikishi1": "win",
+                "side_rikishi1": "East",
+                # Opponent not on the banzuke
+                "rikishiId_rikishi2": "" if i == 4 else 2,
+                "result_rikishi2": "loss",
+                "side_rikishi2": "West",
+            }
+            for i in range(5)
+        ]
+        mock_driver, session = self.fake_session(mocker, bouts)
+
+        exporter = GraphParquetExporter(page_size=2, fetch_size=100, batch_rows=3)
+        assert exporter.run_export(str(tmp_path), ["bout"]) == {"bout": 5}
+        mock_driver.return_value.session.assert_called_with(
+            default_access_mode="READ", fetch_size=100
+        )
+        query = session.run.call_args.args[0]
+        assert session.run.call_count == 1
+        assert "ORDER BY" not in query
+        assert "elementId(b) AS boutId" in query
+
+        parquet = pq.ParquetFile(tmp_path / "bout.parquet")
+        assert parquet.metadata.num_row_groups == 2
+        table = parquet.read()
+        assert table.column("boutId").to_pylist() == [f"4:abc:{i}" for i in range(5)]
+        assert table.column("rikishiId_rikishi2").to_pylist() == [2, 2, 2, 2, None]
+        exporter.close()
+
+    def test_export_does_not_bump_the_load_version(self, mocker, monkeypatch, tmp_path):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "spool")
+        mock_driver, session = self.fake_session(mocker, [])
+
+        exporter = GraphParquetExporter()
+        assert exporter.run_export(str(tmp_path), ["basho", "faced"]) == {
+            "basho": 0,
+            "faced": 0,
+        }
+        exporter.close()
+
+        for session_call in mock_driver.return_value.session.call_args_list:
+            assert session_call.kwargs["default_access_mode"] == "READ"
+        assert not any("LoadVersion" in c.args[0] for c in session.run.call_args_list)
+        session.execute_write.assert_not_called()
+        mock_driver.return_value.close.assert_called_once()
+
+
+class TestSqliteReplica:
+    def test_build_matches_dry_run(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=4)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path / "data"))
+        replica = SqliteReplica.build(snapshot_dir, str(tmp_path / "replica.sqlite"))
+
+        graph = run_dry_run(snapshot_dir)
+        assert replica.counts() == {
+            "basho": graph["nodes"]["Basho"],
+            "rikishi": graph["nodes"]["Rikishi"],
+            "bout": graph["nodes"]["Bout"],
+            "bout_event": graph["relationships"]["BOUT_EVENT"],
+            "rikishi_in_bout_event": graph["relationships"]["RIKISHI_IN_BOUT_EVENT"],
+        }
+
+        career = replica.career_record(1)
+        assert [record["bouts"] for record in career] == [15, 15]
+        assert all(record["wins"] + record["losses"] == 15 for record in career)
+
+        opponent_id = replica.query(
+            "SELECT opponentId FROM rikishi_bout WHERE rikishiID = 1 LIMIT 1"
+        )[0]["opponentId"]
+        forward = replica.head_to_head(1, opponent_id)
+        backward = replica.head_to_head(opponent_id, 1)
+        assert forward["wins"] == backward["losses"]
+        assert forward["bouts"] == backward["bouts"]
+        replica.close()
+
+    def test_rebuild_replaces_database(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=4)
+        generator.basho_count = 1
+        snapshot_dir = generator.write(str(tmp_path / "data"))
+        db_path = str(tmp_path / "replica.sqlite")
+        SqliteReplica.build(snapshot_dir, db_path).close()
+        replica = SqliteReplica.build(snapshot_dir, db_path)
+        assert replica.counts()["bout"] == 21 * 15
+        assert not os.path.exists(db_path + ".tmp")
+        replica.close()
+
+
+class TestCodec:
+    @staticmethod
+    def banzuke():
+        return {
+            "bashoId": "195803",
+            "division": "Makuuchi",
+            "east": [
+                {
+                    "side": "East",
+                    "rikishiID": 1404,
+                    "shikonaEn": "Chiyonoyama",
+                    "rankValue": 102,
+                    "rank": "Yokozuna 1 East",
+                    "record": [
+                        {
+                            "result": "win",
+                            "opponentShikonaEn": "Annenyama",
+                            "opponentShikonaJp": "",
+                            "opponentID": 1383,
+                            "kimarite": "sotogake",
+                        }
+                    ],
+                    "wins": 1,
+                    "losses": 0,
+                    "absences": 0,
+                }
+            ],
+            "west": [None],
+        }
+
+    def test_decode_banzuke(self):
+        banzuke = decode_banzuke(json.dumps(self.banzuke()).encode())
+        entry = banzuke.east[0]
+        assert not hasattr(entry, "__dict__")
+        assert entry.record[0].kimarite == "sotogake"
+        assert banzuke.west == ()
+        assert banzuke.rikishi_ids() == {1404}
+        assert banzuke.to_dict() == {**self.banzuke(), "west": []}
+
+    def test_decode_rikishi_keeps_only_sent_fields(self):
+        rikishi = decode_rikishi(b'{"id": 1, "shikonaEn": "Hakuho", "updatedAt": 1}')
+        assert rikishi.intai is ABSENT
+        assert rikishi.get("intai") is None
+        # Fields outside the schema still reach the Rikishi node
+        assert rikishi.extra == {"updatedAt": 1}
+        assert rikishi.to_dict() == {"id": 1, "shikonaEn": "Hakuho", "updatedAt": 1}
+
+    def test_decode_rikishi_keeps_explicit_nulls(self):
+        # A null must reach SET r += $attributes to remove a stale property
+        rikishi = decode_rikishi(b'{"id": 1, "intai": null, "heya": null}')
+        assert rikishi.intai is None
+        assert rikishi.shikonaEn is ABSENT
+        assert rikishi != decode_rikishi(b'{"id": 1, "heya": null}')
+        assert rikishi.to_dict() == {"id": 1, "heya": None, "intai": None}
+
+    def test_bout_from_row_fills_missing_values(self):
+        bout = Bout.from_row({"result_rikishi1": "win", "RikishiID_rikishi2": np.nan})
+        assert bout.params() == {
+            "result_rikishi1": "win",
+            "RikishiID_rikishi1": "",
+            "Side_rikishi1": "",
+            "kimarite": "",
+            "Fight_Number": 0,
+            "result_rikishi2": "",
+            "RikishiID_rikishi2": "",
+            "Side_rikishi2": "",
+            "bashoId": "",
+        }
+
+
+class TestCli:
+    def test_help_does_not_import_pipeline_modules(self):
+        script = (
+            "import sys\n"
+            "from code.cli import main\n"
+            "try:\n"
+            "    main(['bout-nodes', '--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print([m for m in ('pandas', 'neo4j', 'requests', 'tqdm') if m in sys.modules])"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=str(get_project_root()),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert "--profile" in result.stdout
+        assert result.stdout.splitlines()[-1] == "[]"
+
+    @patch("code.cli.runpy.run_module")
+    def test_flags_and_data_dir_are_forwarded(self, mock_run_module, monkeypatch):
+        monkeypatch.setattr(sys, "argv", ["sumo-graph"])
+        monkeypatch.setenv("SUMO_DATA_DIR", "unused")
+        assert cli.main(["--data-dir", "/snapshots", "ratings", "--full"]) == 0
+        mock_run_module.assert_called_once_with(
+            "code.analytics.rating_engine", run_name="__main__"
+        )
+        assert sys.argv == ["sumo-graph ratings", "--full"]
+        assert get_data_root() == Path("/snapshots")
+
+    @patch("code.cli.runpy.run_module")
+    def test_own_arguments_are_passed_through(self, mock_run_module, monkeypatch):
+        monkeypatch.setattr(sys, "argv", ["sumo-graph"])
+        cli.main(["rank-history", "--storage", "arrays"])
+        assert sys.argv == ["sumo-graph rank-history", "--storage", "arrays"]
+        with pytest.raises(SystemExit):
+            cli.main(["bout-nodes", "--storage", "arrays"])
+
+    def test_project_root_from_environment(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("SUMO_GRAPH_ROOT", str(tmp_path))
+        monkeypatch.delenv("SUMO_DATA_DIR", raising=False)
+        assert get_project_root() == tmp_path
+        assert get_data_root() == tmp_path / "data"
+
+
+class TestDownloadPlanner:
+    def test_plan_orders_jobs_and_skips_known_empty(self, tmp_path):
+        cache_path = str(tmp_path / "state" / "negative_cache.json")
+        planner = DownloadPlanner(cache_path)
+        jobs = planner.plan(["195803", "202509", "202507"], ("Makuuchi", "Juryo"))
+        assert jobs == [
+            DownloadJob("202509", "Makuuchi"),
+            DownloadJob("202509", "Juryo"),
+            DownloadJob("202507", "Makuuchi"),
+            DownloadJob("195803", "Makuuchi"),
+            DownloadJob("202507", "Juryo"),
+            DownloadJob("195803", "Juryo"),
+        ]
+        planner.record_empty(DownloadJob("195803", "Juryo"))
+        # The current basho may just not be published yet
+        planner.record_empty(DownloadJob("202509", "Juryo"))
+        planner.save()
+
+        jobs = DownloadPlanner(cache_path).plan(
+            ["195803", "202509", "202507"], ("Makuuchi", "Juryo")
+        )
+        assert DownloadJob("195803", "Juryo") not in jobs
+        assert DownloadJob("202509", "Juryo") in jobs
+        assert len(jobs) == 5
+
+    def test_division_jobs_use_division_url_and_directory(self, tmp_path):
+        query = SumoApiQueryBasho(
+            divisions=["Juryo"], cache_path=str(tmp_path / "negative_cache.json")
+        )
+        query.output_dir = str(tmp_path / "basho")
+        query.planner.plan(["202509", "196001"], query.divisions)
+        with patch.object(
+            query, "fetch", return_value="Empty response received"
+        ) as mock_fetch:
+            query.query_endpoint(DownloadJob("196001", "Juryo"))
+        mock_fetch.assert_called_once_with(
+            DownloadJob("196001", "Juryo"),
+            "https://www.sumo-api.com/api/basho/196001/banzuke/Juryo",
+            str(tmp_path / "basho" / "Juryo" / "196001.json"),
+        )
+        assert query.planner.known_empty == {DownloadJob("196001", "Juryo")}
+
+    def test_empty_error_response_is_not_recorded_empty(self, tmp_path):
+        query = SumoApiQueryBasho(
+            divisions=["Juryo"], cache_path=str(tmp_path / "negative_cache.json")
+        )
+        query.output_dir = str(tmp_path / "basho")
+        query.planner.plan(["202509", "196001"], query.divisions)
+        unavailable = requests.Response()
+        unavailable.status_code = 503
+        unavailable._content = b""
+        empty = requests.Response()
+        empty.status_code = 200
+        empty._content = b""
+        query.session = MagicMock()
+
+        query.session.get.return_value = unavailable
+        assert query.query_endpoint(DownloadJob("196001", "Juryo")) is None
+        assert query.planner.known_empty == set()
+        assert query.metrics.counters["request_errors"] == 1
+
+        query.session.get.return_value = empty
+        query.query_endpoint(DownloadJob("196001", "Juryo"))
+        assert query.planner.known_empty == {DownloadJob("196001", "Juryo")}
+
+    def test_basho_files_division_filter(self, tmp_path, monkeypatch):
+        os.makedirs(tmp_path / "Juryo")
+        for path in ("202507.json", "202509.json", "Juryo/202509.json"):
+            (tmp_path / path).write_text("{}")
+        monkeypatch.delenv("SUMO_DIVISIONS", raising=False)
+        assert [basho for basho, _ in basho_files(str(tmp_path))] == [
+            "202507",
+            "202509",
+        ]
+        files = basho_files(str(tmp_path), ["Juryo", "Makuuchi"])
+        assert files[1:] == [
+            ("202509", str(tmp_path / "202509.json")),
+            ("202509", str(tmp_path / "Juryo" / "202509.json")),
+        ]
+        assert len(basho_files(str(tmp_path), ["Juryo", "Makuuchi"], unique=True)) == 2
+        monkeypatch.setenv("SUMO_DIVISIONS", "Juryo")
+        assert basho_files(str(tmp_path)) == [
+            ("202509", str(tmp_path / "Juryo" / "202509.json"))
+        ]
+        with pytest.raises(ValueError):
+            basho_files(str(tmp_path), ["Makuuchi", "Sekiwake"])
+
+
+class TestResponseCache:
+    def test_expiry_and_lru_eviction(self, tmp_path):
+        now = [1000.0]
+        cache = ResponseCache(
+            str(tmp_path / "cache.sqlite"), max_entries=2, clock=lambda: now[0]
+        )
+        cache.put("a", b"1", ttl=10)
+        cache.put("b", b"2", ttl=100)
+        now[0] += 1
+        assert cache.get("a").content == b"1"
+        # b is now the least recently used
+        cache.put("c", b"3", ttl=100)
+        assert cache.get("b") is None
+        now[0] += 20
+        assert cache.get("a") is None
+        assert cache.get("c").content == b"3"
+        assert cache.size == 1
+
+    def test_warm_rerun_skips_the_network(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_HTTP_CACHE", str(tmp_path / "cache.sqlite"))
+        monkeypatch.setenv("SUMO_VALIDATE_SAMPLE", "0")
+        bodies = {
+            "https://www.sumo-api.com/api/rikishi/1?intai=true": b'{"id": 1}',
+            "https://www.sumo-api.com/api/rikishi/2?intai=true": (
+                b'{"error": "INVALID_RIKISHI_ID"}'
+            ),
+            "https://www.sumo-api.com/api/rikishi/3?intai=true": b"",
+        }
+
+        def run():
+            query = SumoApiQueryRikishi()
+            query.output_dir = str(tmp_path / "rikishi")
+            query.iters = [1, 2, 3]
+            query.session = MagicMock()
+            query.session.get.side_effect = lambda url: MagicMock(
+                content=bodies[url], ok=True
+            )
+            with patch.object(query, "setup_logging"):
+                query.run_queries()
+            return query
+
+        cold = run()
+        assert cold.metrics.counters["requests"] == 3
+        warm = run()
+        assert "requests" not in warm.metrics.counters
+        assert warm.metrics.counters["cache_hits"] == 3
+        assert os.listdir(tmp_path / "rikishi") == ["1.json"]
+
+    def test_ttl_by_endpoint(self, tmp_path):
+        rikishi = SumoApiQueryRikishi()
+        assert rikishi.cache_ttl(1, {"id": 1, "intai": "2020-01-01"}) == COMPLETED_TTL
+        assert rikishi.cache_ttl(1, {"id": 1}) == DEFAULT_TTL
+        assert rikishi.cache_ttl(1, None) == NEGATIVE_TTL
+        basho = SumoApiQueryBasho(cache_path=str(tmp_path / "negative_cache.json"))
+        basho.planner.plan(["202507", "202509"], ["Makuuchi"])
+        assert basho.cache_ttl(DownloadJob("202507", "Makuuchi"), None) == COMPLETED_TTL
+        assert basho.cache_ttl(DownloadJob("202509", "Makuuchi"), {}) == LIVE_TTL
+
+
+class TestSnapshotStore:
+    @staticmethod
+    def write_snapshot(snapshot_dir):
+        os.makedirs(snapshot_dir / "basho" / "Juryo")
+        os.makedirs(snapshot_dir / "rikishi")
+        for path, document in (
+            ("basho/202507.json", {"bashoId": "202507", "east": [], "west": []}),
+            ("basho/202509.json", {"bashoId": "202509", "east": [], "west": []}),
+            ("basho/Juryo/202509.json", {"bashoId": "202509", "east": []}),
+            ("rikishi/1.json", {"id": 1, "shikonaEn": "One"}),
+        ):
+            # Pretty printed, so packing has to re-encode it onto one line
+            (snapshot_dir / path).write_text(json.dumps(document, indent=2))
+
+    def test_pack_and_unpack_round_trip(self, tmp_path):
+        self.write_snapshot(tmp_path)
+        basho_dir = str(tmp_path / "basho")
+        assert pack(basho_dir, remove_files=True) == 3
+        assert not os.path.exists(tmp_path / "basho" / "202509.json")
+        reader = open_documents(basho_dir)
+        assert isinstance(reader, ShardReader)
+        assert reader.keys() == ["202507", "202509", "Juryo/202509"]
+        assert json.loads(reader.get("Juryo/202509")) == {
+            "bashoId": "202509",
+            "east": [],
+        }
+        assert [key for key, _ in reader] == reader.keys()
+
+        assert unpack(basho_dir, remove_shards=True) == 3
+        files = open_documents(basho_dir)
+        assert files.keys() == ["202507", "202509", "Juryo/202509"]
+        assert json.loads(files.get("202507"))["bashoId"] == "202507"
+
+    def test_builders_read_packed_snapshot(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        monkeypatch.setenv("SUMO_DIVISIONS", "Makuuchi,Juryo")
+        self.write_snapshot(tmp_path)
+        loader = AuraDBLoader()
+        basho_dir = str(tmp_path / "basho")
+        from_files = list(loader.banzuke_documents(basho_dir, unique=True))
+        pack(basho_dir)
+        pack(str(tmp_path / "rikishi"))
+        from_shards = list(loader.banzuke_documents(basho_dir, unique=True))
+        assert [(basho, banzuke) for basho, _, banzuke in from_shards] == [
+            (basho, banzuke) for basho, _, banzuke in from_files
+        ]
+        assert [
+            (name, rikishi.shikonaEn)
+            for name, rikishi in loader.rikishi_documents(str(tmp_path / "rikishi"))
+        ] == [("1.json", "One")]
+
+    def test_downloader_writes_shards(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_SNAPSHOT_FORMAT", "shards")
+        query = SumoApiQuery(iters=["202507", "202509"])
+        query.output_dir = str(tmp_path / "basho")
+        query.session = MagicMock()
+        query.session.get.side_effect = lambda url: MagicMock(
+            content=json.dumps({"bashoId": url.split("/")[-3]}).encode(), ok=True
+        )
+        with patch.object(query, "setup_logging"):
+            query.run_queries()
+        assert os.listdir(query.output_dir) == []
+        reader = ShardReader(query.output_dir)
+        assert json.loads(reader.get("202509")) == {"bashoId": "202509"}
+        assert len(reader) == 2
+
+
+class TestIngestValidation:
+    @staticmethod
+    def rikishi():
+        return {
+            "id": 1,
+            "sumodbId": 2,
+            "shikonaEn": "One",
+            "heya": "Isegahama",
+            "birthDate": "2000-01-01T00:00:00Z",
+            "shusshin": "Tokyo",
+            "height": 180.5,
+            "weight": 150,
+            "debut": "201801",
+        }
+
+    def test_validate_matches_jsonschema(self):
+        with open(schema_path("basho")) as f:
+            basho_schema = json.load(f)
+        banzuke = {
+            "bashoId": "202509",
+            "division": "Makuuchi",
+            "east": [
+                {
+                    "side": "East",
+                    "rikishiID": "8850",
+                    "shikonaEn": "Onosato",
+                    "rankValue": 101,
+                    "rank": "Yokozuna 1 East",
+                    "wins": 11,
+                    "losses": 4,
+                    "absences": 0,
+                }
+            ],
+            "west": None,
+        }
+        errors = validate("basho", banzuke)
+        assert errors == ["$.east[0].rikishiID: '8850' is not of type integer"]
+        with pytest.raises(jsonschema.ValidationError):
+            jsonschema.validate(banzuke, basho_schema)
+        banzuke["east"][0]["rikishiID"] = 8850
+        assert validate("basho", banzuke) == []
+        jsonschema.validate(banzuke, basho_schema)
+        assert validate("rikishi", self.rikishi()) == []
+        assert validate("rikishi", {**self.rikishi(), "height": True}) == [
+            "$.height: True is not of type number"
+        ]
+        with pytest.raises(ValueError):
+            compile_schema({"type": "string", "pattern": "^[0-9]+$"})
+
+    def test_bad_payloads_are_quarantined(self, tmp_path):
+        bodies = {
+            1: json.dumps(self.rikishi()).encode(),
+            2: json.dumps({"id": 2, "shikonaEn": "Two"}).encode(),
+        }
+        query = SumoApiQueryRikishi()
+        query.output_dir = str(tmp_path / "rikishi")
+        query.iters = [1, 2]
+        query.session = MagicMock()
+        query.session.get.side_effect = lambda url: MagicMock(
+            content=bodies[int(url.split("/")[-1].split("?")[0])], ok=True
+        )
+        with patch.object(query, "setup_logging"):
+            query.run_queries()
+        assert os.listdir(tmp_path / "rikishi") == ["1.json"]
+        quarantine_dir = tmp_path / "quarantine" / "rikishi"
+        assert sorted(os.listdir(quarantine_dir)) == ["2.errors.json", "2.json"]
+        assert (
+            "'sumodbId' is a required property"
+            in (json.loads((quarantine_dir / "2.errors.json").read_text())[0])
+        )
+        assert query.metrics.counters["documents_validated"] == 2
+        assert query.metrics.histograms["validation_seconds"].count == 2
+
+    def test_sampling(self, monkeypatch):
+        monkeypatch.setenv("SUMO_VALIDATE_SAMPLE", "0")
+        assert SumoApiQueryRikishi().ingest_validator() is None
+        monkeypatch.setenv("SUMO_VALIDATE_SAMPLE", "0.25")
+        query = SumoApiQueryRikishi()
+        for _ in range(200):
+            query.ingest_validator().check("1", self.rikishi(), b"")
+        validated = query.metrics.counters["documents_validated"]
+        assert validated + query.metrics.counters["validation_skipped"] == 200
+        assert 20 < validated < 80
+
+
+# benchmark tooling tests
+class TestBenchmarks:
+    def test_synthetic_data_matches_schemas(self, tmp_path):
+        with open(schema_path("basho")) as f:
+            basho_schema = json.load(f)
+        with open(schema_path("rikishi")) as f:
+            rikishi_schema = json.load(f)
+
+        generator = SyntheticSumoData(scale=1, seed=1)
+        generator.basho_count = 3
+        snapshot_dir = generator.write(str(tmp_path))
+
+        basho_files = sorted(os.listdir(os.path.join(snapshot_dir, "basho")))
+        assert basho_files == ["195801.json", "195803.json", "195805.json"]
+        for name in basho_files:
+            with open(os.path.join(snapshot_dir, "basho", name)) as file:
+                data = json.load(file)
+            jsonschema.validate(data, basho_schema)
+            # Every generated bout pairs up on both sides
+            matched, unmatched = AuraDBLoaderBoutNodes.extract_bouts(
+                data, name.split(".")[0]
+            )
+            assert len(matched) == 21 * 15
+            assert len(unmatched) == 0
+        for name in os.listdir(os.path.join(snapshot_dir, "rikishi")):
+            with open(os.path.join(snapshot_dir, "rikishi", name)) as file:
+                jsonschema.validate(json.load(file), rikishi_schema)
+
+    def test_api_stub_serves_snapshot(self, tmp_path):
+        generator = SyntheticSumoData(scale=1, seed=1)
+        generator.basho_count = 1
+        snapshot_dir = generator.write(str(tmp_path))
+        with SumoApiStub(snapshot_dir) as stub:
+            basho = requests.get(stub.banzuke_url.format("195801")).json()
+            rikishi = requests.get(stub.rikishi_url.format(1)).json()
+            invalid = requests.get(stub.rikishi_url.format(99999)).json()
+            missing = requests.get(stub.banzuke_url.format("190001"))
+        assert basho["bashoId"] == "195801"
+        assert rikishi["id"] == 1
+        assert invalid == {"error": "INVALID_RIKISHI_ID"}
+        assert missing.content == b""
+
+    def test_api_stub_error_rate(self, tmp_path):
+        with SumoApiStub(str(tmp_path), error_rate=1.0) as stub:
+            response = requests.get(stub.banzuke_url.format("195801"))
+        assert response.status_code == 500
+
+    def test_compare_results(self):
+        baseline = {
+            "scenarios": {
+                "download": {"seconds": 10},
+                "bout_extraction": {"seconds": 10},
+            }
+        }
+        current = {
+            "scenarios": {
+                "download": {"seconds": 12},
+                "bout_extraction": {"seconds": 5},
+                "graph_writes": {"skipped": "no neo4j"},
+            }
+        }
+        changes, regressions = compare_results(current, baseline, threshold=0.1)
+        assert changes == {"download": 0.2, "bout_extraction": -0.5}
+        assert regressions == ["download"]
+
+    def test_rank_history_restores_the_environment(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("SUMO_GRAPH_SINK", raising=False)
+        generator = SyntheticSumoData(scale=1, seed=3)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path))
+        results = run_rank_history(snapshot_dir, "memory", None, queries=5)
+        assert set(results) == set(RANK_STORAGE)
+        assert results["arrays"]["query_latency"]["queries"] == 5
+        assert "SUMO_GRAPH_SINK" not in os.environ
+
+
+class TestWorkQueue:
+    class Clock:
+        def __init__(self):
+            self.now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    def test_expired_lease_is_reclaimed(self, tmp_path):
+        clock = self.Clock()
+        queue = WorkQueue(str(tmp_path / "queue.sqlite"), clock=clock)
+        assert queue.enqueue("stage", [{"id": 1}, {"id": 2}]) == 2
+        assert queue.enqueue("stage", [{"id": 1}]) == 0
+
+        first = queue.claim("stage", "dead", limit=2, lease_seconds=60)
+        assert [task.payload for task in first] == [{"id": 1}, {"id": 2}]
+        assert queue.claim("stage", "alive") == []
+
+        # The first worker died; its leases run out and the tasks go round again
+        clock.now += 61
+        second = queue.claim("stage", "alive", limit=2)
+        assert [task.attempts for task in second] == [2, 2]
+        assert not queue.complete(first[0], "dead")
+        assert queue.complete(second[0], "alive")
+        assert queue.complete(second[1], "alive")
+        assert queue.stats() == {"stage": {"done": 2}}
+        assert queue.remaining("stage") == 0
+        queue.close()
+
+    def test_failing_task_is_parked_after_max_attempts(self, tmp_path):
+        queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+        queue.enqueue("stage", ["bad"])
+        for _ in range(2):
+            (task,) = queue.claim("stage", "worker")
+            assert queue.fail(task, "worker", "boom")
+        assert queue.claim("stage", "worker") == []
+        assert queue.failures("stage") == [('"bad"', 2, "boom")]
+
+        queue.enqueue("stage", ["bad"], reset=True)
+        assert queue.stats() == {"stage": {"pending": 1}}
+        queue.close()
+
+    def test_worker_drains_queue_after_a_crash(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        monkeypatch.setenv("SUMO_METRICS_DIR", str(tmp_path / "metrics"))
+        generator = SyntheticSumoData(scale=1, seed=4)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path / "data"))
+        monkeypatch.setenv("SUMO_DATA_DIR", str(tmp_path / "data"))
+
+        queue_path = str(tmp_path / "queue.sqlite")
+        queue = WorkQueue(queue_path)
+        assert queue.enqueue("bout-nodes", BoutNodesStage.tasks()) == 2
+        # A worker that claimed a basho and died before finishing it
+        queue.claim("bout-nodes", "dead", lease_seconds=0)
+        queue.close()
+
+        sink = InMemoryGraphSink()
+
+        def bout_nodes_stage():
+            runner = BoutNodesStage()
+            runner.loader.sink = sink
+            return runner
+
+        completed, failed = run_worker(
+            queue_path, "bout-nodes", stages={"bout-nodes": bout_nodes_stage}
+        )
+        assert (completed, failed) == (2, 0)
+        expected = run_dry_run(snapshot_dir)["nodes"]["Bout"]
+        assert sink.counts()["nodes"]["Bout"] == expected
+
+    def test_worker_renews_the_lease_of_a_slow_task(self, tmp_path):
+        queue_path = str(tmp_path / "queue.sqlite")
+        queue = WorkQueue(queue_path)
+        queue.enqueue("slow", ["task"])
+        queue.close()
+        claimed_by_others = []
+
+        class SlowStage:
+            def execute(self, payload):
+                # Outlives the lease several times over
+                time.sleep(1.0)
+                other = WorkQueue(queue_path)
+                claimed_by_others.extend(
+                    other.claim("slow", "other", lease_seconds=0.3)
+                )
+                other.close()
+
+            def close(self):
+                pass
+
+        completed, failed = run_worker(
+            queue_path, "slow", lease_seconds=0.3, stages={"slow": SlowStage}
+        )
+        assert (completed, failed) == (1, 0)
+        assert claimed_by_others == []
+
+
+class TestWriteSpool:
+    class Unavailable(Exception):
+        pass
+
+    def test_spooled_load_drains_to_the_same_graph(self, tmp_path, monkeypatch):
+        generator = SyntheticSumoData(scale=1, seed=4)
+        generator.basho_count = 2
+        snapshot_dir = generator.write(str(tmp_path / "data"))
+        monkeypatch.setenv("SUMO_METRICS_DIR", str(tmp_path / "metrics"))
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "spool")
+        monkeypatch.setenv("SUMO_WRITE_SPOOL", str(tmp_path / "spool"))
+        loader = AuraDBLoaderBoutNodes()
+        loader.load_jsons_from_folder_and_create_bout_nodes(
+            os.path.join(snapshot_dir, "basho")
+        )
+        loader.close()
+
+        sink = InMemoryGraphSink()
+        drainer = SpoolDrainer(
+            str(tmp_path / "spool"), sink_applier(sink), batch_size=100
+        )
+        replayed = drainer.drain()
+        assert replayed == loader.metrics.counters["spooled_writes"]
+        expected = run_dry_run(snapshot_dir)["nodes"]["Bout"]
+        assert sink.counts()["nodes"]["Bout"] == expected
+        # Replayed segments are truncated away
+        assert os.listdir(tmp_path / "spool") == ["ack.json"]
+        assert drainer.drain() == 0
+
+    def test_index_writes_drain_outside_data_transactions(self, tmp_path):
+        writer = SpoolWriter(str(tmp_path))
+        writer.append("MERGE (b:Basho {bashoId: $id})", {"id": "202501"}, "merge")
+        writer.append(
+            "CREATE INDEX basho_id IF NOT EXISTS FOR (b:Basho) ON (b.bashoId)",
+            {},
+            CREATE_INDEX,
+        )
+        writer.append("MERGE (b:Basho {bashoId: $id})", {"id": "202503"}, "merge")
+        writer.close()
+
+        transactions = []
+
+        class Transaction:
+            def __init__(self):
+                self.queries = []
+
+            def run(self, query, **params):
+                self.queries.append(query)
+                kinds = {q.startswith("CREATE INDEX") for q in self.queries}
+                if len(kinds) > 1:
+                    # Neo4j's ForbiddenDueToTransactionType
+                    raise ValueError("schema and data writes in one transaction")
+                return MagicMock()
+
+        class Session:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def execute_write(self, work, *args):
+                tx = Transaction()
+                work(tx, *args)
+                transactions.append(tx.queries)
+
+            def run(self, query, **params):
+                return Transaction().run(query, **params)
+
+        driver = MagicMock()
+        driver.session.side_effect = Session
+        drainer = SpoolDrainer(str(tmp_path), neo4j_applier(driver), batch_size=10)
+        assert drainer.drain() == 3
+        assert [len(queries) for queries in transactions] == [1, 1]
+
+    def test_outage_is_retried_and_restart_resumes(self, tmp_path):
+        writer = SpoolWriter(str(tmp_path))
+        for number in range(10):
+            writer.append("MERGE (n {id: $id})", {"id": number}, "merge")
+        writer.close()
+
+        applied = []
+        failures = [self.Unavailable("paused"), self.Unavailable("paused")]
+
+        def apply_batch(records):
+            if failures:
+                raise failures.pop(0)
+            if len(applied) == 4:
+                raise ValueError("bad write")
+            applied.extend(params["id"] for _, params, _ in records)
+
+        sleeps = []
+        drainer = SpoolDrainer(
+            str(tmp_path),
+            apply_batch,
+            batch_size=4,
+            retry_on=(self.Unavailable,),
+            sleep=sleeps.append,
+        )
+        with pytest.raises(ValueError):
+            drainer.drain()
+        assert sleeps == [1, 2]
+        assert applied == [0, 1, 2, 3]
+
+        # Restarted: only what wasn't acknowledged is replayed
+        drainer.apply_batch = lambda records: applied.extend(
+            params["id"] for _, params, _ in records
+        )
+        assert drainer.drain() == 6
+        assert applied == list(range(10))
+
+    def test_open_segment_is_followed(self, tmp_path):
+        writer = SpoolWriter(str(tmp_path))
+        writer.append("CREATE (n {id: $id})", {"id": 1})
+        applied = []
+        drainer = SpoolDrainer(
+            str(tmp_path),
+            lambda records: applied.extend(records),
+        )
+        assert drainer.drain() == 1
+        # Still being written, so it stays until sealed
+        assert len(drainer.segments()) == 1
+        writer.append("CREATE (n {id: $id})", {"id": 2})
+        writer.close()
+        assert drainer.drain() == 1
+        assert [params["id"] for _, params, _ in applied] == [1, 2]
+        assert drainer.segments() == []
+
+
+class TestLogConfig:
+    def test_exceptions_are_written_as_their_own_field(self, tmp_path):
+        log_file = str(tmp_path / "stage.log")
+        configure_logging(log_file)
+        try:
+            raise ValueError("bad banzuke")
+        except ValueError:
+            stage_logger("Stage").exception("Failed on %s", "202509")
+        finally:
+            stop_logging()
+
+        with open(log_file, encoding="utf-8") as file:
+            (entry,) = [json.loads(line) for line in file]
+        assert entry["message"] == "Failed on 202509"
+        assert datetime.fromisoformat(entry["time"]).utcoffset() == timedelta(0)
+        assert entry["stage"] == "Stage"
+        assert entry["exception"].startswith("Traceback")
+        assert "ValueError: bad banzuke" in entry["exception"]
+
+    def test_parse_levels(self):
+        assert parse_levels("warning, Stage=debug") == ("WARNING", {"Stage": "DEBUG"})
+        with pytest.raises(ValueError):
+            parse_levels("Stage=LOUD")
+
+
+class TestProgress:
+    def test_progress_events_are_rate_limited(self):
+        clock = MagicMock(return_value=0.0)
+        logger = MagicMock()
+        progress = Progress(logger, "bout nodes", total=100, interval=5, clock=clock)
+        for second in range(10):
+            clock.return_value = float(second)
+            progress.update(basho=str(second))
+        progress.skip("missing data", basho="x")
+        clock.return_value = 10.0
+        progress.close()
+
+        events = [call.kwargs["extra"] for call in logger.info.call_args_list]
+        assert [event["event"] for event in events] == ["progress", "finished"]
+        assert events[0]["done"] == 6
+        assert events[0]["basho"] == "5"
+        assert events[1]["done"] == 10
+        assert events[1]["skipped"] == 1
+        assert events[1]["per_second"] == 1.0
+        logger.debug.assert_called_once()
+
+
+class TestLiveBashoPoller:
+    @staticmethod
+    def entry(side, rikishi_id, bouts):
+        return {
+            "side": side,
+            "rikishiID": rikishi_id,
+            "shikonaEn": f"R{rikishi_id}",
+            "rankValue": rikishi_id,
+            "rank": f"Maegashira {rikishi_id}",
+            "record": [
+                {
+                    "result": result,
+                    "opponentShikonaEn": f"R{opponent}",
+                    "opponentShikonaJp": "",
+                    "opponentID": opponent,
+                    "kimarite": kimarite,
+                }
+                for result, opponent, kimarite in bouts
+            ],
+            "wins": 0,
+            "losses": 0,
+            "absences": 0,
+        }
+
+    def banzuke(self, days):
+        # Day 1: 1 beats 3, 4 beats 2. Day 2: 1 beats 4, 3 beats 2
+        schedule = {
+            1: [("win", 3, "oshidashi"), ("win", 4, "yorikiri")],
+            2: [("loss", 4, "yorikiri"), ("loss", 3, "hatakikomi")],
+            3: [("loss", 1, "oshidashi"), ("win", 2, "hatakikomi")],
+            4: [("win", 2, "yorikiri"), ("loss", 1, "yorikiri")],
+        }
+
+        def record(rikishi_id):
+            # Bouts not fought yet are listed without a result
+            return [
+                bout if day < days else ("", bout[1], "")
+                for day, bout in enumerate(schedule[rikishi_id])
+            ]
+
+        return {
+            "bashoId": "202511",
+            "division": "Makuuchi",
+            "east": [
+                self.entry("East", 1, record(1)),
+                self.entry("East", 2, record(2)),
+            ],
+            "west": [
+                self.entry("West", 3, record(3)),
+                self.entry("West", 4, record(4)),
+            ],
+        }
+
+    def test_polls_write_only_new_bouts(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        monkeypatch.setenv("SUMO_METRICS_DIR", str(tmp_path / "metrics"))
+        loader = AuraDBLoaderLiveBouts()
+        poller = LiveBashoPoller(
+            basho_id="202511", loader=loader, state_path=str(tmp_path / "live.json")
+        )
+        responses = [
+            MagicMock(
+                status_code=200,
+                ok=True,
+                content=json.dumps(self.banzuke(1)).encode(),
+                headers={"ETag": '"day1"'},
+            ),
+            MagicMock(status_code=304, ok=False, content=b"", headers={}),
+            MagicMock(
+                status_code=200,
+                ok=True,
+                content=json.dumps(self.banzuke(2)).encode(),
+                headers={
+                    "ETag": '"day2"',
+                    "Last-Modified": "Sat, 15 Nov 2025 08:00:00 GMT",
+                },
+            ),
+        ]
+        poller.session = MagicMock()
+        poller.session.get.side_effect = responses
+
+        assert [poller.poll() for _ in range(3)] == [2, 0, 2]
+        headers = [call.kwargs["headers"] for call in poller.session.get.call_args_list]
+        assert headers[0] == {}
+        assert headers[1] == {"If-None-Match": '"day1"'}
+        assert poller.metrics.counters["not_modified"] == 1
+        assert poller.metrics.histograms["update_to_graph_seconds"].count == 1
+
+        # The same bouts as pairing the final banzuke in one go
+        matched, _ = AuraDBLoaderBoutNodes.extract_bouts(self.banzuke(2), "202511")
+        expected = {
+            tuple(Bout.from_row(row).params().values())
+            for row in matched.to_dict("records")
+        }
+        assert set(loader.sink.bout_index) == expected
+        assert loader.sink.counts()["relationships"]["BOUT_EVENT"] == 4
+
+        # Restarted, it knows what has been written already
+        restarted = LiveBashoPoller(
+            basho_id="202511", loader=loader, state_path=str(tmp_path / "live.json")
+        )
+        restarted.session = MagicMock()
+        restarted.session.get.return_value = responses[2]
+        assert restarted.poll() == 0
+
+    def test_bout_waits_for_the_opponents_side(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        monkeypatch.setenv("SUMO_METRICS_DIR", str(tmp_path / "metrics"))
+        loader = AuraDBLoaderLiveBouts()
+        poller = LiveBashoPoller(
+            basho_id="202511", loader=loader, state_path=str(tmp_path / "live.json")
+        )
+        # Rikishi 1's win over 3 is published before 3's side of it
+        early = self.banzuke(1)
+        for entry in early["east"] + early["west"]:
+            if entry["rikishiID"] == 3:
+                entry["record"][0].update(result="", kimarite="")
+        poller.session = MagicMock()
+        poller.session.get.side_effect = [
+            MagicMock(
+                status_code=200,
+                ok=True,
+                content=json.dumps(banzuke).encode(),
+                headers={},
+            )
+            for banzuke in (early, self.banzuke(1))
+        ]
+
+        assert poller.poll() == 1
+        assert poller.poll() == 1
+        # Both bouts are written once, with both sides filled in
+        assert len(loader.sink.bout_nodes) == 2
+        for bout in loader.sink.bout_nodes:
+            params = dict(zip(BOUT_KEY_PARAMS, bout))
+            assert params["RikishiID_rikishi1"] != ""
+            assert params["RikishiID_rikishi2"] != ""
+
+    def test_failed_write_is_retried_on_the_next_poll(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SUMO_GRAPH_SINK", "memory")
+        monkeypatch.setenv("SUMO_METRICS_DIR", str(tmp_path / "metrics"))
+        loader = AuraDBLoaderLiveBouts()
+        write_live_bouts = loader.write_live_bouts
+        failures = [ConnectionError("graph down")]
+
+        def flaky_write(basho_id, rows):
+            if failures:
+                raise failures.pop()
+            write_live_bouts(basho_id, rows)
+
+        loader.write_live_bouts = flaky_write
+        poller = LiveBashoPoller(
+            basho_id="202511", loader=loader, state_path=str(tmp_path / "live.json")
+        )
+        poller.session = MagicMock()
+        poller.session.get.return_value = MagicMock(
+            status_code=200,
+            ok=True,
+            content=json.dumps(self.banzuke(1)).encode(),
+            headers={"ETag": '"day1"'},
+        )
+
+        assert poller.run(interval=0, max_polls=2, sleep=lambda _: None) == 2
+        assert poller.metrics.counters["write_errors"] == 1
+        assert poller.metrics.counters["new_bouts"] == 2
+        assert loader.sink.counts()["relationships"]["BOUT_EVENT"] == 2
+        # The failed poll sent no conditional headers, as nothing was saved
+        headers = [call.kwargs["headers"] for call in poller.session.get.call_args_list]
+        assert headers == [{}, {}]